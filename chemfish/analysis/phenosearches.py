@@ -1,14 +1,21 @@
 from __future__ import annotations
 
+import heapq
+import shutil
+import threading
+import warnings
+
+import joblib
 from scipy.spatial import distance
 
 from chemfish.core.core_imports import *
+from chemfish.calc.feature_interpolation import FeatureInterpolation
 from chemfish.model.app_frames import *
 from chemfish.namers.compound_namers import *
 from chemfish.model.features import *
 from chemfish.model.stim_frames import *
 from chemfish.namers.well_namers import *
-from chemfish.construction.wf_builders import *
+from chemfish.factories.well_frame_builders import *
 
 
 class HitFrame(TypedDf):
@@ -45,6 +52,8 @@ class HitSearch:
     The scores should always be such that more positive is better.
     Alternatively, you can call HitSearch.iterate() to stream over the results, which are pd.Series containing the columns for HitFrame.
     Whether called with search(), will save every n results as a DataFrame .csv to disk (1000 by default).
+    For large searches, call HitSearch.search_batched() instead, which fetches and decodes the features in pages of wells
+    and scores each page as a 2D array; this requires scoring functions from HitScores (or anything else with a ``batch`` method).
 
     Example:
         Like this::
@@ -76,6 +85,11 @@ class HitSearch:
         self._limit = None
         self._min_scores = {}
         self.save_every = 1000
+        self.page_size = 100
+        self._top_k = None
+        self._n_jobs = 1
+        self._prefer = "processes"
+        self._index = None
 
     def set_save_every(self, n: int) -> HitSearch:
         """
@@ -90,6 +104,72 @@ class HitSearch:
         self.save_every = n
         return self
 
+    def set_page_size(self, n: int) -> HitSearch:
+        """
+        Sets the number of wells fetched, decoded, and scored together by ``search_batched``.
+        Each page is held in memory as a float64 array of wells × features. The default is 100.
+
+        Args:
+            n: int:
+
+        Returns:
+
+        """
+        if n < 1:
+            raise OutOfRangeError(f"Page size {n} < 1")
+        self.page_size = n
+        return self
+
+    def set_top_k(self, k: Optional[int]) -> HitSearch:
+        """
+        Makes ``search_batched`` keep only the ``k`` wells with the highest primary scores,
+        in a heap, rather than every well that passes the minimum scores.
+
+        Args:
+            k: The number of hits to keep, or None to keep all of them
+
+        Returns:
+
+        """
+        if k is not None and k < 1:
+            raise OutOfRangeError(f"Top k {k} < 1")
+        self._top_k = k
+        return self
+
+    def set_n_jobs(self, n_jobs: Optional[int], prefer: str = "processes") -> HitSearch:
+        """
+        Sets the number of workers that decode and score pages in ``search_batched``.
+        Fetching from Valar always happens in the calling process.
+
+        Args:
+            n_jobs: The number of workers; 1 to score in the calling process, or -1 for all cores
+            prefer: Passed to ``joblib.Parallel``; "processes" or "threads"
+
+        Returns:
+
+        """
+        self._n_jobs = n_jobs
+        self._prefer = prefer
+        return self
+
+    def set_index(self, index: Optional[PhenosearchIndex]) -> HitSearch:
+        """
+        Makes ``search_batched`` read features from a PhenosearchIndex rather than from Valar.
+        Also sets the feature to that of the index.
+        Note that the index may downsample or normalize the features;
+        pass the query through ``PhenosearchIndex.transform`` before creating the scoring functions.
+
+        Args:
+            index: A PhenosearchIndex, or None to search Valar
+
+        Returns:
+
+        """
+        self._index = index
+        if index is not None:
+            self.feature = index.feature
+        return self
+
     def set_feature(self, feature: Union[FeatureType, str]) -> HitSearch:
         """
         Sets the feature.
@@ -216,6 +296,141 @@ class HitSearch:
         )
         return self._save_hits(results, path)
 
+    def search_batched(self, path: Optional[str] = None) -> HitFrame:
+        """
+        Performs the search over the whole query, scoring pages of wells as 2D arrays.
+        Gives the same scores as ``search``, but every scoring function must have a vectorized ``batch`` method,
+        as those from ``HitScores`` do.
+        The blobs for each page are fetched in one query; decoding, interpolating, and scoring are done by ``n_jobs`` workers.
+        If ``set_index`` was called, the features are read from the PhenosearchIndex instead, and Valar is not queried
+        (except once to find the matching runs if ``where`` was called).
+        If ``set_top_k`` was called, only the best ``k`` hits are kept, and they are sorted by decreasing score.
+        Otherwise, the hits are in the order of the query.
+
+        Args:
+            path: The file path; should end with '.csv'; if None will not save
+
+        Returns:
+            A HitFrame, a subclass of DataFrame
+
+        """
+        if self.primary_score_fn is None:
+            raise OpStateError("Primary scoring function is not set")
+        scores = {"score": self.primary_score_fn, **self.secondary_score_fns}
+        for name, fn in scores.items():
+            if not callable(getattr(fn, "batch", None)):
+                raise UnsupportedOpError(f"Score {name} ({fn}) has no batch method")
+        t0 = time.monotonic()
+        hits = _HitHeap(self._top_k)
+        n_saved = 0
+        if self._index is None:
+            jobs = (
+                joblib.delayed(_score_page)(
+                    self.feature, rows, blobs, windows, scores, self._min_scores, self._top_k
+                )
+                for rows, blobs, windows in self._pages()
+            )
+        else:
+            jobs = (
+                joblib.delayed(_score_block)(
+                    rows, block, lengths, scores, self._min_scores, self._top_k
+                )
+                for rows, block, lengths in self._index_pages()
+            )
+        # dispatch a few pages per worker at a time so that pages are merged (and saved) as we go
+        n_per_round = 2 * max(1, joblib.effective_n_jobs(self._n_jobs))
+        with joblib.Parallel(n_jobs=self._n_jobs, prefer=self._prefer) as parallel:
+            while True:
+                chunk = list(itertools.islice(jobs, n_per_round))
+                if len(chunk) == 0:
+                    break
+                for page in parallel(chunk):
+                    hits.extend(page)
+                if hits.n_hits - n_saved >= self.save_every:
+                    self._save_hits(hits.results(), path)
+                    n_saved = hits.n_hits
+        logger.info(
+            "Finished in {} with {} hits".format(
+                Tools.delta_time_to_str(time.monotonic() - t0), len(hits)
+            )
+        )
+        return self._save_hits(hits.results(), path)
+
+    def _pages(self) -> Iterator[Tup[Sequence[Tup[int, int, int, str]], Sequence[bytes], Mapping]]:
+        """
+        Fetches the blobs of ``page_size`` wells at a time.
+        For interpolated features, also gets the battery window of each new run (see ``FeatureInterpolation.battery_window``).
+
+        Returns:
+            An iterator of (rows of (well ID, well index, run ID, run name), blobs, dict of run IDs to windows) tuples
+
+        """
+        wells = list(self._build_well_query().tuples())
+        logger.info(f"Searching {len(wells)} wells in pages of {self.page_size}")
+        interpolation = FeatureInterpolation(self.feature.valar_feature)
+        timestamps = TimestampCache()
+        windows = {}
+        for i in range(0, len(wells), self.page_size):
+            page = wells[i : i + self.page_size]
+            blobs = dict(
+                WellFeatures.select(WellFeatures.well_id, WellFeatures.floats)
+                .where(WellFeatures.type_id == self.feature.valar_feature.id)
+                .where(WellFeatures.well_id << [row[0] for row in page])
+                .tuples()
+            )
+            rows = [row for row in page if row[0] in blobs]
+            page_windows = {}
+            if self.feature.is_interpolated:
+                for run_id in {row[2] for row in rows}:
+                    if run_id not in windows:
+                        run = Runs.fetch(run_id)
+                        windows[run_id] = interpolation.battery_window(
+                            timestamps.camera_millis(run), timestamps.stimulus_millis(run), run
+                        )
+                        timestamps.clear()
+                    page_windows[run_id] = windows[run_id]
+            yield rows, [blobs[row[0]] for row in rows], page_windows
+
+    def _index_pages(self) -> Iterator[Tup[Sequence[Tup[int, int, int, str]], np.array, np.array]]:
+        """
+        Reads pages of features from the PhenosearchIndex, restricted to runs created before ``as_of``
+        and, if there are WHERE expressions, to the runs they match.
+
+        Returns:
+            An iterator of (rows of (well ID, well index, run ID, run name), features, lengths) tuples
+
+        """
+        runs = self._index.runs_before(self.as_of)
+        if len(self.wheres) > 0:
+            query = WellFrameQuery().build([Runs.id])
+            for where in self.wheres:
+                query = query.where(where)
+            matching = {run_id for (run_id,) in query.distinct().tuples()}
+            runs = [r for r in runs if r in matching]
+        logger.info(f"Searching {len(runs)} indexed runs in pages of {self.page_size}")
+        n_left = self._limit
+        for rows, block, lengths in self._index.pages(runs, self.page_size):
+            if n_left is not None:
+                rows, block, lengths = rows[:n_left], block[:n_left], lengths[:n_left]
+                n_left -= len(rows)
+            if len(rows) > 0:
+                yield rows, block, lengths
+            if n_left == 0:
+                break
+
+    def _build_well_query(self) -> peewee.Query:
+        """
+        Selects the well ID, well index, run ID, and run name of each well searched, in the standard order.
+        """
+        fields = [Wells.id, Wells.well_index, Runs.id, Runs.name]
+        query = WellFrameQuery().build(fields).where(Runs.created < self.as_of)
+        for where in self.wheres:
+            query = query.where(where)
+        query = query.distinct().order_by(*WellFrameQuery.sort_order())
+        if self._limit is not None:
+            query = query.limit(self._limit)
+        return query
+
     def _save_hits(self, results, path: Optional[str]) -> HitFrame:
         """
 
@@ -378,6 +593,7 @@ class TruncatingScorer:
     Wraps a similarity score to a query trace into an HitSearch scoring function that truncates to min(query length, target length),
     and warning if the lengths differ by more than 3.
     :return: A function mapping a feature array and a well row into a float where higher is better (more similar).
+    If a vectorized similarity is also given, ``batch`` scores many targets at once for ``HitSearch.search_batched``.
 
     Args:
 
@@ -385,16 +601,24 @@ class TruncatingScorer:
 
     """
 
-    def __init__(self, query: np.array, similarity: Callable[[np.array, Wells], float]):
+    def __init__(
+        self,
+        query: np.array,
+        similarity: Callable[[np.array, np.array], float],
+        batch_similarity: Optional[Callable[[np.array, np.array], np.array]] = None,
+    ):
         """
         Constructor.
 
         Args:
             query: A time trace of MI or cd(10)
             similarity: Any function that computes a similarity between two arrays. If you have a distance function,
-                        wrap it in `lambda x, y: -distance(x, y)`"""
+                        wrap it in `lambda x, y: -distance(x, y)`
+            batch_similarity: The same function, but accepting a 2D array of targets (one per row) and the 1D query,
+                              and returning one similarity per target"""
         self.query = query
         self.similarity = similarity
+        self.batch_similarity = batch_similarity
         self.problematic_wells = set()  # type: Set[Wells]
         self.problematic_runs = set()  # type: Set[Runs]
         self._max_missing = 3
@@ -416,8 +640,39 @@ class TruncatingScorer:
                 )
             self.problematic_wells.add(well)
             self.problematic_runs.add(well.run)
-            trunc_query, trunc_target = target[0:n], self.query[0:n]
-            return self.similarity(trunc_query, trunc_target)
+        trunc_target, trunc_query = target[0:n], self.query[0:n]
+        return self.similarity(trunc_target, trunc_query)
+
+    def batch(self, targets: np.array, lengths: np.array) -> np.array:
+        """
+        Scores many targets at once, truncating each as ``__call__`` does.
+        Targets with the same length are scored together as one 2D array.
+        Does not record problematic wells or runs, since the wells are not known.
+
+        Args:
+            targets: A 2D array with one target per row, padded at the end with NaN if the lengths differ
+            lengths: The length of each target
+
+        Returns:
+            A float64 array with one score per target
+
+        """
+        if self.batch_similarity is None:
+            raise UnsupportedOpError(f"{self} has no batch similarity")
+        lengths = np.asarray(lengths)
+        scores = np.full(len(targets), np.nan, dtype=np.float64)
+        for length in np.unique(lengths):
+            rows = np.flatnonzero(lengths == length)
+            n = min(int(length), len(self.query))
+            if abs(length - len(self.query)) > self._max_missing:
+                logger.warning(
+                    "Mismatch of {} between query length {} and {} targets of length {}".format(
+                        length - len(self.query), len(self.query), len(rows), length
+                    )
+                )
+            trunc_targets = np.asarray(targets[rows, :n], dtype=np.float64)
+            scores[rows] = self.batch_similarity(trunc_targets, self.query[0:n])
+        return scores
 
     def __repr__(self):
         return (
@@ -436,14 +691,18 @@ class TruncatingScorer:
 
 
 class HitScores:
-    """"""
+    """
+    Scoring functions that compare a target trace to a query trace, with higher values for more similar traces.
+    Each has a ``batch`` method that computes the same scores for a 2D array of targets with matrix operations.
+    """
 
     @classmethod
     def pearson(
         cls, query: np.array, weights: Optional[np.array] = None
     ) -> Callable[[np.array, Wells], float]:
         """
-
+        Returns a scoring function corresponding to the (optionally weighted) Pearson correlation coefficient.
+        This is 1 minus ``scipy.spatial.distance.correlation``.
 
         Args:
             query: np.array:
@@ -454,9 +713,22 @@ class HitScores:
         """
 
         def pearson(x, y):
-            return distance.correlation(x, y, weights)
-
-        return TruncatingScorer(query, pearson)
+            return 1 - distance.correlation(x, y, _truncate_weights(weights, len(x)))
+
+        def batch_pearson(xs, y):
+            w = _truncate_weights(weights, xs.shape[1])
+            if w is None:
+                w = np.full(xs.shape[1], 1 / xs.shape[1])
+            else:
+                w = w / w.sum()
+            xs = xs - (xs @ w)[:, None]
+            y = y - np.dot(y, w)
+            yw = y * w
+            xy = xs @ yw
+            xx = np.einsum("ij,ij,j->i", xs, xs, w)
+            return 1 - np.abs(1 - xy / np.sqrt(xx * np.dot(y, yw)))
+
+        return TruncatingScorer(query, pearson, batch_pearson)
 
     @classmethod
     def minkowski(
@@ -483,28 +755,780 @@ class HitScores:
         """
         if weights is None:
             weights = 1
+
+        def weighted(x, y):
+            # works for one target or a 2D array of them
+            return _truncate_weights(weights, np.shape(x)[-1]) * np.abs(x - y)
+
         if p == 0:
 
             def similarity(x, y):
-                return np.power(2, np.sum(np.log2(weights * np.abs(x - y))))  # TODO check
+                return np.power(2, np.sum(np.log2(weighted(x, y)), axis=-1))  # TODO check
 
         elif np.isneginf(p):
 
             def similarity(x, y):
-                return -np.min(weights * np.abs(x - y))
+                return -np.min(weighted(x, y), axis=-1)
 
         elif np.isposinf(p):
 
             def similarity(x, y):
-                return -np.max(weights * np.abs(x - y))
+                return -np.max(weighted(x, y), axis=-1)
 
         else:
 
             def similarity(x, y):
-                return -np.power(np.power(weights * np.abs(x - y), p).sum(), 1 / p)
+                return -np.power(np.power(weighted(x, y), p).sum(axis=-1), 1 / p)
 
         similarity.__name__ = f"-minkowski(p={p})"
-        return TruncatingScorer(query, similarity)
+        return TruncatingScorer(query, similarity, similarity)
+
+
+class PhenosearchIndex:
+    """
+    A persistent, on-disk store of decoded features for repeated phenosearches, which ``HitSearch`` can search without Valar.
+    The features are decoded (and interpolated) once, optionally downsampled and normalized, and stored per run.
+    The directory contains ``index.json``, which records the settings and the indexed runs,
+    and a directory per run containing:
+        - ``features.npy``: The features as a float32 matrix (wells × features), padded at the end with NaN
+        - ``wells.npy``:    An int64 matrix of the well ID, well index, and number of features of each row
+
+    The feature matrices are opened with ``np.load(mmap_mode="r")``.
+    Runs can be added at any time, so an index can be kept up to date by calling ``update`` as new runs are inserted.
+
+    Example:
+        Like this::
+
+            index = PhenosearchIndex("mi-index", "MI", downsample=10)
+            index.update(Projects.id == 5)
+            search = (
+                HitSearch(datetime.now())
+                .set_index(index)
+                .set_primary_score(HitScores.pearson(index.transform(query)))
+            )
+            hits = search.search_batched()
+
+    """
+
+    FEATURES_FILE = "features.npy"
+    WELLS_FILE = "wells.npy"
+    INDEX_FILE = "index.json"
+    _lock = threading.Lock()
+
+    def __init__(
+        self,
+        path: PathLike,
+        feature: Union[FeatureType, str] = FeatureTypes.MI,
+        downsample: int = 1,
+        normalize: bool = False,
+    ):
+        """
+
+        Args:
+            path: The directory of the index; created if needed
+            feature: A FeatureType or its 'internal' name
+            downsample: Replace every ``downsample`` consecutive features with their mean
+            normalize: Z-score each well's (downsampled) features
+
+        Raises:
+            XValueError: If the index already exists with different settings
+
+        """
+        if downsample < 1:
+            raise OutOfRangeError(f"Downsampling factor {downsample} < 1")
+        self.path = Path(path)
+        self.feature = FeatureTypes.of(feature)
+        self.downsample = downsample
+        self.normalize = normalize
+        self._runs: Optional[Dict[int, Mapping[str, Any]]] = None
+        settings = self._read()["settings"]
+        if settings is not None and settings != self._settings:
+            raise XValueError(f"Index {self.path} has settings {settings}, not {self._settings}")
+
+    @property
+    def runs(self) -> Sequence[int]:
+        """
+        The IDs of the indexed runs, sorted.
+        """
+        return sorted(self._entries().keys())
+
+    @property
+    def n_wells(self) -> int:
+        """
+        The total number of indexed wells.
+        """
+        return sum(entry["n_wells"] for entry in self._entries().values())
+
+    def runs_before(self, as_of: Optional[datetime]) -> Sequence[int]:
+        """
+        Returns the IDs of indexed runs inserted before a datetime, sorted.
+
+        Args:
+            as_of: A datetime, or None for all runs
+
+        Returns:
+
+        """
+        if as_of is None:
+            return self.runs
+        as_of = pd.Timestamp(as_of)
+        return [r for r in self.runs if pd.Timestamp(self._entries()[r]["created"]) < as_of]
+
+    def transform(self, arr: np.array) -> np.array:
+        """
+        Downsamples and normalizes a feature array as the indexed features were.
+        Apply this to query traces before scoring against the index.
+
+        Args:
+            arr: A 1D array of features, or a 2D array with one well per row
+
+        Returns:
+            A float64 array
+
+        """
+        arr = np.asarray(arr, dtype=np.float64)
+        block = np.atleast_2d(arr)
+        block, lengths = self._transform(block, np.full(len(block), block.shape[1]))
+        return block[0, : lengths[0]] if arr.ndim == 1 else block
+
+    def update(self, *wheres: ExpressionLike) -> Sequence[int]:
+        """
+        Adds all runs matching WHERE expressions that are not already indexed.
+
+        Args:
+            wheres: Peewee WHERE expressions, as in ``HitSearch.where``
+
+        Returns:
+            The IDs of the runs added
+
+        """
+        query = WellFrameQuery().build([Runs.id])
+        for where in wheres:
+            query = query.where(where)
+        runs = sorted({run_id for (run_id,) in query.distinct().tuples()})
+        return self.add(runs)
+
+    def add(self, runs: RunsLike, replace: bool = False) -> Sequence[int]:
+        """
+        Fetches, decodes, and stores the features of runs.
+
+        Args:
+            runs: The runs
+            replace: Re-index runs that are already indexed
+
+        Returns:
+            The IDs of the runs added
+
+        """
+        runs = Runs.fetch_ids_unchecked(runs)
+        runs = [r for r in runs if replace or r not in self._entries()]
+        interpolation = FeatureInterpolation(self.feature.valar_feature)
+        timestamps = TimestampCache()
+        added = []
+        for run in runs:
+            run = Runs.fetch(run)
+            fetched = list(
+                WellFeatures.select(WellFeatures.well_id, Wells.well_index, WellFeatures.floats)
+                .join(Wells)
+                .where(Wells.run_id == run.id)
+                .where(WellFeatures.type_id == self.feature.valar_feature.id)
+                .order_by(Wells.id)
+                .tuples()
+            )
+            if len(fetched) == 0:
+                logger.warning(f"Run r{run.id} has no {self.feature} features; not indexing it")
+                continue
+            rows = [(well_id, well_index, run.id, run.name) for well_id, well_index, _ in fetched]
+            windows = {}
+            if self.feature.is_interpolated:
+                windows[run.id] = interpolation.battery_window(
+                    timestamps.camera_millis(run), timestamps.stimulus_millis(run), run
+                )
+                timestamps.clear()
+            block, lengths = _decode_page(
+                self.feature, rows, [blob for _, _, blob in fetched], windows
+            )
+            block, lengths = self._transform(block, lengths)
+            wells = np.array([[r[0], r[1], n] for r, n in zip(rows, lengths)], dtype=np.int64)
+            self._save(run, block, wells)
+            added.append(run.id)
+        logger.info(f"Indexed {len(added)} runs in {self.path}")
+        return added
+
+    def remove(self, run: RunLike) -> None:
+        """
+        Removes a run from the index, if it's there.
+
+        Args:
+            run: RunLike:
+
+        """
+        run = Runs.fetch_ids_unchecked([run])[0]
+        self._update({}, [run])
+        shutil.rmtree(str(self.path / str(run)), ignore_errors=True)
+
+    def load(self, run: int) -> Tup[Sequence[Tup[int, int, int, str]], np.array, np.array]:
+        """
+        Reads an indexed run, memory-mapping its features.
+
+        Args:
+            run: The run ID
+
+        Returns:
+            A tuple of (rows of (well ID, well index, run ID, run name), the read-only features, the number of features per row)
+
+        """
+        entry = self._entries().get(run)
+        if entry is None:
+            raise LookupFailedError(f"Run r{run} is not in index {self.path}")
+        path = self.path / str(run)
+        try:
+            features = np.load(str(path / self.FEATURES_FILE), mmap_mode="r")
+            wells = np.load(str(path / self.WELLS_FILE))
+        except Exception as e:
+            raise CacheLoadError(f"Failed to load run r{run} from index {self.path}") from e
+        rows = [(int(w), int(i), run, entry["name"]) for w, i in wells[:, :2]]
+        return rows, features, wells[:, 2]
+
+    def pages(
+        self, runs: Optional[Sequence[int]] = None, page_size: int = 100
+    ) -> Iterator[Tup[Sequence[Tup[int, int, int, str]], np.array, np.array]]:
+        """
+        Iterates over indexed runs in pages of about ``page_size`` wells.
+        Runs are never split, so a run with more wells than ``page_size`` is a page of its own.
+        A page that is a single run is a view on the memory-mapped features; otherwise the runs are copied together.
+
+        Args:
+            runs: The run IDs to read, in order; all indexed runs by default
+            page_size: The target number of wells per page
+
+        Returns:
+            An iterator of the same tuples as ``load``
+
+        """
+        runs = self.runs if runs is None else runs
+        parts, n_wells = [], 0
+        for run in runs:
+            part = self.load(run)
+            if len(parts) > 0 and n_wells + len(part[0]) > page_size:
+                yield self._join(parts)
+                parts, n_wells = [], 0
+            parts.append(part)
+            n_wells += len(part[0])
+        if len(parts) > 0:
+            yield self._join(parts)
+
+    @classmethod
+    def _join(cls, parts):
+        if len(parts) == 1:
+            return parts[0]
+        rows = [row for part in parts for row in part[0]]
+        n_features = max(part[1].shape[1] for part in parts)
+        block = np.full((len(rows), n_features), np.nan, dtype=np.float32)
+        i = 0
+        for _, features, _ in parts:
+            block[i : i + len(features), : features.shape[1]] = features
+            i += len(features)
+        return rows, block, np.concatenate([part[2] for part in parts])
+
+    def _transform(self, block: np.array, lengths: np.array) -> Tup[np.array, np.array]:
+        """
+        Downsamples and normalizes rows padded with NaN, ignoring the padding.
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        with warnings.catch_warnings():
+            # all-NaN bins and rows are expected in padding
+            warnings.simplefilter("ignore", RuntimeWarning)
+            if self.downsample > 1:
+                k = self.downsample
+                n_bins = -(-block.shape[1] // k)
+                padded = np.full((len(block), n_bins * k), np.nan, dtype=np.float64)
+                padded[:, : block.shape[1]] = block
+                block = np.nanmean(padded.reshape(len(block), n_bins, k), axis=2)
+                lengths = -(-lengths // k)
+            if self.normalize:
+                means = np.nanmean(block, axis=1, keepdims=True)
+                stds = np.nanstd(block, axis=1, keepdims=True)
+                block = (block - means) / np.where(stds > 0, stds, 1)
+        return block, lengths
+
+    def _save(self, run: Runs, block: np.array, wells: np.array) -> None:
+        path = self.path / str(run.id)
+        tmp = self.path / f".{run.id}.{os.getpid()}-{threading.get_ident()}.tmp"
+        try:
+            tmp.mkdir(parents=True)
+            np.save(str(tmp / self.FEATURES_FILE), np.ascontiguousarray(block, dtype=np.float32))
+            np.save(str(tmp / self.WELLS_FILE), wells)
+            if path.exists():
+                shutil.rmtree(str(path))
+            os.replace(str(tmp), str(path))
+        except Exception as e:
+            shutil.rmtree(str(tmp), ignore_errors=True)
+            raise CacheSaveError(f"Failed to save run r{run.id} to index {self.path}") from e
+        entry = dict(
+            name=run.name, created=pd.Timestamp(run.created).isoformat(), n_wells=len(wells)
+        )
+        self._update({run.id: entry}, [])
+
+    @property
+    def _settings(self) -> Mapping[str, Any]:
+        return dict(
+            feature=self.feature.internal_name, downsample=self.downsample, normalize=self.normalize
+        )
+
+    def _update(self, new_entries: Mapping[int, Mapping[str, Any]], removed: Sequence[int]) -> None:
+        with self._lock:
+            # re-read so that we don't clobber other instances' changes
+            runs = dict(self._read()["runs"])
+            runs.update(new_entries)
+            for run in removed:
+                runs.pop(run, None)
+            data = dict(settings=self._settings, runs={str(k): v for k, v in runs.items()})
+            self.path.mkdir(parents=True, exist_ok=True)
+            path = self.path / self.INDEX_FILE
+            tmp = self.path / f".{self.INDEX_FILE}.{os.getpid()}-{threading.get_ident()}.tmp"
+            tmp.write_text(json.dumps(data), encoding="utf8")
+            os.replace(str(tmp), str(path))
+            self._runs = runs
+
+    def _entries(self) -> Mapping[int, Mapping[str, Any]]:
+        if self._runs is None:
+            self._runs = self._read()["runs"]
+        return self._runs
+
+    def _read(self) -> Mapping[str, Any]:
+        path = self.path / self.INDEX_FILE
+        if not path.exists():
+            return dict(settings=None, runs={})
+        data = json.loads(path.read_text(encoding="utf8"))
+        return dict(settings=data["settings"], runs={int(k): v for k, v in data["runs"].items()})
+
+    def __contains__(self, run: int) -> bool:
+        return run in self._entries()
+
+    def __len__(self) -> int:
+        return len(self._entries())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.path}, {self.feature}, {len(self)} runs)"
+
+    def __str__(self):
+        return repr(self)
+
+
+class PhenosearchNeighbors:
+    """
+    Approximate k-nearest-neighbor phenosearches over a PhenosearchIndex.
+    Each well's features are reduced to a short embedding: the means of ``n_bins`` equal-width bins of frames,
+    projected onto their first ``n_components`` principal components.
+    The embeddings are partitioned by k-means into ``n_lists`` inverted lists (an IVF index).
+    A query is embedded the same way, only the ``n_probe`` lists with the closest centroids are searched,
+    and the closest candidates are then re-ranked with an exact scoring function on the indexed features.
+    Because only embeddings are held in memory, the features of only the candidates are read from disk.
+
+    Example:
+        Like this::
+
+            index = PhenosearchIndex("mi-index", "MI", downsample=10, normalize=True)
+            neighbors = PhenosearchNeighbors(index).build()
+            hits = neighbors.search(index.transform(query), k=100)
+
+    """
+
+    def __init__(
+        self,
+        index: PhenosearchIndex,
+        n_bins: int = 256,
+        n_components: int = 32,
+        n_lists: Optional[int] = None,
+        seed: int = 0,
+    ):
+        """
+
+        Args:
+            index: The PhenosearchIndex to search
+            n_bins: The number of bins to average frames into before PCA
+            n_components: The length of the embeddings
+            n_lists: The number of k-means clusters; by default, about the square root of the number of wells
+            seed: Seed for sampling and k-means initialization
+
+        """
+        if n_bins < 1 or n_components < 1:
+            raise OutOfRangeError(f"n_bins {n_bins} and n_components {n_components} must be >= 1")
+        self.index = index
+        self.n_bins = n_bins
+        self.n_components = n_components
+        self.n_lists = n_lists
+        self.seed = seed
+        self._arrays: Optional[Dict[str, np.array]] = None
+
+    @property
+    def is_built(self) -> bool:
+        """Whether ``build`` or ``load`` was called."""
+        return self._arrays is not None
+
+    def build(
+        self,
+        runs: Optional[Sequence[int]] = None,
+        sample_size: int = 10000,
+        n_iterations: int = 10,
+    ) -> PhenosearchNeighbors:
+        """
+        Embeds every well on indexed runs and clusters the embeddings.
+
+        Args:
+            runs: The IDs of the runs to include; all indexed runs by default
+            sample_size: The maximum number of wells used to fit the PCA and k-means
+            n_iterations: The number of k-means iterations
+
+        Returns:
+            This instance
+
+        """
+        runs = self.index.runs if runs is None else runs
+        # load each run once; the features are memory-mapped, so keeping them until binning is cheap
+        loaded = [self.index.load(run) for run in runs]
+        n_frames = max([int(lengths.max(initial=0)) for _, _, lengths in loaded], default=0)
+        bin_width = max(1, -(-n_frames // self.n_bins))
+        binned, rows, positions = [], [], []
+        for run_rows, features, _ in loaded:
+            binned.append(self._bin(features, bin_width))
+            rows.extend(run_rows)
+            positions.append(np.arange(len(run_rows)))
+        if len(rows) == 0:
+            raise EmptyCollectionError(f"No wells to embed in {self.index}")
+        binned = np.vstack(binned)
+        rng = np.random.default_rng(self.seed)
+        sample = rng.choice(len(binned), min(sample_size, len(binned)), replace=False)
+        with warnings.catch_warnings():
+            # bins past the end of every sampled trace are all-NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            fill = np.nan_to_num(np.nanmean(binned[sample], axis=0))
+        centered = np.where(np.isnan(binned[sample]), fill, binned[sample]) - fill
+        # the right singular vectors are the principal axes
+        _, _, vt = np.linalg.svd(centered, full_matrices=False)
+        components = vt[: self.n_components]
+        self._arrays = dict(
+            bin_width=np.array(bin_width),
+            fill=fill,
+            components=components,
+            well_ids=np.array([row[0] for row in rows], dtype=np.int64),
+            well_indices=np.array([row[1] for row in rows], dtype=np.int64),
+            run_ids=np.array([row[2] for row in rows], dtype=np.int64),
+            positions=np.concatenate(positions),
+        )
+        embeddings = self._project(binned)
+        n_lists = self.n_lists or int(np.ceil(np.sqrt(len(embeddings))))
+        # the initial centroids are distinct sampled points
+        n_lists = min(n_lists, len(sample))
+        centroids = self._kmeans(embeddings[sample], n_lists, n_iterations, rng)
+        assignments = self._nearest(embeddings, centroids)
+        order = np.argsort(assignments, kind="stable")
+        self._arrays.update(
+            embeddings=embeddings[order],
+            well_ids=self._arrays["well_ids"][order],
+            well_indices=self._arrays["well_indices"][order],
+            run_ids=self._arrays["run_ids"][order],
+            positions=self._arrays["positions"][order],
+            centroids=centroids,
+            offsets=np.searchsorted(assignments[order], np.arange(n_lists + 1)),
+        )
+        logger.info(f"Embedded {len(embeddings)} wells into {n_lists} lists")
+        return self
+
+    def search(
+        self,
+        query: np.array,
+        k: int = 100,
+        score: Optional[TruncatingScorer] = None,
+        n_probe: int = 8,
+        n_candidates: Optional[int] = None,
+    ) -> HitFrame:
+        """
+        Finds the wells most similar to a query trace.
+
+        Args:
+            query: The query features, transformed with ``PhenosearchIndex.transform``
+            k: The number of hits to return
+            score: A scoring function with a ``batch`` method, used to re-rank the candidates;
+                   ``HitScores.pearson(query)`` by default
+            n_probe: The number of inverted lists to search; more is slower but more accurate
+            n_candidates: The number of closest embeddings to re-rank; 10 × k by default
+
+        Returns:
+            A HitFrame of up to ``k`` hits, sorted by decreasing score
+
+        """
+        if not self.is_built:
+            raise OpStateError(f"{self} is not built")
+        if k < 1:
+            raise OutOfRangeError(f"k {k} < 1")
+        score = HitScores.pearson(query) if score is None else score
+        n_candidates = 10 * k if n_candidates is None else max(k, n_candidates)
+        arrays = self._arrays
+        embedded = self._project(self._bin(np.asarray(query)[None, :], int(arrays["bin_width"])))
+        centroid_distances = np.square(arrays["centroids"] - embedded).sum(axis=1)
+        lists = np.argsort(centroid_distances)[:n_probe]
+        candidates = np.concatenate(
+            [np.arange(arrays["offsets"][i], arrays["offsets"][i + 1]) for i in lists]
+        )
+        distances = np.square(arrays["embeddings"][candidates] - embedded).sum(axis=1)
+        candidates = candidates[np.argsort(distances, kind="stable")[:n_candidates]]
+        rows, block, lengths = self._read(candidates)
+        hits = _score_block(rows, block, lengths, {"score": score}, {}, k)
+        hits = sorted(hits, key=lambda hit: -np.inf if np.isnan(hit["score"]) else hit["score"])
+        return HitFrame(hits[::-1])
+
+    def save(self, path: PathLike) -> None:
+        """
+        Saves the embeddings and lists to a ``.npz`` file.
+
+        Args:
+            path: PathLike:
+
+        """
+        if not self.is_built:
+            raise OpStateError(f"{self} is not built")
+        np.savez(str(path), **self._arrays)
+
+    @classmethod
+    def load(cls, path: PathLike, index: PhenosearchIndex) -> PhenosearchNeighbors:
+        """
+        Loads embeddings and lists saved by ``save``.
+
+        Args:
+            path: PathLike:
+            index: The PhenosearchIndex they were built from
+
+        Returns:
+
+        """
+        with np.load(str(path)) as npz:
+            arrays = {key: npz[key] for key in npz.files}
+        n_components, n_bins = arrays["components"].shape
+        neighbors = cls(index, n_bins, n_components, len(arrays["centroids"]))
+        neighbors._arrays = arrays
+        return neighbors
+
+    def _read(
+        self, candidates: np.array
+    ) -> Tup[Sequence[Tup[int, int, int, str]], np.array, np.array]:
+        """
+        Reads the indexed features of candidates, one run at a time.
+        """
+        arrays = self._arrays
+        run_ids = arrays["run_ids"][candidates]
+        parts = []
+        for run in np.unique(run_ids):
+            positions = arrays["positions"][candidates[run_ids == run]]
+            run_rows, features, lengths = self.index.load(int(run))
+            parts.append(
+                ([run_rows[i] for i in positions], features[positions], lengths[positions])
+            )
+        return PhenosearchIndex._join(parts) if len(parts) > 0 else ([], np.empty((0, 0)), [])
+
+    def _bin(self, features: np.array, bin_width: int) -> np.array:
+        """
+        Averages frames into ``n_bins`` bins of ``bin_width``, truncating or padding with NaN.
+        """
+        n = self.n_bins * bin_width
+        padded = np.full((len(features), n), np.nan, dtype=np.float32)
+        m = min(features.shape[1], n)
+        padded[:, :m] = features[:, :m]
+        with warnings.catch_warnings():
+            # bins past the end of a trace are all-NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return np.nanmean(padded.reshape(len(features), self.n_bins, bin_width), axis=2)
+
+    def _project(self, binned: np.array) -> np.array:
+        """
+        Projects binned features onto the principal components, filling missing bins with the mean.
+        """
+        fill = self._arrays["fill"]
+        centered = np.where(np.isnan(binned), fill, binned) - fill
+        return (centered @ self._arrays["components"].T).astype(np.float32)
+
+    @classmethod
+    def _kmeans(
+        cls, points: np.array, n_clusters: int, n_iterations: int, rng: np.random.Generator
+    ) -> np.array:
+        """
+        Lloyd's algorithm, starting from random points. Empty clusters keep their previous centroids.
+        """
+        centroids = points[rng.choice(len(points), n_clusters, replace=False)].astype(np.float64)
+        for _ in range(n_iterations):
+            assignments = cls._nearest(points, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, points)
+            counts = np.bincount(assignments, minlength=n_clusters)
+            nonempty = counts > 0
+            centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+        return centroids.astype(np.float32)
+
+    @classmethod
+    def _nearest(cls, points: np.array, centroids: np.array, chunk_size: int = 10000) -> np.array:
+        """
+        Finds the index of the nearest centroid to each point, in chunks of points to bound memory.
+        """
+        norms = np.square(centroids).sum(axis=1)
+        nearest = np.empty(len(points), dtype=np.int64)
+        for start in range(0, len(points), chunk_size):
+            chunk = points[start : start + chunk_size]
+            # |x - c|² = |x|² - 2x·c + |c|², and |x|² is the same for every centroid
+            nearest[start : start + chunk_size] = np.argmin(norms - 2 * chunk @ centroids.T, axis=1)
+        return nearest
+
+    def __repr__(self):
+        n = 0 if self._arrays is None else len(self._arrays["well_ids"])
+        return f"{type(self).__name__}({self.index}, {n} wells, d={self.n_components})"
+
+    def __str__(self):
+        return repr(self)
+
+
+def _truncate_weights(weights, n: int):
+    """
+    Truncates array weights to the first ``n``, as the query and target are truncated; leaves None and scalars alone.
+    """
+    if weights is None or np.isscalar(weights):
+        return weights
+    return np.asarray(weights)[:n]
+
+
+class _HitHeap:
+    """
+    Collects hits for ``HitSearch.search_batched``, either all of them (in order) or only the top k in a min-heap.
+    """
+
+    def __init__(self, top_k: Optional[int]):
+        self.top_k = top_k
+        self.n_hits = 0
+        self._hits = []
+        self._counter = itertools.count()
+
+    def extend(self, hits: Sequence[Mapping[str, Any]]) -> None:
+        for hit in hits:
+            self.n_hits += 1
+            if self.top_k is None:
+                self._hits.append(hit)
+                continue
+            # NaN can't be ordered, so it ranks last; the counter prefers earlier hits on ties
+            score = -np.inf if np.isnan(hit["score"]) else hit["score"]
+            item = (score, -next(self._counter), hit)
+            if len(self._hits) < self.top_k:
+                heapq.heappush(self._hits, item)
+            elif item[:2] > self._hits[0][:2]:
+                heapq.heapreplace(self._hits, item)
+
+    def results(self) -> Sequence[Mapping[str, Any]]:
+        if self.top_k is None:
+            return list(self._hits)
+        return [hit for _, _, hit in sorted(self._hits, key=lambda item: item[:2], reverse=True)]
+
+    def __len__(self) -> int:
+        return len(self._hits)
+
+
+def _score_page(
+    feature: FeatureType,
+    rows: Sequence[Tup[int, int, int, str]],
+    blobs: Sequence[bytes],
+    windows: Mapping[int, Tup[np.array, int, int, int]],
+    scores: Mapping[str, TruncatingScorer],
+    min_scores: Mapping[str, float],
+    top_k: Optional[int],
+) -> Sequence[Mapping[str, Any]]:
+    """
+    Decodes (and interpolates) a page of blobs into a 2D array and scores it.
+    Performs no database queries, so it can run in a worker process.
+
+    Args:
+        feature: The FeatureType of the blobs
+        rows: Tuples of (well ID, well index, run ID, run name), in the same order as ``blobs``
+        blobs: The raw WellFeatures.floats values
+        windows: A dict mapping run IDs to ``FeatureInterpolation.battery_window`` results, for interpolated features
+        scores: A dict mapping 'score' and the names of secondary scores to scoring functions with ``batch`` methods
+        min_scores: A dict mapping score names to minimum values
+        top_k: If not None, return only the ``top_k`` hits with the highest primary scores
+
+    Returns:
+        The hits as dicts with the columns of a HitFrame, in the order of ``rows``
+
+    """
+    block, lengths = _decode_page(feature, rows, blobs, windows)
+    return _score_block(rows, block, lengths, scores, min_scores, top_k)
+
+
+def _decode_page(
+    feature: FeatureType,
+    rows: Sequence[Tup[int, int, int, str]],
+    blobs: Sequence[bytes],
+    windows: Mapping[int, Tup[np.array, int, int, int]],
+) -> Tup[np.array, np.array]:
+    """
+    Decodes (and interpolates) blobs into a float64 array with one row per well, padded at the end with NaN.
+    See ``_score_page``.
+
+    Returns:
+        A tuple of (the 2D array, the length of each row before padding)
+
+    """
+    well_ids = [row[0] for row in rows]
+    arrays = feature.decode_blobs(blobs, well_ids)
+    if feature.is_interpolated:
+        interpolation = FeatureInterpolation(feature.valar_feature)
+        groups: Dict[Tup[int, int], List[int]] = defaultdict(list)
+        for i, (row, arr) in enumerate(zip(rows, arrays)):
+            groups[(row[2], len(arr))].append(i)
+        arrays = list(arrays)
+        for (run_id, _), indices in groups.items():
+            matrix = interpolation.interpolate_window(
+                np.vstack([arrays[i] for i in indices]), windows[run_id], well_ids[indices[0]]
+            )
+            for i, arr in zip(indices, matrix):
+                arrays[i] = arr
+    lengths = np.array([len(arr) for arr in arrays], dtype=np.int64)
+    block = np.full((len(arrays), lengths.max(initial=0)), np.nan, dtype=np.float64)
+    for i, arr in enumerate(arrays):
+        block[i, : len(arr)] = arr
+    return block, lengths
+
+
+def _score_block(
+    rows: Sequence[Tup[int, int, int, str]],
+    block: np.array,
+    lengths: np.array,
+    scores: Mapping[str, TruncatingScorer],
+    min_scores: Mapping[str, float],
+    top_k: Optional[int],
+) -> Sequence[Mapping[str, Any]]:
+    """
+    Scores a 2D array of decoded features. See ``_score_page``.
+    """
+    keep = np.ones(len(rows), dtype=bool)
+    values = {}
+    for name, fn in scores.items():
+        values[name] = fn.batch(block, lengths)
+        if name in min_scores:
+            # like HitSearch.iterate, which keeps NaN scores
+            keep &= ~(values[name] < min_scores[name])
+    indices = np.flatnonzero(keep)
+    if top_k is not None and len(indices) > top_k:
+        primary = values["score"][indices]
+        primary = np.where(np.isnan(primary), -np.inf, primary)
+        indices = np.sort(indices[np.argsort(-primary, kind="stable")[:top_k]])
+    hits = []
+    for i in indices:
+        well_id, well_index, run_id, run_name = rows[i]
+        hit = {
+            "well_id": well_id,
+            "well_index": well_index,
+            "run_id": run_id,
+            "run_name": run_name,
+        }
+        hit.update({name: float(arr[i]) for name, arr in values.items()})
+        hits.append(hit)
+    return hits
 
 
 __all__ = [
@@ -514,4 +1538,6 @@ __all__ = [
     "HitSearchTools",
     "TruncatingScorer",
     "HitScores",
+    "PhenosearchIndex",
+    "PhenosearchNeighbors",
 ]
@@ -3,6 +3,7 @@ from __future__ import annotations
 import dataclasses
 import traceback
 
+from chemfish.factories.caches.memory_cache import *
 from chemfish.factories.caches.sensor_cache import *
 from chemfish.factories.caches.stim_cache import *
 from chemfish.factories.caches.video_cache import *
@@ -123,8 +124,7 @@ class Quick:
         feature: Generate WellFrames and plots using this feature.
         generation: Generation permitted
         as_of: Enables additional methods by setting max datetime for those queries. This includes querying by flexible Peewee Expressions
-        well_cache: A FrameCache for saving WellFrames on disk
-        facade: An optional FrameFacade for saving WellFrames into memory
+        well_cache: A FrameCache for saving WellFrames on disk; may be wrapped in a MemoryCache to keep recent runs in memory
         stim_cache: A StimCache for saving StimFrames objects on disk
         default_namer: By default, draw WellFrames with this Namer
         enable_checks: Warn about missing frames, 'concern' rows in the annotations table, suspicious batches, and more; see Concerns.warn_common_checks for full info
@@ -619,7 +619,8 @@ class Quick:
             if isinstance(sensor, str):
                 sensor = SensorNames[sensor]
             if sensor == SensorNames.MICROPHONE or sensor == SensorNames.MICROPHONE_WAVEFORM:
-                waveform = self.sensor_cache.load_waveform(run)
+                # load through the generic method so that a MemoryCache can serve it
+                waveform = self.sensor_cache.load((SensorNames.MICROPHONE_WAVEFORM, run))
                 # do NOT slice: already done in waveform
                 sensor_data.append(waveform)
             elif sensor.is_time_dependent:
@@ -1039,7 +1040,7 @@ class Quick:
         elif isinstance(run, ExpressionLike):
             with Tools.silenced(no_stdout=True, no_stderr=False):
                 x = WellFrameBuilder(self.as_of).where(run).build().unique_runs()
-            feats_map = {r: ValarTools.features_on(r) for r in x}
+            feats_map = ValarTools.features_on_runs(x)
             missing = [
                 "r" + str(k)
                 for k, v in feats_map.items()
@@ -1242,8 +1243,8 @@ class Quick:
 
     def delete(self, runs: Union[RunsLike, peewee.Query, ExpressionLike]) -> None:
         """
-        Deletes one or more runs from self.facade (if it exists) or self.cache (if it exists).
-        Does nothing if neither is defined.
+        Deletes one or more runs from self.cache (if it exists), including from memory if it's a MemoryCache.
+        Does nothing if it's not defined.
         """
         if isinstance(runs, peewee.Query):
             runs = list(runs)
@@ -1365,14 +1366,22 @@ class Quicks:
         if "namer" in kwargs and "well_namer" not in kwargs:
             kwargs["well_namer"] = kwargs["namer"]
             del kwargs["namer"]  # it's ok -- this is already a copy
+        # if set, keep recently loaded WellFrames, StimFrames, and sensor data in memory
+        memory_bytes = kwargs.pop("memory_cache_bytes", None)
         sensor_cache = SensorCache()
         audio_stimulus_cache = AudioStimulusCache()
+        cache = WellCache(feature).with_sensor_cache(sensor_cache)
+        stim_cache = StimframeCache()
+        if memory_bytes is not None:
+            cache = MemoryCache(cache, memory_bytes)
+            stim_cache = MemoryCache(stim_cache, memory_bytes)
+            sensor_cache = MemoryCache(sensor_cache, memory_bytes)
         return Quick(
             feature,
             generation,
             as_of,
-            cache=WellCache(feature).with_sensor_cache(sensor_cache),
-            stim_cache=StimframeCache(),
+            cache=cache,
+            stim_cache=stim_cache,
             sensor_cache=sensor_cache,
             video_cache=VideoCache(),
             audio_stimulus_cache=audio_stimulus_cache,
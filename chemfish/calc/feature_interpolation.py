@@ -1,5 +1,3 @@
-import scipy.interpolate as interp
-
 from chemfish.core.core_imports import *
 
 
@@ -72,6 +70,42 @@ class FeatureInterpolation:
 
         """
         run = InternalTools.well(well).run
+        frames_ms, battery_start_ms, battery_stop_ms, ideal_framerate = self.battery_window(
+            frame_timestamps, stim_timestamps, run, stringent=stringent
+        )
+        return self._interpolate(
+            feature_arr,
+            frames_ms,
+            battery_start_ms,
+            battery_stop_ms,
+            ideal_framerate,
+            well,
+            stringent,
+        )
+
+    def battery_window(
+        self,
+        frame_timestamps: np.array,
+        stim_timestamps: np.array,
+        run: RunLike,
+        stringent: bool = False,
+    ) -> Tup[np.array, int, int, int]:
+        """
+        Finds the frame timestamps that lie within the battery for a run.
+        Every well in a run shares these, so this only needs to be called once per run.
+        The results can be passed to ``interpolate_window``, which does not touch the database.
+
+        Args:
+            frame_timestamps:
+            stim_timestamps:
+            run: A run ID, instance, etc.
+            stringent: Raise exceptions for small errors
+
+        Returns:
+            A tuple of (frame milliseconds in the battery, battery start ms, expected battery stop ms, ideal framerate)
+
+        """
+        run = Runs.fetch(run)
         ideal_framerate = ValarTools.frames_per_second(run)
         battery = run.experiment.battery
         actual_battery_start_ms, actual_battery_stop_ms = stim_timestamps[0], stim_timestamps[-1]
@@ -93,11 +127,61 @@ class FeatureInterpolation:
         frames_ms = frame_timestamps[
             (frame_timestamps >= actual_battery_start_ms) & (frame_timestamps <= expected_stop_ms)
         ]
+        return frames_ms, actual_battery_start_ms, expected_stop_ms, ideal_framerate
+
+    def interpolate_run(
+        self,
+        features_2d: np.array,
+        frame_timestamps: np.array,
+        stim_timestamps: np.array,
+        run: RunLike,
+        stringent: bool = False,
+    ) -> np.array:
+        """
+        Interpolates the features of every well in a run at once.
+        Because the wells share timestamps, the index mapping is computed only once.
+
+        Args:
+            features_2d: A wells × frames array; all wells must have the same number of frames
+            frame_timestamps:
+            stim_timestamps:
+            run: The run ID, instance, etc.
+            stringent: Raise exceptions for small errors
+
+        Returns:
+            A wells × (interpolated frames) array
+
+        """
+        window = self.battery_window(frame_timestamps, stim_timestamps, run, stringent=stringent)
+        return self.interpolate_window(features_2d, window, None, stringent=stringent)
+
+    def interpolate_window(
+        self,
+        feature_arr: np.array,
+        window: Tup[np.array, int, int, int],
+        well: Optional[int],
+        stringent: bool = False,
+    ) -> np.array:
+        """
+        Interpolates a feature using a window from ``battery_window``.
+        Performs no database queries, so it is safe to call from worker threads or processes.
+
+        Args:
+            feature_arr: The array of the feature; not affected. Either 1D, or 2D (wells × frames) for wells on the same run.
+            window: The tuple returned by ``battery_window`` for the run
+            well: The well ID, used only in error messages
+            stringent: Raise exceptions for small errors
+
+        Returns:
+            The interpolated features
+
+        """
+        frames_ms, battery_start_ms, battery_stop_ms, ideal_framerate = window
         return self._interpolate(
             feature_arr,
             frames_ms,
-            actual_battery_start_ms,
-            expected_stop_ms,
+            battery_start_ms,
+            battery_stop_ms,
             ideal_framerate,
             well,
             stringent,
@@ -116,10 +200,11 @@ class FeatureInterpolation:
         """
         Interpolates a time-dependent, frame-by-frame feature using timestamps.
         See exterior_interpolate_features for a simpler way to call this and for more info.
-        Interpolates using scipy.interpolate.interp1d with kind='previous', fill_value='extrapolate', bounds_error=False, and assume_sorted=True
+        Equivalent to scipy.interpolate.interp1d with kind='previous', fill_value=(NaN, NaN), bounds_error=False, and assume_sorted=True,
+        but the index mapping is computed once with ``np.searchsorted`` and applied to every row with a single fancy-indexing operation.
 
         Args:
-            feature_arr: The array of the feature; not affected
+            feature_arr: The array of the feature; not affected. Either 1D or 2D (wells × frames).
             frames_ms: The millisecond timestamps, which can be float-typed.
                        This is NOT set to start with the battery start.
                        However, the milliseconds for battery_start, battery_end,
@@ -140,35 +225,53 @@ class FeatureInterpolation:
         # empirical_framerate = 1000 / np.mean(diffs)
         ideal_step = 1000 / ideal_framerate
         new_time = np.arange(start=battery_start_ms, stop=battery_stop_ms, step=ideal_step)
+        n_features = feature_arr.shape[-1]
 
         # if len(new_time) == len(feature_arr):
         #     return feature_arr
-        if abs(len(frames_ms) - len(feature_arr)) > (0 if stringent else 100 * ideal_step):
+        if abs(len(frames_ms) - n_features) > (0 if stringent else 100 * ideal_step):
             raise FeatureTimestampMismatchError(
-                self.feature, well, len(feature_arr), len(frames_ms), len(new_time)
+                self.feature, well, n_features, len(frames_ms), len(new_time)
             )
-        elif abs(len(frames_ms) - len(feature_arr)) > 0:
+        elif abs(len(frames_ms) - n_features) > 0:
             # if it's off by 1, let's trim either to fix it
-            if len(frames_ms) < len(feature_arr):
-                feature_arr = feature_arr[: len(frames_ms)]
+            if len(frames_ms) < n_features:
+                feature_arr = feature_arr[..., : len(frames_ms)]
             else:
-                frames_ms = frames_ms[: len(feature_arr)]
+                frames_ms = frames_ms[:n_features]
 
         # this breaks with linear interpolation!
-        try:
-            feature_interp = interp.interp1d(
-                frames_ms,
-                feature_arr,
-                kind="previous",
-                fill_value=(np.NaN, np.NaN),
-                bounds_error=False,
-                assume_sorted=True,
-            )
-        except BaseException as e:
+        if len(frames_ms) == 0:
             raise InterpolationFailedError(
-                f"Failed calling interp1d on {self.feature} for well {well}", self.feature, well
-            ) from e
-        return feature_interp(new_time)
+                f"No frames to interpolate {self.feature} for well {well}", self.feature, well
+            )
+        indices = self.previous_indices(frames_ms, new_time)
+        valid = indices >= 0
+        interpolated = np.full(
+            (*feature_arr.shape[:-1], len(new_time)),
+            np.NaN,
+            dtype=np.result_type(feature_arr.dtype, np.float32),
+        )
+        interpolated[..., valid] = feature_arr[..., indices[valid]]
+        return interpolated
+
+    @classmethod
+    def previous_indices(cls, frames_ms: np.array, new_time: np.array) -> np.array:
+        """
+        For each time in ``new_time``, finds the index of the last frame at or before it.
+        Times before the first frame or after the last frame get -1.
+
+        Args:
+            frames_ms: Sorted frame timestamps
+            new_time: The times to interpolate at
+
+        Returns:
+            An int array with the same length as ``new_time``
+
+        """
+        indices = np.searchsorted(frames_ms, new_time, side="right") - 1
+        indices[(new_time < frames_ms[0]) | (new_time > frames_ms[-1])] = -1
+        return indices
 
 
 __all__ = ["FeatureInterpolation", "InterpolationFailedError", "FeatureTimestampMismatchError"]
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import scipy.signal
+
+from chemfish.core.core_imports import *
+
+
+class FeatureSmoothing:
+    """
+    Trailing (weighted) rolling means along the rows of a 2D feature matrix.
+    Gives the same results as ``pd.DataFrame.rolling(window_size, axis=1, min_periods=1, win_type=window_type).mean()``,
+    but works on the raw array, optionally in chunks of columns to bound the memory used.
+    As in pandas, NaNs are skipped by giving them zero weight, and a window with no values gives NaN.
+    """
+
+    @classmethod
+    def weights(cls, window_size: int, window_type: Optional[str]) -> np.ndarray:
+        """
+        Gets the weights of a window, as pandas uses them.
+
+        Args:
+            window_size: The number of features in each window
+            window_type: The name of a window in ``scipy.signal.windows``, or None for equal weights
+
+        Returns:
+            A 1D float64 array of length ``window_size``
+
+        """
+        if window_type is None:
+            return np.ones(window_size, dtype=np.float64)
+        fn = getattr(scipy.signal.windows, window_type, None)
+        if fn is None:
+            raise XValueError(f"Invalid window type {window_type}")
+        return np.asarray(fn(window_size), dtype=np.float64)
+
+    @classmethod
+    def rolling_mean(
+        cls,
+        arr: np.ndarray,
+        window_size: int,
+        window_type: Optional[str] = None,
+        chunk_size: Optional[int] = None,
+    ) -> np.ndarray:
+        """
+        Calculates a trailing rolling mean of each row, where each value is the (weighted) mean of itself
+        and up to ``window_size - 1`` values before it.
+
+        Args:
+            arr: A 2D array
+            window_size: The number of features in each window
+            window_type: The name of a window in ``scipy.signal.windows``, or None for equal weights
+            chunk_size: If set, the number of columns to compute at once
+
+        Returns:
+            A new float64 array of the same shape
+
+        """
+        if window_size < 1:
+            raise OutOfRangeError(f"Window size {window_size} < 1")
+        arr = np.asarray(arr)
+        weights = cls.weights(window_size, window_type)
+        n_cols = arr.shape[1]
+        chunk_size = n_cols if chunk_size is None else max(1, chunk_size)
+        result = np.empty(arr.shape, dtype=np.float64)
+        for start in range(0, n_cols, chunk_size):
+            stop = min(n_cols, start + chunk_size)
+            # include the columns that the first windows in this chunk reach back to
+            lead = min(start, window_size - 1)
+            chunk = cls._rolling_mean(arr[:, start - lead : stop], weights)
+            result[:, start:stop] = chunk[:, lead:]
+        return result
+
+    @classmethod
+    def _rolling_mean(cls, arr: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """
+
+
+        Args:
+            arr: A 2D array, possibly with NaNs
+            weights: The window weights, with the weight of the current value last
+
+        Returns:
+
+        """
+        missing = np.isnan(arr)
+        values = np.where(missing, 0.0, arr).astype(np.float64, copy=False)
+        present = (~missing).astype(np.float64)
+        numerator = np.zeros(arr.shape, dtype=np.float64)
+        denominator = np.zeros(arr.shape, dtype=np.float64)
+        n_present = np.zeros(arr.shape, dtype=np.float64)
+        window_size, n_cols = len(weights), arr.shape[1]
+        for lag in range(min(window_size, n_cols)):
+            weight = weights[window_size - 1 - lag]
+            numerator[:, lag:] += weight * values[:, : n_cols - lag]
+            denominator[:, lag:] += weight * present[:, : n_cols - lag]
+            n_present[:, lag:] += present[:, : n_cols - lag]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(n_present > 0, numerator / denominator, np.nan)
+
+
+__all__ = ["FeatureSmoothing"]
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import warnings
+
+from chemfish.core.core_imports import *
+
+
+class GroupedReductions:
+    """
+    Reduces the rows of a 2D array by group, like ``pd.DataFrame.groupby(...).mean()`` on the features alone.
+    The rows are stably sorted by group once, so each group is a contiguous segment,
+    and most reductions are a single ``np.ufunc.reduceat`` over those segments.
+    Medians and quantiles are computed one group at a time, so only one group is held in extra memory.
+    As in pandas, NaNs are skipped, and a group with only NaNs in a column gives NaN (or 0 for ``sum``).
+
+    Example:
+        Uses::
+
+            groups, firsts = GroupedReductions.factorize([codes_a, codes_b])
+            means = GroupedReductions.reduce(matrix, groups, len(firsts), "mean")
+
+    """
+
+    functions = {"mean", "sum", "std", "var", "sem", "min", "max", "median", "quantile"}
+
+    @classmethod
+    def supports(cls, function: Any, kwargs: Mapping[str, Any]) -> bool:
+        """
+        Returns whether ``reduce`` can compute ``function`` with ``kwargs``.
+        Anything else should be delegated to pandas.
+
+        Args:
+            function: The name of a pandas GroupBy function
+            kwargs: Keyword arguments that would be passed to it
+
+        Returns:
+
+        """
+        if not isinstance(function, str) or function not in cls.functions:
+            return False
+        if function in {"std", "var", "sem"}:
+            return set(kwargs.keys()) <= {"ddof"}
+        if function == "quantile":
+            return set(kwargs.keys()) <= {"q", "interpolation"} and (
+                np.isscalar(kwargs.get("q", 0.5))
+                and kwargs.get("interpolation", "linear") == "linear"
+            )
+        return len(kwargs) == 0
+
+    @classmethod
+    def factorize(cls, codes: Sequence[np.ndarray]) -> Tup[np.ndarray, np.ndarray]:
+        """
+        Combines per-column integer codes into one group ID per row.
+        Groups are numbered in order of first appearance, like ``groupby(sort=False)``.
+        Missing values (such as code -1 in a MultiIndex) are treated as ordinary values, like ``dropna=False``.
+
+        Args:
+            codes: One array of integer codes per key column, each with one element per row
+
+        Returns:
+            A tuple of (the group ID of each row, the index of the first row in each group)
+
+        """
+        stacked = np.column_stack([np.asarray(c, dtype=np.int64) for c in codes])
+        _, firsts, inverse = np.unique(stacked, axis=0, return_index=True, return_inverse=True)
+        order = np.argsort(firsts, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        return rank[inverse.reshape(-1)], firsts[order]
+
+    @classmethod
+    def reduce(
+        cls, arr: np.ndarray, groups: np.ndarray, n_groups: int, function: str, **kwargs
+    ) -> np.ndarray:
+        """
+        Reduces the rows of ``arr`` by group.
+
+        Args:
+            arr: A 2D numeric array with one row per element of ``groups``
+            groups: Group IDs from 0 to ``n_groups - 1``, each of which must occur at least once
+            n_groups: The number of groups
+            function: Any of ``GroupedReductions.functions``
+            kwargs: ``ddof`` for std, var, and sem; ``q`` for quantile
+
+        Returns:
+            A 2D array with one row per group, in order of group ID
+
+        """
+        if function not in cls.functions:
+            raise XValueError(f"Unsupported function {function}")
+        arr = np.asarray(arr)
+        # these match the dtypes pandas returns
+        if np.issubdtype(arr.dtype, np.floating) and function not in {"std", "sem", "quantile"}:
+            out_dtype = arr.dtype
+        else:
+            out_dtype = np.float64
+        if len(groups) > 1 and np.any(groups[1:] < groups[:-1]):
+            order = np.argsort(groups, kind="stable")
+            arr, groups = arr[order], groups[order]
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        if len(starts) != n_groups:
+            raise LengthMismatchError(f"{len(starts)} groups found but {n_groups} expected")
+        with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+            # all-NaN slices are expected and give NaN, as in pandas
+            warnings.simplefilter("ignore", RuntimeWarning)
+            if function in {"median", "quantile"}:
+                q = 0.5 if function == "median" else kwargs.get("q", 0.5)
+                ends = np.r_[starts[1:], len(arr)]
+                result = np.empty((n_groups, arr.shape[1]), dtype=np.float64)
+                for g, (start, end) in enumerate(zip(starts, ends)):
+                    result[g] = np.nanquantile(arr[start:end], q, axis=0)
+            elif function in {"min", "max"}:
+                ufunc = np.fmin if function == "min" else np.fmax
+                result = ufunc.reduceat(arr, starts, axis=0)
+            else:
+                result = cls._moments(arr, groups, starts, function, kwargs.get("ddof", 1))
+        return result.astype(out_dtype, copy=False)
+
+    @classmethod
+    def _moments(
+        cls, arr: np.ndarray, groups: np.ndarray, starts: np.ndarray, function: str, ddof: int
+    ) -> np.ndarray:
+        """
+        Computes sums, means, and two-pass variances over contiguous segments, accumulating in float64.
+
+        Args:
+            arr: The sorted 2D array
+            groups: The sorted group IDs
+            starts: The first row of each segment
+            function: sum, mean, var, std, or sem
+            ddof: Delta degrees of freedom
+
+        Returns:
+
+        """
+        missing = np.isnan(arr) if np.issubdtype(arr.dtype, np.floating) else None
+        filled = arr if missing is None else np.where(missing, 0, arr)
+        sums = np.add.reduceat(filled, starts, axis=0, dtype=np.float64)
+        if function == "sum":
+            return sums
+        if missing is None:
+            counts = np.diff(np.r_[starts, len(arr)])[:, None].astype(np.float64)
+        else:
+            counts = np.add.reduceat(~missing, starts, axis=0, dtype=np.float64)
+        means = sums / counts
+        if function == "mean":
+            return means
+        deviations = filled - means[groups]
+        if missing is not None:
+            deviations[missing] = 0
+        squares = np.add.reduceat(np.square(deviations), starts, axis=0, dtype=np.float64)
+        dof = counts - ddof
+        variances = np.where(dof > 0, squares / dof, np.nan)
+        if function == "var":
+            return variances
+        if function == "std":
+            return np.sqrt(variances)
+        return np.sqrt(variances) / np.sqrt(counts)
+
+
+__all__ = ["GroupedReductions"]
@@ -21,5 +21,6 @@ from chemfish.core._imports import *
 from chemfish.core._tools import *
 from chemfish.core.data_generations import DataGeneration
 from chemfish.core.environment import *
+from chemfish.core.lazy import *
 from chemfish.core.tools import *
 from chemfish.core.valar_tools import *
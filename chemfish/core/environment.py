@@ -2,6 +2,7 @@ from pocketutils.tools.filesys_tools import FilesysTools
 
 from chemfish.core import log_factory
 from chemfish.core._imports import *
+from chemfish.core.lazy import *
 from chemfish.core.valar_singleton import *
 
 # I really don't understand why this is needed here
@@ -59,11 +60,8 @@ class ChemfishEnvironment:
         self.username = _try("username")
         if self.username is None:
             raise MissingConfigKeyError(f"Must specify username in {self.config_file}")
-        self.user = Users.fetch(self.username)
-        self.user_ref = Refs.fetch_or_none("manual:" + self.username)
-        if self.user_ref is None:
-            logger.warning(f"manual:{self.username} is not in `refs`. Using 'manual'.")
-        self.user_ref = Refs.fetch_or_none("manual")
+        self._user = Lazy(lambda: Users.fetch(self.username), "chemfish_env.user")
+        self._user_ref = Lazy(self._fetch_user_ref, "chemfish_env.user_ref")
         self.chemfish_log_level = _try("chemfish_log_level", "MINOR")
         self.global_log_level = _try("global_log_level", "INFO")
         self.cache_dir = _try("cache", Path.home() / "valar-cache")
@@ -91,6 +89,24 @@ class ChemfishEnvironment:
             f"Set {len(props)} chemfish config items. Run 'print(chemfish_env.info())' for details."
         )
 
+    @property
+    def user(self) -> Users:
+        """The row in valar.users, fetched on first use."""
+        return self._user.get()
+
+    @property
+    def user_ref(self) -> Optional[Refs]:
+        """The row ``manual:<username>`` in valar.refs, or ``manual`` if it doesn't exist; fetched on first use."""
+        return self._user_ref.get()
+
+    def _fetch_user_ref(self) -> Optional[Refs]:
+        """ """
+        ref = Refs.fetch_or_none("manual:" + self.username)
+        if ref is None:
+            logger.warning(f"manual:{self.username} is not in `refs`. Using 'manual'.")
+            ref = Refs.fetch_or_none("manual")
+        return ref
+
     def _get_props(self):
         """ """
         try:
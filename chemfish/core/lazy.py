@@ -0,0 +1,192 @@
+"""
+Deferred values, so that importing Chemfish never queries Valar.
+Module-level and class-level lookups are wrapped in ``Lazy`` and computed on first use.
+Call ``LazyInit.warm()`` to compute every pending value in one step, such as at the start of a notebook.
+"""
+
+from __future__ import annotations
+
+import threading
+
+from chemfish.core._imports import *
+
+T = TypeVar("T")
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class Lazy(Generic[T]):
+    """
+    A value computed by a function on first use, then kept.
+    Thread-safe: the function is called at most once, even if several threads ask at the same time.
+    As a class attribute, it acts as a read-only descriptor, so ``cls.attribute`` gives the value.
+
+    Example:
+        Uses::
+
+            class ValarTools:
+                MANUAL_REF = Lazy(lambda: Refs.fetch("manual"), "ValarTools.MANUAL_REF")
+
+    Attributes:
+        name: A name for logging
+
+    """
+
+    def __init__(self, fn: Callable[[], T], name: Optional[str] = None):
+        """
+
+        Args:
+            fn: A function with no arguments that computes the value
+            name: A name for logging; defaults to the function's qualified name
+        """
+        self.name = getattr(fn, "__qualname__", repr(fn)) if name is None else name
+        self._fn = fn
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        LazyInit.register(self)
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the value has been computed."""
+        return self._loaded
+
+    def get(self) -> T:
+        """
+        Returns the value, computing it if needed.
+        """
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    t0 = time.monotonic()
+                    self._value = self._fn()
+                    self._loaded = True
+                    logger.debug(f"Loaded {self.name} in {time.monotonic() - t0:.3f}s")
+        return self._value
+
+    def reset(self) -> None:
+        """
+        Discards the value, so that it is recomputed on next use.
+        """
+        with self._lock:
+            self._value = None
+            self._loaded = False
+
+    def __get__(self, instance, owner) -> T:
+        return self.get()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name}, loaded={self._loaded})"
+
+    def __str__(self):
+        return repr(self)
+
+
+class LazyMapping(Mapping[K, V]):
+    """
+    A read-only mapping whose contents are computed on first access.
+    Use in place of a module-level dict that would otherwise be filled from Valar at import.
+    """
+
+    def __init__(self, fn: Callable[[], Mapping[K, V]], name: Optional[str] = None):
+        """
+
+        Args:
+            fn: A function with no arguments that returns the mapping
+            name: A name for logging
+        """
+        self._lazy = Lazy(fn, name)
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the contents have been computed."""
+        return self._lazy.is_loaded
+
+    def reset(self) -> None:
+        """
+        Discards the contents, so that they are recomputed on next access.
+        """
+        self._lazy.reset()
+
+    def __getitem__(self, key: K) -> V:
+        return self._lazy.get()[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self._lazy.get()
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(self._lazy.get())
+
+    def __len__(self) -> int:
+        return len(self._lazy.get())
+
+    def __repr__(self):
+        if self._lazy.is_loaded:
+            return repr(self._lazy.get())
+        return f"{type(self).__name__}({self._lazy.name}, loaded=False)"
+
+    def __str__(self):
+        return repr(self)
+
+
+class LazyInit:
+    """
+    The registry of ``Lazy`` values that are computed on first use.
+    """
+
+    _registered: List[Lazy] = []
+    _lock = threading.Lock()
+
+    @classmethod
+    def register(cls, lazy: Lazy) -> None:
+        """
+        Adds a value to compute in ``warm``.
+        Called by ``Lazy`` itself.
+
+        Args:
+            lazy: The deferred value
+
+        """
+        with cls._lock:
+            cls._registered.append(lazy)
+
+    @classmethod
+    def pending(cls) -> Sequence[str]:
+        """
+        Returns the names of the registered values that have not been computed yet.
+        """
+        with cls._lock:
+            return [z.name for z in cls._registered if not z.is_loaded]
+
+    @classmethod
+    def warm(cls) -> int:
+        """
+        Computes every registered value that has not been computed yet, in the order they were registered.
+        Values are only registered when their module is imported,
+        so this only covers the parts of Chemfish that were imported.
+
+        Returns:
+            The number of values computed
+
+        """
+        with cls._lock:
+            todo = [z for z in cls._registered if not z.is_loaded]
+        t0 = time.monotonic()
+        for lazy in todo:
+            lazy.get()
+        if len(todo) > 0:
+            logger.info(f"Loaded {len(todo)} deferred values in {time.monotonic() - t0:.1f}s")
+        return len(todo)
+
+    @classmethod
+    def reset(cls) -> None:
+        """
+        Discards every registered value, so that each is recomputed on next use.
+        """
+        with cls._lock:
+            todo = list(cls._registered)
+        for lazy in todo:
+            lazy.reset()
+
+
+__all__ = ["Lazy", "LazyMapping", "LazyInit"]
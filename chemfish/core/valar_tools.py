@@ -2,6 +2,7 @@ import ast
 import shutil
 import subprocess
 
+import peewee
 from natsort import natsorted
 from pocketutils.core.dot_dict import NestedDotDict
 from PIL import Image
@@ -9,16 +10,48 @@ from PIL import Image
 from chemfish.core._imports import *
 from chemfish.core._tools import *
 from chemfish.core.data_generations import DataGeneration
+from chemfish.core.lazy import *
 from chemfish.core.tools import *
 from chemfish.core.valar_singleton import *
 from chemfish.model.sensor_names import SensorNames
 
-_stimulus_display_colors = {
-    s.name: "#" + s.default_color if s.audio_file is None else "black" for s in Stimuli.select()
-}
-_stimulus_display_colors.update(InternalTools.load_resource("core", "stim_colors.json"))
-_stimulus_replace = {s.name: s.name for s in Stimuli.select()}
-_stimulus_replace.update(InternalTools.load_resource("core", "stim_names.json"))
+_stimuli = Lazy(lambda: list(Stimuli.select()), "stimuli")
+_stimulus_display_colors = LazyMapping(
+    lambda: {
+        **{
+            s.name: "#" + s.default_color if s.audio_file is None else "black"
+            for s in _stimuli.get()
+        },
+        **InternalTools.load_resource("core", "stim_colors.json"),
+    },
+    "stimulus display colors",
+)
+_stimulus_replace = LazyMapping(
+    lambda: {
+        **{s.name: s.name for s in _stimuli.get()},
+        **InternalTools.load_resource("core", "stim_names.json"),
+    },
+    "stimulus names",
+)
+
+
+def _load_generations() -> Mapping[str, Mapping[str, Any]]:
+    """
+    Reads ``generations.json`` once, parsing the start and end dates (None if open-ended).
+    """
+    generations = {}
+    for x in InternalTools.load_resource("core", "generations.json"):
+        generations[x["name"]] = {
+            **x,
+            **{
+                key: None if x[key] == "" else datetime.strptime(x[key], "%Y-%m-%d")
+                for key in ["start_date", "end_date"]
+            },
+        }
+    return generations
+
+
+_generations = Lazy(_load_generations, "generations.json")
 
 
 class StimulusType(SmartEnum):
@@ -37,12 +70,19 @@ class ValarTools:
     For example, uses our definition of a library plate ID.
     Some of these functions simply call their equivalent Tools or InternalTools functions.
 
+    The run, TOML config, and generation used by ``generation_of``, ``toml_data``, and ``frames_per_second``
+    are kept in memory per run ID after the first call. ``cache_runs`` loads them for many runs at once,
+    and ``invalidate_runs`` discards them (needed only if a run is modified in Valar).
+
     """
 
-    MANUAL_HIGH_REF = Refs.fetch_or_none("manual:high")
-    MANUAL_REF = Refs.fetch("manual")
+    MANUAL_HIGH_REF = Lazy(lambda: Refs.fetch_or_none("manual:high"), "ValarTools.MANUAL_HIGH_REF")
+    MANUAL_REF = Lazy(lambda: Refs.fetch("manual"), "ValarTools.MANUAL_REF")
     LEGACY_FRAMERATE = 25
     LEGACY_STIM_FRAMERATE = 25
+    _run_rows: Dict[int, Runs] = {}
+    _run_tomls: Dict[int, NestedDotDict] = {}
+    _run_generations: Dict[int, DataGeneration] = {}
 
     @classmethod
     def required_sensors(cls, generation: DataGeneration) -> Mapping[SensorNames, Sensors]:
@@ -54,8 +94,7 @@ class ValarTools:
         Returns:
 
         """
-        gens = {x["name"]: x for x in InternalTools.load_resource("core", "generations.json")}
-        return dict(Sensors.fetch_all(gens[generation.name]["sensors"]))
+        return dict(Sensors.fetch_all(_generations.get()[generation.name]["sensors"]))
 
     @classmethod
     def standard_sensor(cls, sensor_name: SensorNames, generation: DataGeneration) -> Sensors:
@@ -68,8 +107,8 @@ class ValarTools:
         Returns:
 
         """
-        gens = {x["name"]: x for x in InternalTools.load_resource("core", "generations.json")}
-        return Sensors.fetch(gens[generation.name]["sensors"][sensor_name.json_name])
+        sensors = _generations.get()[generation.name]["sensors"]
+        return Sensors.fetch(sensors[sensor_name.json_name])
 
     @classmethod
     def convert_sensor_data_from_bytes(
@@ -141,7 +180,7 @@ class ValarTools:
     @classmethod
     def stimulus_display_colors(cls) -> Mapping[str, str]:
         """ """
-        return copy(_stimulus_display_colors)
+        return dict(_stimulus_display_colors)
 
     @classmethod
     def stimulus_display_color(cls, stim: Union[int, str, Stimuli]) -> str:
@@ -592,10 +631,96 @@ class ValarTools:
             batch_id = batch_id.id
         return "oc_" + Tools.hash_hex(batch_id, "sha1")[:11]
 
+    @classmethod
+    def cache_runs(cls, runs: RunsLike, tomls: bool = True) -> None:
+        """
+        Loads the runs, their saurons, and their TOML config files in at most two queries,
+        so that ``generation_of``, ``toml_data``, and ``frames_per_second`` don't need to query for them.
+        Anything already cached is skipped.
+
+        Args:
+            runs: Run IDs, names, tags, instances, or submission hashes or instances
+            tomls: Also load the TOML config files, which are needed for ``toml_data`` and ``frames_per_second``
+
+        Raises:
+            ValarLookupError: If a run ID does not exist
+
+        """
+        run_ids = cls._run_ids(runs)
+        needed = [r for r in run_ids if r not in cls._run_rows]
+        if len(needed) > 0:
+            rows = list(
+                Runs.select(Runs, SauronConfigs, Saurons)
+                .join(SauronConfigs)
+                .join(Saurons)
+                .where(Runs.id << needed)
+            )
+            missing = set(needed) - {r.id for r in rows}
+            if len(missing) > 0:
+                raise ValarLookupError(f"No runs {missing}")
+            for row in rows:
+                cls._run_rows[row.id] = row
+            logger.debug(f"Cached {len(rows)} runs")
+        if tomls:
+            rows = [
+                cls._run_rows[r]
+                for r in run_ids
+                if r not in cls._run_tomls and cls._run_rows[r].config_file_id is not None
+            ]
+            if len(rows) > 0:
+                config_ids = {r.config_file_id for r in rows}
+                parsed = {
+                    c.id: NestedDotDict.parse_toml(c.toml_text)
+                    for c in ConfigFiles.select().where(ConfigFiles.id << config_ids)
+                }
+                for row in rows:
+                    cls._run_tomls[row.id] = parsed[row.config_file_id]
+
+    @classmethod
+    def invalidate_runs(cls, *runs: RunLike) -> None:
+        """
+        Discards what ``cache_runs`` loaded for these runs, or for all runs if none are passed.
+
+        Args:
+            *runs: Run IDs, names, tags, instances, or submission hashes or instances
+
+        """
+        if len(runs) == 0:
+            run_ids = list(cls._run_rows.keys())
+        else:
+            run_ids = cls._run_ids(runs)
+        for run_id in run_ids:
+            cls._run_rows.pop(run_id, None)
+            cls._run_tomls.pop(run_id, None)
+            cls._run_generations.pop(run_id, None)
+
+    @classmethod
+    def _cached_run(cls, run: RunLike) -> Runs:
+        """
+        Gets a run, with its sauron config and sauron, from the cache, loading it first if needed.
+        """
+        run_id = Tools.only(cls._run_ids([run]))
+        if run_id not in cls._run_rows:
+            cls.cache_runs([run_id], tomls=False)
+        return cls._run_rows[run_id]
+
+    @classmethod
+    def _run_ids(cls, runs: RunsLike) -> Sequence[int]:
+        """
+        Gets run IDs, querying only for runs passed as something other than an ID or instance.
+        """
+        if not Tools.is_true_iterable(runs):
+            runs = [runs]
+        runs = list(runs)
+        if all(isinstance(r, (int, np.integer, Runs)) for r in runs):
+            return [r.id if isinstance(r, Runs) else int(r) for r in runs]
+        return [r.id for r in Runs.fetch_all(runs)]
+
     @classmethod
     def generation_of(cls, run: RunLike) -> DataGeneration:
         """
         Determines the "data generation" of the run, specific to Kokel Lab data. See `DataGeneration` for more details.
+        The result is kept in memory (see ``cache_runs``).
 
         Args:
             run: A runs instance, ID, name, tag, or submission hash or instance
@@ -604,24 +729,30 @@ class ValarTools:
             A DataGeneration instance
 
         """
-        run = ValarRuns.fetch(run)
+        run = cls._cached_run(run)
+        if run.id not in cls._run_generations:
+            cls._run_generations[run.id] = cls._generation_of(run)
+        return cls._run_generations[run.id]
+
+    @classmethod
+    def _generation_of(cls, run: Runs) -> DataGeneration:
+        """
+
+
+        Args:
+            run: A runs instance with its sauron config and sauron loaded
+
+        Returns:
+
+        """
         sauronx = run.submission_id is not None
-        generations: Sequence[Dict[str, Any]] = InternalTools.load_resource(
-            "core", "generations.json"
-        )
         # noinspection PyChainedComparisons
         matches = {
             x["name"]
-            for x in generations
+            for x in _generations.get().values()
             if sauronx == x["has_submission"]
-            and (
-                x["start_date"] == ""
-                or run.datetime_run >= datetime.strptime(x["start_date"], "%Y-%m-%d")
-            )
-            and (
-                x["end_date"] == ""
-                or run.datetime_run <= datetime.strptime(x["end_date"], "%Y-%m-%d")
-            )
+            and (x["start_date"] is None or run.datetime_run >= x["start_date"])
+            and (x["end_date"] is None or run.datetime_run <= x["end_date"])
             and run.sauron_config.sauron.name in x["saurons"]
         }
         if len(matches) > 1:
@@ -643,22 +774,48 @@ class ValarTools:
             The set of features involved in a given run.
 
         """
-        run = ValarRuns.fetch(run)
-        pt = run.plate.plate_type
-        n_wells = pt.n_rows * pt.n_columns
-        features = set()
-        for feature in Features.select():
-            got = len(
-                WellFeatures.select(
-                    WellFeatures.id, WellFeatures.type_id, WellFeatures.well, Wells.id, Wells.run_id
-                )
-                .join(Wells)
-                .where(Wells.run_id == run)
-                .where(WellFeatures.type_id == feature.id)
+        run_id = Tools.only(cls._run_ids([run]))
+        return cls.features_on_runs([run_id])[run_id]
+
+    @classmethod
+    def features_on_runs(cls, runs: RunsLike) -> Mapping[int, Set[str]]:
+        """
+        Finds all unique features involved in all the wells for each of any number of runs, in three queries.
+
+        Args:
+            runs: Run IDs, names, tags, instances, or submission hashes or instances
+
+        Returns:
+            A dict mapping each run ID to the set of features involved in it
+
+        """
+        run_ids = cls._run_ids(runs)
+        if len(run_ids) == 0:
+            return {}
+        n_wells = {
+            run_id: n_rows * n_columns
+            for run_id, n_rows, n_columns in Runs.select(
+                Runs.id, PlateTypes.n_rows, PlateTypes.n_columns
+            )
+            .join(Plates)
+            .join(PlateTypes)
+            .where(Runs.id << run_ids)
+            .tuples()
+        }
+        feature_names = {f.id: f.name for f in Features.select()}
+        features = {run_id: set() for run_id in run_ids}
+        query = (
+            WellFeatures.select(
+                Wells.run_id, WellFeatures.type_id, peewee.fn.COUNT(WellFeatures.id)
             )
-            if got == n_wells:
-                features.add(feature.name)
-            assert got == 0 or got == n_wells, f"{got} != {n_wells}"
+            .join(Wells)
+            .where(Wells.run_id << run_ids)
+            .group_by(Wells.run_id, WellFeatures.type_id)
+            .tuples()
+        )
+        for run_id, feature_id, got in query:
+            assert got == n_wells[run_id], f"{got} != {n_wells[run_id]}"
+            features[run_id].add(feature_names[feature_id])
         return features
 
     @classmethod
@@ -673,15 +830,38 @@ class ValarTools:
             The set of sensor names that have sensor data for a given run.
 
         """
-        run = ValarRuns.fetch(run)
-        return {
-            sd.sensor
-            for sd in SensorData.select(SensorData.sensor, SensorData.run, SensorData.id, Runs.id)
-            .join(Runs)
-            .switch(SensorData)
-            .join(Sensors)
-            .where(Runs.id == run.id)
-        }
+        run_id = Tools.only(cls._run_ids([run]))
+        return cls.sensors_on_runs([run_id])[run_id]
+
+    @classmethod
+    def sensors_on_runs(cls, runs: RunsLike) -> Mapping[int, Set[Sensors]]:
+        """
+        Finds all unique sensors that have sensor data for each of any number of runs, in two queries.
+
+        Args:
+            runs: Run IDs, names, tags, instances, or submission hashes or instances
+
+        Returns:
+            A dict mapping each run ID to the set of sensors with data for it
+
+        """
+        run_ids = cls._run_ids(runs)
+        if len(run_ids) == 0:
+            return {}
+        pairs = list(
+            SensorData.select(SensorData.run_id, SensorData.sensor_id)
+            .where(SensorData.run_id << run_ids)
+            .distinct()
+            .tuples()
+        )
+        sensors = {}
+        if len(pairs) > 0:
+            sensor_ids = {sensor_id for _, sensor_id in pairs}
+            sensors = {s.id: s for s in Sensors.select().where(Sensors.id << sensor_ids)}
+        on = {run_id: set() for run_id in run_ids}
+        for run_id, sensor_id in pairs:
+            on[run_id].add(sensors[sensor_id])
+        return on
 
     @classmethod
     def looks_like_submission_hash(cls, submission_hash: str) -> bool:
@@ -947,6 +1127,7 @@ class ValarTools:
     def fetch_toml(cls, run: Union[int, str, Runs, Submissions]) -> NestedDotDict:
         """
         Parse NestedDotDict from config_files.
+        Same as ``toml_data``.
 
         Args:
             run:
@@ -954,9 +1135,7 @@ class ValarTools:
         Returns:
 
         """
-        run = ValarRuns.fetch(run)
-        sxt = ConfigFiles.fetch(run.config_file_id)
-        return NestedDotDict.parse_toml(sxt.toml_text)
+        return cls.toml_data(run)
 
     @classmethod
     def parse_toml(cls, sxt: Union[ConfigFiles, Runs]) -> NestedDotDict:
@@ -1110,17 +1289,24 @@ class ValarTools:
     @classmethod
     def toml_data(cls, run: RunLike) -> NestedDotDict:
         """
-
+        Gets the parsed SauronX TOML config of a run.
+        The result is kept in memory (see ``cache_runs``), so it should not be modified.
 
         Args:
             run: RunLike:
 
         Returns:
 
+        Raises:
+            SauronxOnlyError: If the run is legacy and has no config file
+
         """
-        run = ValarRuns.fetch(run)
-        t = ConfigFiles.fetch(run.config_file_id)
-        return NestedDotDict.parse_toml(t.toml_text)
+        run = cls._cached_run(run)
+        if run.config_file_id is None:
+            raise SauronxOnlyError(f"No config files are stored for legacy data (run r{run.id})")
+        if run.id not in cls._run_tomls:
+            cls.cache_runs([run.id])
+        return cls._run_tomls[run.id]
 
     @classmethod
     def toml_item(cls, run: RunLike, item: str) -> Any:
@@ -1145,6 +1331,7 @@ class ValarTools:
             To get the emperical framerate for PointGrey data, download the timestamps. (The emperical framerate is unknown for pre-PointGrey data.)
         For legacy data, always returns 25. Note that for some MGH data it might actually be a little slower or faster.
         For SauronX data, fetches the TOML data from Valar and looks up sauron.hardware.camera.frames_per_second .
+        The TOML is kept in memory (see ``cache_runs``).
 
         Args:
           run: A run ID, name, tag, instance, or submission hash or instance
@@ -1153,11 +1340,10 @@ class ValarTools:
           A Python int
 
         """
-        run = Runs.fetch(run)
-        if run.submission is None:
-            return 25
-        t = ConfigFiles.fetch(run.config_file_id)
-        toml = NestedDotDict.parse_toml(t.toml_text)
+        run = cls._cached_run(run)
+        if run.submission_id is None:
+            return cls.LEGACY_FRAMERATE
+        toml = cls.toml_data(run)
         return toml.exactly("sauron.hardware.camera.frames_per_second", int)
 
     @classmethod
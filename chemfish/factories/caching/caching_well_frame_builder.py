@@ -3,7 +3,7 @@ from __future__ import annotations
 from chemfish.core.core_imports import *
 from chemfish.core.valar_singleton import *
 from chemfish.model.features import *
-from chemfish.construction.wf_builders import *
+from chemfish.factories.well_frame_builders import *
 
 
 @abcd.auto_eq()
@@ -14,6 +14,10 @@ class CachingWellFrameBuilder(WellFrameBuilder):
     The FrameCache saves WellFrames for full runs, but WellFrameBuilder will return only the wells of interest.
     If include_full_runs is set, WellFrameBuilder will return every well on runs where at least one well was queried.
 
+    Builders created with ``runs`` or ``wells`` (and no additional WHEREs) resolve which runs to load
+    from the cache's index instead of querying Valar.
+    Valar is queried only for wells on runs that are not indexed, and to download runs that are not cached.
+
     """
 
     def __init__(self, cache: WellCache, before_datetime: Optional[datetime]):
@@ -27,6 +31,8 @@ class CachingWellFrameBuilder(WellFrameBuilder):
         self._cache = cache
         self._include_full_runs = False
         self._feature = cache.feature
+        self._run_ids: Optional[Set[int]] = None
+        self._well_ids: Optional[Set[int]] = None
 
     # noinspection PyMethodOverriding
     @classmethod
@@ -44,10 +50,11 @@ class CachingWellFrameBuilder(WellFrameBuilder):
 
         """
         if isinstance(wells, str) or isinstance(wells, int) or isinstance(wells, Wells):
-            wells = {Wells.fetch(wells).id}
-        else:
-            wells = {Wells.fetch(w).id for w in wells}
+            wells = [wells]
+        # avoid querying if we already have IDs
+        wells = set(InternalTools.fetch_all_ids_unchecked(Wells, list(wells)))
         wfb = cls(cache, None).where(Wells.id << wells)
+        wfb._well_ids = wells
         return wfb
 
     # noinspection PyMethodOverriding
@@ -73,11 +80,12 @@ class CachingWellFrameBuilder(WellFrameBuilder):
             or isinstance(runs, Runs)
             or isinstance(runs, Submissions)
         ):
-            runs = {Runs.fetch(runs).id}
-        else:
-            runs = {Runs.fetch(r).id for r in runs}
+            runs = [runs]
+        # avoid querying if we already have IDs
+        runs = set(Runs.fetch_ids_unchecked(list(runs)))
         wfb = cls(cache, None).where(Runs.id << runs)
         wfb._required_runs = runs
+        wfb._run_ids = runs
         return wfb
 
     def include_full_runs(self) -> CachingWellFrameBuilder:
@@ -120,17 +128,21 @@ class CachingWellFrameBuilder(WellFrameBuilder):
         Returns:
 
         """
-        query = WellFrameQuery().build(WellFrameQuery.no_fields())
-        for where in self._wheres:
-            query = query.where(where)
-        query = query.order_by(*WellFrameQuery.sort_order())
-        logger.debug(f"Running initial query in {self.__class__.__name__}")
-        query = list(query)
-        wells = {wt.well_id for wt in query}
-        runs = {wt.well.run for wt in query}
+        resolved = self._resolve_from_index()
+        if resolved is None:
+            query = WellFrameQuery().build(WellFrameQuery.no_fields())
+            for where in self._wheres:
+                query = query.where(where)
+            query = query.order_by(*WellFrameQuery.sort_order())
+            logger.debug(f"Running initial query in {self.__class__.__name__}")
+            query = list(query)
+            wells = {wt.well_id for wt in query}
+            runs = {wt.well.run_id for wt in query}
+        else:
+            runs, wells = resolved
         logger.debug(f"Getting full cached WellFrame for {len(runs)} runs")
         df = self._cache.with_dtype(self._dtype).load_multiple(runs)
-        if not self._include_full_runs:
+        if not self._include_full_runs and wells is not None:
             df = WellFrame.of(df[df["well"].isin(wells)])
         if self._compound_namer is not None:
             df = df.with_new_compound_names(self._compound_namer)
@@ -143,5 +155,55 @@ class CachingWellFrameBuilder(WellFrameBuilder):
         df = self._internal_restrict_to_gen(df)
         return df.sort_standard()
 
+    def _resolve_from_index(self) -> Optional[Tup[Set[int], Optional[Set[int]]]]:
+        """
+        Finds the runs and wells to load without running the initial query, if possible.
+        This is possible only for builders made with ``runs`` or ``wells`` that have no other WHERE clauses.
+        For ``wells``, Valar is queried only for wells whose runs are missing from the index.
+
+        Returns:
+            None if the initial query is needed; otherwise a tuple of (run IDs, well IDs or None for all wells)
+
+        """
+        if len(self._wheres) != 1:
+            return None
+        if self._run_ids is not None:
+            # we don't need to know the wells: we're taking every well on the runs
+            return set(self._run_ids), None
+        if self._well_ids is not None:
+            run_of = self._cache.index.runs_of_wells(self._well_ids)
+            missing = {w for w in self._well_ids if w not in run_of}
+            runs = set(run_of.values())
+            if len(missing) > 0:
+                logger.debug(f"Querying runs for {len(missing)} wells missing from the cache index")
+                runs.update(
+                    w.run_id for w in Wells.select(Wells.id, Wells.run).where(Wells.id << missing)
+                )
+            return runs, set(self._well_ids)
+        return None
+
+    def _internal_restrict_to_gen(self, df: WellFrame) -> WellFrame:
+        """
+        Like ``WellFrameBuilder._internal_restrict_to_gen``, but uses generations in the cache index when available.
+
+        Args:
+            df: WellFrame:
+
+        Returns:
+
+        """
+        if self._generation is None:
+            return df
+        good_runs = set()
+        for run in df.unique_runs():
+            entry = self._cache.index.get(run)
+            if entry is not None and entry["generation"] is not None:
+                generation = DataGeneration.of(entry["generation"])
+            else:
+                generation = ValarTools.generation_of(run)
+            if generation is self._generation:
+                good_runs.add(run)
+        return df.with_run(good_runs)
+
 
 __all__ = ["CachingWellFrameBuilder"]
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import threading
+
+from chemfish.core.core_imports import *
+from chemfish.factories.caches import AChemfishCache
+from chemfish.model.well_frames import WellFrame
+
+
+class MemoryCache(AChemfishCache):
+    """
+    A size-bounded, least-recently-used in-memory facade in front of an on-disk cache.
+    Can wrap any AChemfishCache, such as a WellCache, SensorCache, or StimframeCache.
+    The bound is in bytes, estimated from the loaded values, not in number of entries.
+    Methods not defined here (ex ``load_photosensor`` or ``with_dtype``) are delegated to the wrapped cache,
+    so they bypass the memory layer.
+
+    WARNING:
+        Loaded values are returned without copying, so modifying one in-place modifies the cached value.
+
+    Attributes:
+        cache: The wrapped on-disk cache
+        max_bytes: The maximum estimated number of bytes to hold in memory
+        hits: The number of loads served from memory
+        misses: The number of loads that were delegated to the wrapped cache
+        evictions: The number of values removed to stay under ``max_bytes``
+
+    """
+
+    def __init__(self, cache: AChemfishCache, max_bytes: int = 2 * 1024 ** 3):
+        """
+
+        Args:
+            cache: The on-disk cache to wrap
+            max_bytes: The maximum estimated number of bytes to hold in memory
+        """
+        self.cache = cache
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._n_bytes = 0
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.RLock()
+
+    @property
+    def cache_dir(self) -> Path:
+        """ """
+        return self.cache.cache_dir
+
+    @property
+    def n_bytes(self) -> int:
+        """The estimated number of bytes currently held in memory."""
+        return self._n_bytes
+
+    @abcd.overrides
+    def path_of(self, key) -> Path:
+        """
+
+
+        Args:
+            key:
+
+        Returns:
+
+        """
+        return self.cache.path_of(key)
+
+    @abcd.overrides
+    def key_from_path(self, path: PathLike):
+        """
+
+
+        Args:
+            path: PathLike:
+
+        Returns:
+
+        """
+        return self.cache.key_from_path(path)
+
+    @abcd.overrides
+    def download(self, *keys) -> None:
+        """
+
+
+        Args:
+            *keys:
+
+        """
+        self.cache.download(*keys)
+
+    @abcd.overrides
+    def contains(self, key) -> bool:
+        """
+        Returns whether the key is in memory or in the wrapped cache.
+
+        Args:
+            key:
+
+        Returns:
+
+        """
+        with self._lock:
+            if self._normalize(key) in self._items:
+                return True
+        return self.cache.contains(key)
+
+    @abcd.overrides
+    def load(self, key):
+        """
+        Returns the value from memory if it's there; otherwise loads it from the wrapped cache and keeps it.
+
+        Args:
+            key:
+
+        Returns:
+
+        """
+        normalized = self._normalize(key)
+        with self._lock:
+            if normalized in self._items:
+                self._items.move_to_end(normalized)
+                self.hits += 1
+                return self._items[normalized][0]
+            self.misses += 1
+        value = self.cache.load(key)
+        self._put(normalized, value)
+        return value
+
+    def load_multiple(self, keys):
+        """
+        Loads multiple runs for a wrapped AWellCache, using memory for each run where possible.
+        Runs missing from the wrapped cache are downloaded together first.
+
+        Args:
+            keys: RunsLike:
+
+        Returns:
+            The concatenated WellFrame
+
+        """
+        if not hasattr(self.cache, "load_multiple"):
+            raise UnsupportedOpError(f"{self.cache} does not support load_multiple")
+        keys = Runs.fetch_all(keys)
+        with self._lock:
+            missing = [k for k in keys if self._normalize(k) not in self._items]
+        self.cache.download(*missing)
+        return WellFrame.concat(*[self.load(k) for k in keys])
+
+    @abcd.overrides
+    def delete(self, key) -> None:
+        """
+        Removes the key from memory and deletes it from the wrapped cache.
+
+        Args:
+            key:
+
+        """
+        self.forget(key)
+        self.cache.delete(key)
+
+    def forget(self, key) -> None:
+        """
+        Removes the key from memory only.
+
+        Args:
+            key:
+
+        """
+        with self._lock:
+            normalized = self._normalize(key)
+            if normalized in self._items:
+                self._n_bytes -= self._items.pop(normalized)[1]
+
+    def clear(self) -> None:
+        """
+        Removes everything from memory, leaving the wrapped cache alone.
+        Does not reset the counters.
+        """
+        with self._lock:
+            self._items.clear()
+            self._n_bytes = 0
+
+    def stats(self) -> Mapping[str, int]:
+        """
+        Returns the hit, miss, and eviction counts, along with the current number of entries and bytes.
+        """
+        with self._lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                n_items=len(self._items),
+                n_bytes=self._n_bytes,
+                max_bytes=self.max_bytes,
+            )
+
+    def _put(self, normalized, value) -> None:
+        n_bytes = self.sizeof(value)
+        if n_bytes > self.max_bytes:
+            logger.debug(f"Not keeping {normalized} in memory: {n_bytes} > {self.max_bytes} bytes")
+            return
+        with self._lock:
+            if normalized in self._items:
+                self._n_bytes -= self._items.pop(normalized)[1]
+            self._items[normalized] = (value, n_bytes)
+            self._n_bytes += n_bytes
+            while self._n_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._items.popitem(last=False)
+                self._n_bytes -= evicted_bytes
+                self.evictions += 1
+
+    @classmethod
+    def _normalize(cls, key):
+        """
+        Makes keys that refer to the same row by instance or ID equal, without querying.
+        """
+        if isinstance(key, (tuple, list)):
+            return tuple(cls._normalize(k) for k in key)
+        if isinstance(key, peewee.Model):
+            return key.id
+        if isinstance(key, Path):
+            return str(key)
+        return key
+
+    @classmethod
+    def sizeof(cls, value) -> int:
+        """
+        Estimates the number of bytes a value uses.
+        For DataFrames, this is the shallow memory usage, so object-typed columns count as pointers.
+
+        Args:
+            value: Any value returned by a cache
+
+        Returns:
+            The estimated number of bytes
+
+        """
+        if isinstance(value, pd.DataFrame):
+            return int(value.memory_usage(index=True, deep=False).sum())
+        if isinstance(value, np.ndarray):
+            return int(value.nbytes)
+        if isinstance(value, (bytes, bytearray)):
+            return len(value)
+        data = getattr(value, "data", None)
+        if data is not None and data is not value:
+            return cls.sizeof(data) + sys.getsizeof(value)
+        return sys.getsizeof(value)
+
+    def __getattr__(self, item):
+        # only called when normal lookup fails
+        if item in {"cache", "_items", "_lock"}:
+            raise AttributeError(item)
+        return getattr(self.cache, item)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.cache}, {self._n_bytes}/{self.max_bytes} bytes, {len(self._items)} items)"
+
+    def __str__(self):
+        return repr(self)
+
+    def __eq__(self, other):
+        return self is other
+
+    def __hash__(self):
+        return id(self)
+
+
+__all__ = ["MemoryCache"]
@@ -1,3 +1,5 @@
+import dataclasses
+
 import soundfile
 from PIL import Image
 
@@ -26,6 +28,9 @@ class SensorCache(ASensorCache):
     A cache for sensor data from a given run.
     """
 
+    # TODO figure out why 1024
+    MICROPHONE_SAMPLES_PER_MILLIS_VALUE = 1024
+
     def __init__(self, cache_dir: PathLike = DEFAULT_CACHE_DIR, cache_waveform: bool = True):
         self._cache_dir = Tools.prepped_dir(cache_dir)
         self.cache_waveform: bool = cache_waveform
@@ -217,19 +222,56 @@ class SensorCache(ASensorCache):
         path = self.path_of((SensorNames.MICROPHONE_WAVEFORM, run))
         if path.exists():
             return Tools.unpkl(path)
-        mic = self._load_audio(run)
         t0 = time.monotonic()
         logger.debug(f"Making the waveform for the microphone recording of {run.id}")
-        waveform_sensor = mic.waveform(1000)
+        waveform_sensor = self._stream_audio_waveform(run, 1000)
         if self.cache_waveform:
             Tools.pkl(waveform_sensor, str(path))
         logger.debug(f"Made the waveform for {run.id}. Took {round(time.monotonic()-t0, 1)} s.")
         return waveform_sensor
 
+    def _stream_audio_waveform(
+        self, run: Runs, downsample_to_hertz: int
+    ) -> MicrophoneWaveformSensor:
+        """
+        Gives the same result as ``self._load_audio(run).waveform(downsample_to_hertz)``,
+        but reads the recording in blocks, downsampling as it goes, so the full recording is never in memory.
+        """
+        self._download_raw(SensorNames.RAW_MICROPHONE_RECORDING, run)
+        raw_millis = self._download_raw(SensorNames.RAW_MICROPHONE_MILLIS, run)
+        bt_data = self.bt_data(run)
+        # the same trimming as MicrophoneSensor.slice_ms(None, None),
+        # but without repeating each millis value for all of its samples
+        n = self.MICROPHONE_SAMPLES_PER_MILLIS_VALUE
+        start = n * np.searchsorted(raw_millis, bt_data.start_ms, side="left")
+        stop = n * np.searchsorted(raw_millis, bt_data.end_ms, side="right")
+        waveform = MicrophoneWaveform.read_chunk_mean(
+            self.path_of((SensorNames.RAW_MICROPHONE_RECORDING, run)),
+            downsample_to_hertz,
+            start,
+            stop,
+            name="r" + str(run.id),
+            description=run.name,
+        )
+        waveform = dataclasses.replace(waveform, path=None).normalize()
+        n_samples = int(np.round(waveform.n_ms))
+        ideal_timing_data = np.linspace(
+            raw_millis[start // n], raw_millis[(stop - 1) // n], n_samples
+        )
+        return MicrophoneWaveformSensor(
+            run=run,
+            waveform=waveform,
+            timing_data=ideal_timing_data,
+            battery_data=bt_data,
+            samples_per_sec=downsample_to_hertz,
+        )
+
     def _load_audio(self, run: Runs) -> MicrophoneSensor:
         self._download_raw(SensorNames.RAW_MICROPHONE_RECORDING, run)
-        # TODO figure out why 1024
-        millis = np.repeat(self._download_raw(SensorNames.RAW_MICROPHONE_MILLIS, run), 1024)
+        millis = np.repeat(
+            self._download_raw(SensorNames.RAW_MICROPHONE_MILLIS, run),
+            self.MICROPHONE_SAMPLES_PER_MILLIS_VALUE,
+        )
         data, sampling_rate = soundfile.read(
             self.path_of((SensorNames.RAW_MICROPHONE_RECORDING, run))
         )
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+import shutil
+import threading
 import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from chemfish.core.core_imports import *
 from chemfish.factories.caches import AWellCache, ASensorCache
@@ -11,6 +14,124 @@ from chemfish.construction.wf_builders import *
 FeatureTypeLike = Union[None, int, str, Features, FeatureType]
 
 DEFAULT_CACHE_DIR = chemfish_env.cache_dir / "wells"
+DEFAULT_COLUMNAR_CACHE_DIR = chemfish_env.cache_dir / "wells-columnar"
+
+# HDF5 writes (and Tools.silenced) are not thread-safe
+_SAVE_LOCK = threading.Lock()
+
+
+class WellCacheIndex:
+    """
+    An on-disk index of the runs in a WellCache, stored as JSON in the cache directory.
+    Maps each run ID to its well IDs, battery ID, data generation, and insertion datetime,
+    so that requests for cached runs or wells can be resolved without querying Valar.
+    Runs cached before the index existed are added when they are next loaded.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, path: PathLike):
+        """
+
+        Args:
+            path: The path to the JSON file
+        """
+        self.path = Path(path)
+        self._runs: Optional[Dict[int, Mapping[str, Any]]] = None
+
+    def get(self, run: int) -> Optional[Mapping[str, Any]]:
+        """
+        Returns the entry for a run ID, or None if it's not indexed.
+        """
+        return self._entries().get(run)
+
+    def wells_of(self, run: int) -> Sequence[int]:
+        """
+        Returns the well IDs on an indexed run.
+        """
+        return self._entries()[run]["wells"]
+
+    def runs_of_wells(self, wells: Iterable[int]) -> Mapping[int, int]:
+        """
+        Maps well IDs to run IDs, omitting wells that are not on indexed runs.
+        """
+        wells = set(wells)
+        return {
+            well: run
+            for run, entry in self._entries().items()
+            for well in entry["wells"]
+            if well in wells
+        }
+
+    def add(
+        self,
+        df: WellFrame,
+        generations: Optional[Mapping[int, str]] = None,
+        runs: Optional[Collection[int]] = None,
+    ) -> None:
+        """
+        Adds (or replaces) the entries for runs in a WellFrame.
+
+        Args:
+            df: A WellFrame containing full runs
+            generations: Optionally, a dict mapping run IDs to DataGeneration names
+            runs: If set, only add these runs
+
+        """
+        generations = {} if generations is None else generations
+        meta = df.index.to_frame(index=False)
+        new_entries = {}
+        for run, group in meta.groupby("run", sort=False):
+            run = int(run)
+            if runs is not None and run not in runs:
+                continue
+            new_entries[run] = dict(
+                wells=[int(w) for w in group["well"]],
+                battery_id=int(group["battery_id"].iloc[0]),
+                generation=generations.get(run),
+                created=pd.Timestamp(group["datetime_inserted"].iloc[0]).isoformat(),
+            )
+        self._update(new_entries, [])
+
+    def remove(self, run: int) -> None:
+        """
+        Removes a run from the index, if it's there.
+        """
+        self._update({}, [run])
+
+    def _update(self, new_entries: Mapping[int, Mapping[str, Any]], removed: Sequence[int]) -> None:
+        with self._lock:
+            # re-read so that we don't clobber other instances' changes
+            self._runs = None
+            runs = dict(self._entries())
+            runs.update(new_entries)
+            for run in removed:
+                runs.pop(run, None)
+            tmp = self.path.parent / f".{self.path.name}.{os.getpid()}-{threading.get_ident()}.tmp"
+            tmp.write_text(json.dumps({str(k): v for k, v in runs.items()}), encoding="utf8")
+            os.replace(str(tmp), str(self.path))
+            self._runs = runs
+
+    def _entries(self) -> Mapping[int, Mapping[str, Any]]:
+        if self._runs is None:
+            if self.path.exists():
+                data = json.loads(self.path.read_text(encoding="utf8"))
+                self._runs = {int(k): v for k, v in data.items()}
+            else:
+                self._runs = {}
+        return self._runs
+
+    def __contains__(self, run: int) -> bool:
+        return run in self._entries()
+
+    def __len__(self) -> int:
+        return len(self._entries())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.path})"
+
+    def __str__(self):
+        return repr(self)
 
 
 @abcd.auto_eq()
@@ -18,10 +139,18 @@ DEFAULT_CACHE_DIR = chemfish_env.cache_dir / "wells"
 class WellCache(AWellCache):
     """
     A cache for WellFrames with a particular feature.
+    Missing runs are downloaded in batches of ``batch_size`` runs,
+    and up to ``n_connections`` batches are fetched concurrently, each with its own database connection.
+    Each run is written to a temporary file and then renamed, so interrupted downloads never leave partial files.
     """
 
     def __init__(
-        self, feature: FeatureTypeLike, cache_dir: PathLike = DEFAULT_CACHE_DIR, dtype=None
+        self,
+        feature: FeatureTypeLike,
+        cache_dir: PathLike = DEFAULT_CACHE_DIR,
+        dtype=None,
+        batch_size: int = 10,
+        n_connections: int = chemfish_env.n_cores,
     ):
         """
 
@@ -29,6 +158,8 @@ class WellCache(AWellCache):
             feature:
             cache_dir:
             dtype:
+            batch_size: The number of runs to fetch in one WellFrameBuilder query
+            n_connections: The maximum number of batches to fetch concurrently
 
         """
         self.feature = FeatureTypes.of(feature) if feature is not None else None
@@ -36,6 +167,9 @@ class WellCache(AWellCache):
         self._cache_dir = Tools.prepped_dir(cache_dir)
         self._dtype = dtype
         self._sensor_cache = None
+        self.batch_size = batch_size
+        self.n_connections = n_connections
+        self.index = WellCacheIndex(self._cache_dir / "index.json")
 
     @abcd.overrides
     def with_sensor_cache(self, sensor_cache: Optional[ASensorCache] = None) -> WellCache:
@@ -63,7 +197,15 @@ class WellCache(AWellCache):
         Returns:
 
         """
-        return WellCache(self.feature, self._cache_dir, dtype)
+        cache = self.__class__(
+            self.feature,
+            self._cache_dir.parent,
+            dtype,
+            batch_size=self.batch_size,
+            n_connections=self.n_connections,
+        )
+        cache._sensor_cache = self._sensor_cache
+        return cache
 
     @property
     def cache_dir(self) -> Path:
@@ -81,8 +223,8 @@ class WellCache(AWellCache):
         Returns:
 
         """
-        run = Runs.fetch(run)
-        return self.cache_dir / (str(run.id) + ".h5")
+        run = Runs.fetch_ids_unchecked([run])[0]  # avoid query
+        return self.cache_dir / (str(run) + ".h5")
 
     @abcd.overrides
     def key_from_path(self, path: PathLike) -> RunLike:
@@ -96,7 +238,9 @@ class WellCache(AWellCache):
 
         """
         path = Path(path).relative_to(self.cache_dir)
-        return int(re.compile(r"^([0-9]+)\.h5$").fullmatch(path.name).group(1))
+        match = re.compile(r"^([0-9]+)\.h5$").fullmatch(path.name)
+        # ignore temporary files from downloads in progress
+        return None if match is None else int(match.group(1))
 
     @abcd.overrides
     def load_multiple(self, runs: RunsLike) -> WellFrame:
@@ -109,7 +253,7 @@ class WellCache(AWellCache):
         Returns:
 
         """
-        runs = Runs.fetch_all(runs)
+        runs = Runs.fetch_ids_unchecked(runs)
         self.download(*runs)
         return WellFrame.concat(*[self.load(r) for r in runs])
 
@@ -124,25 +268,81 @@ class WellCache(AWellCache):
         Returns:
 
         """
-        run = Runs.fetch(run)
+        run = Runs.fetch_ids_unchecked([run])[0]
         self.download(run)
-        return self._load(run)
+        return self._load([run])
 
     @abcd.overrides
-    def download(self, *runs: RunsLike) -> None:
+    def delete(self, run: RunLike) -> None:
         """
+        Deletes the run from the cache and the index.
 
+        Args:
+            run: RunLike:
+
+        """
+        run = Runs.fetch_ids_unchecked([run])[0]
+        super().delete(run)
+        self.index.remove(run)
+
+    @abcd.overrides
+    def download(self, *runs: RunsLike) -> None:
+        """
+        Downloads any runs that are not already cached.
+        Runs are split into batches that are fetched concurrently, and progress is logged as batches finish.
 
         Args:
             *runs: RunsLike:
 
+        Raises:
+            CacheSaveError: If any batch failed; the other batches are still saved
+
         """
-        # TODO this is broken!!!
-        runs = {r for r in Runs.fetch_all(runs) if r not in self}
-        if len(runs) > 10:
-            for r in runs:
-                self.download(r)
-        elif len(runs) > 0:
+        # only query for the runs we need to download
+        runs = [r for r in Runs.fetch_ids_unchecked(list(runs)) if r not in self]
+        if len(runs) == 0:
+            return
+        runs = Runs.fetch_all(runs)
+        batches = [runs[i : i + self.batch_size] for i in range(0, len(runs), self.batch_size)]
+        if len(batches) == 1 or self.n_connections <= 1:
+            for batch in batches:
+                self._download_batch(batch)
+            return
+        n_workers = min(self.n_connections, len(batches))
+        logger.info(f"Downloading {len(runs)} runs in {len(batches)} batches ({n_workers} at once)")
+        t0 = time.monotonic()
+        n_done, failures = 0, []
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            futures = {pool.submit(self._download_batch, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Failed to download runs {', '.join(str(r.id) for r in batch)}")
+                    failures.append(e)
+                    continue
+                n_done += len(batch)
+                elapsed = time.monotonic() - t0
+                logger.minor(
+                    f"Downloaded {n_done}/{len(runs)} runs in {round(elapsed, 1)}s"
+                    + f" ({round(60 * n_done / elapsed, 1)} runs/min)"
+                )
+        if len(failures) > 0:
+            raise CacheSaveError(
+                f"Failed to download {len(failures)} of {len(batches)} batches of runs"
+            ) from failures[0]
+
+    def _download_batch(self, runs: Sequence[Runs]) -> None:
+        """
+        Builds a WellFrame for a batch of runs and saves it.
+        Closes this thread's database connection afterward if it is not the main thread.
+
+        Args:
+            runs:
+
+        """
+        try:
             wf = (
                 WellFrameBuilder.runs(runs)
                 .with_sensor_cache(self._sensor_cache)
@@ -150,10 +350,21 @@ class WellCache(AWellCache):
                 .with_names(WellNamers.well())
                 .build()
             )
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                with Tools.silenced(no_stderr=True, no_stdout=False):
-                    self._save(wf)
+            with _SAVE_LOCK:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    with Tools.silenced(no_stderr=True, no_stdout=False):
+                        self._save(wf)
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                Runs._meta.database.close()
+
+    @classmethod
+    def _temp_path(cls, path: Path) -> Path:
+        """
+        Returns a path in the same directory (so that renaming it is atomic) that ``key_from_path`` ignores.
+        """
+        return path.parent / f".{path.name}.{os.getpid()}-{threading.get_ident()}.tmp"
 
     def _load(self, runs: RunsLike) -> WellFrame:
         """
@@ -165,7 +376,7 @@ class WellCache(AWellCache):
         Returns:
 
         """
-        runs = ValarRuns.fetch_all(runs)
+        runs = Runs.fetch_ids_unchecked(runs)
 
         def read(r):
             """"""
@@ -186,7 +397,25 @@ class WellCache(AWellCache):
 
         if len(runs) == 0:
             return WellFrame.new_empty(1)  # best attempt?
-        return WellFrame(pd.concat([read(r) for r in runs], sort=False))
+        df = WellFrame(pd.concat([read(r) for r in runs], sort=False))
+        self._index_if_needed(runs, df)
+        return df
+
+    def _index_if_needed(self, runs: Sequence[int], df: WellFrame) -> None:
+        """
+        Adds loaded runs that were cached before the index existed.
+        The generation is left unknown, which avoids querying.
+        """
+        missing = {r for r in runs if r not in self.index}
+        if len(missing) > 0:
+            self.index.add(df, runs=missing)
+
+    def _index(self, df: WellFrame) -> None:
+        """
+        Adds freshly downloaded runs to the index.
+        """
+        generations = {r: ValarTools.generation_of(r).name for r in df.unique_runs()}
+        self.index.add(df, generations)
 
     def _save(self, df: WellFrame) -> None:
         """
@@ -199,12 +428,230 @@ class WellCache(AWellCache):
         for run in df["run"].unique():
             dfc = WellFrame.vanilla(df[df["run"] == run].copy())
             saved_to = self.path_of(run)
+            tmp = self._temp_path(saved_to)
             logger.minor(f"Saving run {run} to {saved_to}")
             with Tools.silenced(no_stderr=True, no_stdout=True):
                 try:
-                    dfc.to_hdf(str(saved_to), "df")
+                    dfc.to_hdf(str(tmp), "df")
+                    os.replace(str(tmp), str(saved_to))
                 except Exception:
+                    tmp.unlink(missing_ok=True)
                     raise CacheSaveError(f"Failed to save run {str(run)} to cache at {saved_to}")
+        self._index(df)
+
+
+@abcd.auto_eq()
+@abcd.auto_repr_str()
+class ColumnarWellCache(WellCache):
+    """
+    A cache for WellFrames that stores the features and metadata of each run separately.
+    Each run gets a directory containing:
+        - ``features.npy``: The features as a single contiguous, C-ordered float32 matrix (wells × frames)
+        - ``meta.h5``:      The metadata (index) columns as a plain table, one row per well, in the same order
+
+    The feature matrices are opened with ``np.load(mmap_mode="r")``, so loading a run reads only the pages that are touched.
+    Loading a single run returns a WellFrame whose features are a read-only view on the memory-mapped file.
+    Loading multiple runs copies the features exactly once, into a single preallocated matrix.
+    """
+
+    FEATURES_FILE = "features.npy"
+    META_FILE = "meta.h5"
 
+    def __init__(
+        self,
+        feature: FeatureTypeLike,
+        cache_dir: PathLike = DEFAULT_COLUMNAR_CACHE_DIR,
+        dtype=None,
+        batch_size: int = 10,
+        n_connections: int = chemfish_env.n_cores,
+    ):
+        """
+
+        Args:
+            feature:
+            cache_dir:
+            dtype: Features will be converted when loaded using `pd.as_type(dtype)`, which makes a copy
+            batch_size:
+            n_connections:
+
+        """
+        super().__init__(
+            feature, cache_dir, dtype, batch_size=batch_size, n_connections=n_connections
+        )
+
+    @abcd.overrides
+    def path_of(self, run: RunLike) -> Path:
+        """
+        Returns the directory for the run.
+
+        Args:
+            run: RunLike:
+
+        Returns:
+
+        """
+        run = Runs.fetch_ids_unchecked([run])[0]  # avoid query
+        return self.cache_dir / str(run)
 
-__all__ = ["WellCache"]
+    @abcd.overrides
+    def key_from_path(self, path: PathLike) -> RunLike:
+        """
+
+
+        Args:
+            path: PathLike:
+
+        Returns:
+
+        """
+        path = Path(path).relative_to(self.cache_dir)
+        match = re.compile(r"^([0-9]+)$").fullmatch(path.parts[0])
+        return None if match is None else int(match.group(1))
+
+    @abcd.overrides
+    def contains(self, run: RunLike) -> bool:
+        """
+        Returns whether both the features and metadata for the run exist.
+
+        Args:
+            run: RunLike:
+
+        Returns:
+
+        """
+        path = self.path_of(run)
+        return (path / self.FEATURES_FILE).exists() and (path / self.META_FILE).exists()
+
+    @abcd.overrides
+    def delete(self, run: RunLike) -> None:
+        """
+
+
+        Args:
+            run: RunLike:
+
+        """
+        path = self.path_of(run)
+        if path.exists():
+            shutil.rmtree(str(path))
+        self.index.remove(Runs.fetch_ids_unchecked([run])[0])
+
+    @abcd.overrides
+    def load_multiple(self, runs: RunsLike) -> WellFrame:
+        """
+        Loads multiple runs, copying their memory-mapped features into a single matrix.
+        Runs with fewer features than the longest run are padded with NaN, as with ``pd.concat``.
+
+        Args:
+            runs: RunsLike:
+
+        Returns:
+
+        """
+        runs = Runs.fetch_ids_unchecked(runs)
+        self.download(*runs)
+        return self._load(runs)
+
+    def _load(self, runs: RunsLike) -> WellFrame:
+        """
+
+
+        Args:
+            runs: RunsLike:
+
+        Returns:
+
+        """
+        runs = Runs.fetch_ids_unchecked(runs)
+        if len(runs) == 0:
+            return WellFrame.new_empty(1)  # best attempt?
+        parts = [self._read(r) for r in runs]
+        if len(parts) == 1:
+            meta, features = parts[0]
+        else:
+            meta = pd.concat([m for m, _ in parts], ignore_index=True, sort=False)
+            n_features = max([f.shape[1] for _, f in parts])
+            features = np.full((len(meta), n_features), np.nan, dtype=np.float32)
+            i = 0
+            for _, f in parts:
+                features[i : i + len(f), : f.shape[1]] = f
+                i += len(f)
+        df = self._wrap(meta, features)
+        self._index_if_needed(runs, df)
+        return df
+
+    def _wrap(self, meta: pd.DataFrame, features: np.array) -> WellFrame:
+        """
+        Wraps the features in a WellFrame without copying them.
+        This avoids ``WellFrame.of``, which always copies; ``meta`` must already be in the order of a WellFrame's index.
+
+        Args:
+            meta: The index columns, with one row per well
+            features: A 2D array with one row per well
+
+        Returns:
+
+        """
+        meta = meta.copy()
+        meta["name"] = meta["well"]
+        index = pd.MultiIndex.from_frame(meta)
+        df = pd.DataFrame(features, index=index, columns=np.arange(features.shape[1]), copy=False)
+        df = WellFrame.retype(df)
+        if self._dtype is not None:
+            df = WellFrame.retype(df.astype(self._dtype))
+        return df
+
+    def _read(self, run: int) -> Tup[pd.DataFrame, np.array]:
+        """
+        Reads the metadata for a run and memory-maps its features.
+
+        Args:
+            run:
+
+        Returns:
+            A tuple of the metadata as a plain DataFrame and the memory-mapped features
+
+        """
+        path = self.path_of(run)
+        with Tools.silenced(no_stderr=True, no_stdout=True):
+            try:
+                meta = pd.read_hdf(path / self.META_FILE, "df")
+                features = np.load(str(path / self.FEATURES_FILE), mmap_mode="r")
+            except Exception as e:
+                raise CacheLoadError(f"Failed to load run {str(run)} from cache at {path}") from e
+        if len(meta) != len(features):
+            raise CacheLoadError(
+                f"Run {str(run)} has {len(meta)} metadata rows but {len(features)} feature rows at {path}"
+            )
+        return meta, features
+
+    def _save(self, df: WellFrame) -> None:
+        """
+        Saves a well-by-well dataframe as a float32 feature matrix and a metadata table, per run.
+
+        Args:
+            df:
+
+        """
+        for run in df["run"].unique():
+            dfc = df[df["run"] == run]
+            path = self.path_of(run)
+            tmp = self._temp_path(path)
+            logger.minor(f"Saving run {run} to {path}")
+            features = np.ascontiguousarray(dfc.values, dtype=np.float32)
+            meta = dfc.index.to_frame(index=False)
+            with Tools.silenced(no_stderr=True, no_stdout=True):
+                try:
+                    tmp.mkdir(parents=True)
+                    np.save(str(tmp / self.FEATURES_FILE), features)
+                    meta.to_hdf(str(tmp / self.META_FILE), "df")
+                    if path.exists():
+                        shutil.rmtree(str(path))
+                    os.replace(str(tmp), str(path))
+                except Exception as e:
+                    shutil.rmtree(str(tmp), ignore_errors=True)
+                    raise CacheSaveError(f"Failed to save run {str(run)} to cache at {path}") from e
+        self._index(df)
+
+
+__all__ = ["WellCache", "ColumnarWellCache", "WellCacheIndex"]
@@ -11,15 +11,21 @@ from chemfish.model.features import *
 from chemfish.model.sensors import *
 from chemfish.model.well_frames import *
 
-control_types = {c.name: c for c in ControlTypes.select()}
-TRASH_CONTROLS = {
-    c: control_types[c]
-    for c in {"ignore", "near-WT (-)", "no drug transfer", "low drug transfer"}
-    if c in control_types
-}
-DEFINITELY_BAD_CONTROLS = {
-    c: control_types[c] for c in {"no drug transfer", "low drug transfer"} if c in control_types
-}
+control_types = LazyMapping(lambda: {c.name: c for c in ControlTypes.select()}, "control_types")
+TRASH_CONTROLS = LazyMapping(
+    lambda: {
+        c: control_types[c]
+        for c in {"ignore", "near-WT (-)", "no drug transfer", "low drug transfer"}
+        if c in control_types
+    },
+    "TRASH_CONTROLS",
+)
+DEFINITELY_BAD_CONTROLS = LazyMapping(
+    lambda: {
+        c: control_types[c] for c in {"no drug transfer", "low drug transfer"} if c in control_types
+    },
+    "DEFINITELY_BAD_CONTROLS",
+)
 
 
 class ConcernRule:
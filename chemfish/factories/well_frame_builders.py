@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+import joblib
+
 from chemfish.core.core_imports import *
 from chemfish.namers.compound_namers import *
+from chemfish.calc.feature_interpolation import FeatureInterpolation
 from chemfish.model.features import FeatureType, FeatureTypes
 from chemfish.model.treatments import Treatments as Treatments
 from chemfish.model.well_frames import *
@@ -128,6 +131,86 @@ class WellFrameQuery:
         )
 
 
+class TimestampCache:
+    """
+    An in-memory cache of the camera and stimulus timestamps of runs.
+    Every well in a run shares the same timestamps, so each is fetched and converted only once per run.
+    If a sensor cache is attached, it is consulted before Valar.
+    An instance can be shared between WellFrameBuilders.
+
+    Attributes:
+        sensor_cache: An optional ASensorCache
+        n_fetched: The number of times timestamps were fetched from either the sensor cache or Valar
+
+    """
+
+    def __init__(self, sensor_cache: Optional[ASensorCache] = None):
+        self.sensor_cache = sensor_cache
+        self.n_fetched = 0
+        self._timestamps: Dict[Tup[int, SensorNames], np.array] = {}
+
+    def camera_millis(self, run: Runs) -> np.array:
+        """
+        Returns the millisecond timestamps of the camera frames.
+        """
+        return self.get(run, SensorNames.CAMERA_MILLIS)
+
+    def stimulus_millis(self, run: Runs) -> np.array:
+        """
+        Returns the millisecond timestamps of the stimuli.
+        """
+        return self.get(run, SensorNames.STIMULUS_MILLIS)
+
+    def get(self, run: Runs, name: SensorNames) -> np.array:
+        """
+        Returns the timestamps, fetching them if they're not already in memory.
+
+        Args:
+            run: A Runs instance
+            name: Either SensorNames.CAMERA_MILLIS or SensorNames.STIMULUS_MILLIS
+
+        Returns:
+            The millisecond timestamps
+
+        """
+        if not name.is_timing:
+            raise XValueError(f"{name} is not a timing sensor")
+        key = run.id, name
+        if key not in self._timestamps:
+            self._timestamps[key] = self._fetch(run, name)
+            self.n_fetched += 1
+        return self._timestamps[key]
+
+    def clear(self) -> None:
+        """
+        Removes all timestamps from memory.
+        """
+        self._timestamps.clear()
+
+    def _fetch(self, run: Runs, name: SensorNames) -> np.array:
+        if self.sensor_cache is not None:
+            return self.sensor_cache.load((name, run)).data
+        sensor = ValarTools.standard_sensor(name.millis_component, ValarTools.generation_of(run))
+        sensor_data: SensorData = (
+            SensorData.select()
+            .where(SensorData.sensor_id == sensor.id)
+            .where(SensorData.run_id == run.id)
+            .first()
+        )
+        if sensor_data is None:
+            raise ValarLookupError(f"No data for sensor {sensor.id} on run r{run.id}")
+        return ValarTools.convert_sensor_data_from_bytes(sensor, sensor_data.floats)
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+    def __repr__(self):
+        return f"TimestampCache({len(self)} items, sensor_cache={self.sensor_cache})"
+
+    def __str__(self):
+        return repr(self)
+
+
 class AbstractWellFrameBuilder:
     """"""
 
@@ -174,8 +257,10 @@ class WellFrameBuilder(AbstractWellFrameBuilder):
         self._limit: Optional[int] = None
         self._dtype = None
         self._sensor_cache = None
-        self._frame_timestamp_map: Dict[Runs, np.array] = {}
-        self._stim_timestamp_map: Dict[Runs, np.array] = {}
+        self._n_jobs: Optional[int] = chemfish_env.n_cores
+        self._prefer = "threads"
+        self._chunk_size = 1000
+        self._timestamp_cache = TimestampCache()
 
     @classmethod
     def wells(
@@ -212,7 +297,52 @@ class WellFrameBuilder(AbstractWellFrameBuilder):
         return wfb
 
     def with_sensor_cache(self, sensor_cache: ASensorCache) -> WellFrameBuilder:
+        """
+        Uses a sensor cache to fetch camera and stimulus timestamps for interpolated features.
+        This replaces the TimestampCache; call ``with_timestamp_cache`` afterward to share one instead.
+
+        Args:
+            sensor_cache:
+
+        Returns:
+
+        """
         self._sensor_cache = sensor_cache
+        self._timestamp_cache = TimestampCache(sensor_cache)
+        return self
+
+    def with_timestamp_cache(self, timestamp_cache: TimestampCache) -> WellFrameBuilder:
+        """
+        Uses a TimestampCache that can be shared with other builders.
+
+        Args:
+            timestamp_cache:
+
+        Returns:
+
+        """
+        self._timestamp_cache = timestamp_cache
+        return self
+
+    def with_n_jobs(
+        self, n_jobs: Optional[int], prefer: str = "threads", chunk_size: int = 1000
+    ) -> WellFrameBuilder:
+        """
+        Sets how features are decoded and interpolated.
+
+        Args:
+            n_jobs: The number of workers used to interpolate features; -1 for all cores
+            prefer: Either "threads" or "processes"; passed to ``joblib.Parallel``
+            chunk_size: The number of wells whose features are fetched and decoded together
+
+        Returns:
+
+        """
+        if prefer not in {"threads", "processes"}:
+            raise XValueError(f"prefer must be 'threads' or 'processes', not {prefer}")
+        self._n_jobs = n_jobs
+        self._prefer = prefer
+        self._chunk_size = chunk_size
         return self
 
     def where(self, where: ExpressionsLike) -> WellFrameBuilder:
@@ -402,10 +532,11 @@ class WellFrameBuilder(AbstractWellFrameBuilder):
                 well_to_treatments[t.well].append(t)
         # now get the features
         features = self._select_features(well_to_treatments)
-        # now merge the two into a dict from wells to columns
-        df = self._build_df(well_to_treatments, features)
-        self._fix_df(df)
-        df = self._transform_to_wf(df)
+        # build the meta columns and the features separately, then put them together
+        meta = self._build_meta(well_to_treatments)
+        self._fix_df(meta)
+        meta = self._transform_to_wf(meta)
+        df = WellFrame.assemble(meta, self._build_features(well_to_treatments, features))
         df = self._internal_restrict_to_gen(df)
         if self._dtype is not None:
             df = df.astype(self._dtype)
@@ -443,9 +574,9 @@ class WellFrameBuilder(AbstractWellFrameBuilder):
         """
         if self._generation is not None:
             # we already restricted the query, but now we make sure to exclude all others
-            good_runs = {
-                r for r in df.unique_runs() if ValarTools.generation_of(r) is self._generation
-            }
+            runs = df.unique_runs()
+            ValarTools.cache_runs(runs)
+            good_runs = {r for r in runs if ValarTools.generation_of(r) is self._generation}
             df = df.with_run(good_runs)
         return df
 
@@ -487,98 +618,141 @@ class WellFrameBuilder(AbstractWellFrameBuilder):
 
     def _select_features(self, well_to_treatments):
         """
-
+        Fetches, decodes, and (if needed) interpolates the features, in chunks of wells.
+        The blobs in each chunk are decoded together, and interpolation is distributed over ``n_jobs`` workers.
 
         Args:
             well_to_treatments:
 
         Returns:
+            A dict mapping well IDs to feature arrays
 
         """
         if self._feature is None:
             return None
-        return {
-            f.well.id: self._calc(f)
-            for f in WellFeatures.select(
-                WellFeatures.id, WellFeatures.well_id, WellFeatures.type_id, WellFeatures.floats
-            )
-            .where(WellFeatures.type_id == self._feature.valar_feature.id)
-            .where(WellFeatures.well_id << [w.id for w in well_to_treatments.keys()])
-        }
-
-    def _calc(self, f: WellFeatures):
-        if self._sensor_cache is not None and self._feature.is_interpolated:
-            frame_timestamps = self._get_timestamps(
-                f.well.run, SensorNames.CAMERA_MILLIS, self._frame_timestamp_map
-            )
-            stim_timestamps = self._get_timestamps(
-                f.well.run, SensorNames.STIMULUS_MILLIS, self._stim_timestamp_map
-            )
-        else:
-            frame_timestamps = None
-            stim_timestamps = None
-        return self._feature.calc(f, frame_timestamps, stim_timestamps, f.well)
-
-    def _get_timestamps(
-        self, run: Runs, name: SensorNames, mapping: Dict[Runs, np.array]
-    ) -> Optional[np.array]:
-        if run in mapping:
-            return mapping[run]
-        else:
-            sensor = ValarTools.standard_sensor(name, ValarTools.generation_of(run))
-            sensor_data: SensorData = (
-                SensorData.select()
-                .where(SensorData.sensor_id == sensor.id)
-                .where(SensorData.run_id == run.id)
-                .first()
-            )
-            return ValarTools.convert_sensor_data_from_bytes(sensor, sensor_data.floats)
+        interpolating = self._feature.is_interpolated
+        well_ids = [w.id for w in well_to_treatments.keys()]
+        run_of = {w.id: w.run.id for w in well_to_treatments.keys()}
+        interpolation = FeatureInterpolation(self._feature.valar_feature)
+        windows = {}
+        if interpolating:
+            # every well in a run shares the same timestamps
+            for run in {w.run for w in well_to_treatments.keys()}:
+                windows[run.id] = interpolation.battery_window(
+                    self._get_timestamps(run, SensorNames.CAMERA_MILLIS),
+                    self._get_timestamps(run, SensorNames.STIMULUS_MILLIS),
+                    run,
+                )
+        features = {}
+        chunks = [
+            well_ids[i : i + self._chunk_size] for i in range(0, len(well_ids), self._chunk_size)
+        ]
+        with joblib.Parallel(n_jobs=self._n_jobs, prefer=self._prefer) as parallel:
+            for chunk in chunks:
+                rows = list(
+                    WellFeatures.select(WellFeatures.well_id, WellFeatures.floats)
+                    .where(WellFeatures.type_id == self._feature.valar_feature.id)
+                    .where(WellFeatures.well_id << chunk)
+                    .tuples()
+                )
+                chunk_wells = [well_id for well_id, _ in rows]
+                arrays = self._feature.decode_blobs([blob for _, blob in rows], chunk_wells)
+                if interpolating:
+                    features.update(
+                        self._interpolate_chunk(
+                            parallel, interpolation, windows, run_of, chunk_wells, arrays
+                        )
+                    )
+                else:
+                    features.update(zip(chunk_wells, arrays))
+        return features
 
-    def _build_df(self, well_to_treatments, features):
+    def _interpolate_chunk(
+        self, parallel, interpolation, windows, run_of, well_ids, arrays
+    ) -> Mapping[int, np.array]:
         """
+        Interpolates the decoded features in a chunk.
+        Wells on the same run with the same number of frames are interpolated together as one 2D array,
+        and each of those groups is a job for ``parallel``.
 
+        Args:
+            parallel: A ``joblib.Parallel``
+            interpolation: A FeatureInterpolation
+            windows: A dict mapping run IDs to ``FeatureInterpolation.battery_window`` results
+            run_of: A dict mapping well IDs to run IDs
+            well_ids: The wells in the chunk
+            arrays: The decoded features, in the same order as ``well_ids``
+
+        Returns:
+            A dict mapping well IDs to interpolated feature arrays
+
+        """
+        groups: Dict[Tup[int, int], List[int]] = defaultdict(list)
+        for i, (well_id, arr) in enumerate(zip(well_ids, arrays)):
+            groups[(run_of[well_id], len(arr))].append(i)
+        groups = list(groups.items())
+        results = parallel(
+            joblib.delayed(interpolation.interpolate_window)(
+                np.vstack([arrays[i] for i in indices]),
+                windows[run],
+                well_ids[indices[0]],
+            )
+            for (run, _), indices in groups
+        )
+        interpolated = {}
+        for ((_, _), indices), matrix in zip(groups, results):
+            for i, row in zip(indices, matrix):
+                interpolated[well_ids[i]] = row
+        return interpolated
+
+    def _get_timestamps(self, run: Runs, name: SensorNames) -> np.array:
+        return self._timestamp_cache.get(run, name)
+
+    def _build_meta(self, well_to_treatments) -> pd.DataFrame:
+        """
+        Builds the meta columns, in the order of ``well_to_treatments``.
+        See ``WellFrameColumnTools.build_meta``.
 
         Args:
             well_to_treatments:
-            features:
 
         Returns:
+            A DataFrame with one object-typed column per column function
 
         """
+        return WellFrameColumnTools.build_meta(well_to_treatments, self._columns)
 
-        def capture(well: Wells, well_ts: Sequence[WellTreatments]) -> Mapping[int, np.array]:
-            """
-
+    def _build_features(self, well_to_treatments, features) -> pd.DataFrame:
+        """
+        Stacks the per-well feature arrays into a single preallocated 2D array.
+        Wells with fewer features than the longest are padded with NaN.
 
-            Args:
-              well: Wells:
-              well_ts: Sequence[WellTreatments]:
+        Args:
+            well_to_treatments:
+            features: A dict mapping well IDs to 1D feature arrays, or None
 
-            Returns:
+        Returns:
+            A DataFrame with one row per well (in the order of ``well_to_treatments``) and int column names
 
-            """
-            dct1 = OrderedDict()
-            for column_name, column_fn in self._columns.items():
-                dct1[column_name] = column_fn(well, well_ts)
-            if features is not None:
-                if well.id not in features:
-                    raise NoFeaturesError(
-                        f"The feature {self._feature} is not defined on well {well.id}"
-                    )
-                if self._dtype is None:
-                    dct2 = {i: mi for i, mi in enumerate(features[well.id])}
-                else:
-                    dct2 = {i: mi.astype(self._dtype) for i, mi in enumerate(features[well.id])}
-                dct1.update(dct2)
-            # noinspection PyTypeChecker
-            return dct1
-
-        return pd.DataFrame(
-            [
-                pd.Series(capture(well, treatments))
-                for well, treatments in well_to_treatments.items()
-            ]
-        )
+        """
+        if features is None:
+            return pd.DataFrame(index=np.arange(len(well_to_treatments)))
+        arrays = []
+        for well in well_to_treatments.keys():
+            if well.id not in features:
+                raise NoFeaturesError(
+                    f"The feature {self._feature} is not defined on well {well.id}"
+                )
+            arrays.append(features[well.id])
+        n_features = max([len(a) for a in arrays], default=0)
+        if self._dtype is None:
+            dtype = np.result_type(*[a.dtype for a in arrays]) if len(arrays) > 0 else np.float32
+        else:
+            dtype = self._dtype
+        matrix = np.full((len(arrays), n_features), np.nan, dtype=dtype)
+        for i, arr in enumerate(arrays):
+            matrix[i, : len(arr)] = arr
+        return pd.DataFrame(matrix, columns=np.arange(n_features), copy=False)
 
     def _fix_df(self, df) -> None:
         """
@@ -603,4 +777,10 @@ class WellFrameBuilder(AbstractWellFrameBuilder):
         return repr(self)
 
 
-__all__ = ["WellFrame", "WellFrameBuilder", "WellFrameQuery", "InvalidWellFrameError"]
+__all__ = [
+    "WellFrame",
+    "WellFrameBuilder",
+    "TimestampCache",
+    "WellFrameQuery",
+    "InvalidWellFrameError",
+]
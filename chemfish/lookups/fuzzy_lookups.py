@@ -9,7 +9,7 @@ from chemfish.lookups.mandos_lookups import *
 from chemfish.namers.compound_namers import TieredCompoundNamer
 
 look = Tools.look
-_users = {u.id: u.username for u in Users.select()}
+_users = LazyMapping(lambda: {u.id: u.username for u in Users.select()}, "users")
 _compound_namer = TieredCompoundNamer(max_length=50)
 
 
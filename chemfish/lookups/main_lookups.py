@@ -5,7 +5,7 @@ from chemfish.lookups import *
 from chemfish.namers.compound_namers import TieredCompoundNamer
 
 look = Tools.look
-_users = {u.id: u.username for u in Users.select()}
+_users = LazyMapping(lambda: {u.id: u.username for u in Users.select()}, "users")
 _compound_namer = TieredCompoundNamer(max_length=50)
 
 
@@ -633,6 +633,7 @@ class Lookups(LookupTool):
             .order_by(Runs.datetime_run)
         )
         runs = Tools.multidict(runs, "experiment_id")
+        ValarTools.cache_runs([r for rs in runs.values() for r in rs], tomls=False)
 
         def n_runs(e):
             return len(runs[e])
@@ -3,6 +3,9 @@ Ways to build iterators over comparisons between cases and controls.
 """
 from __future__ import annotations
 
+import weakref
+from multiprocessing import shared_memory
+
 from chemfish.core.core_imports import *
 from chemfish.core.tools import *
 from chemfish.model.well_frames import *
@@ -47,18 +50,191 @@ class ControlComparison:
         return hash((self.name, self.control, self.repeat, self.is_control))
 
 
-@abcd.auto_repr_str(lambda s: s == "smalldf", lambda s: s == "smalldf", lambda s: s == "smalldf")
+class SharedFeatureMatrix:
+    """
+    The features of a WellFrame, copied once into shared memory.
+    Comparisons can then refer to wells by row index (see ``TrainableCc``) instead of carrying their own features.
+    Pickling one pickles only the name of the memory block, the shape, the dtype, and the feature columns;
+    unpickling attaches to the same memory, so processes can share it without copying or pickling the data.
+    The process that created it owns the memory, which is freed by ``unlink`` or when the owner is garbage-collected.
+
+    Example:
+        Uses::
+
+            matrix = SharedFeatureMatrix.of(df)
+            it = CcIterators.vs_control(df, matrix=matrix)
+
+    """
+
+    def __init__(
+        self,
+        shm: shared_memory.SharedMemory,
+        shape: Tup[int, int],
+        dtype: np.dtype,
+        columns: Sequence[Any],
+        owner: bool,
+    ):
+        """
+
+        Args:
+            shm: The shared memory block
+            shape: The number of rows and columns
+            dtype: The numpy dtype
+            columns: The feature column names
+            owner: Unlink the memory when this is garbage-collected
+        """
+        self._shm = shm
+        self.shape, self.dtype, self.owner = tuple(shape), np.dtype(dtype), owner
+        self.columns = list(columns)
+        self._array = np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+        self._array.setflags(write=False)
+        self._finalizer = weakref.finalize(self, SharedFeatureMatrix._release, shm, owner)
+
+    @classmethod
+    def of(cls, df: WellFrame, dtype=None) -> SharedFeatureMatrix:
+        """
+        Copies the features of a WellFrame into a new block of shared memory.
+
+        Args:
+            df: The WellFrame; its rows correspond to the rows of the matrix
+            dtype: A numpy dtype, or None to keep the dtype of ``df.values``
+
+        Returns:
+            A new SharedFeatureMatrix that owns its memory
+
+        """
+        values = df.values
+        dtype = np.dtype(values.dtype if dtype is None else dtype)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, values.size * dtype.itemsize))
+        arr = np.ndarray(values.shape, dtype=dtype, buffer=shm.buf)
+        arr[:] = values
+        del arr
+        logger.debug(f"Copied {values.shape} features into shared memory {shm.name}")
+        return cls(shm, values.shape, dtype, df.columns, owner=True)
+
+    @property
+    def name(self) -> str:
+        """The name of the shared memory block."""
+        return self._shm.name
+
+    @property
+    def array(self) -> np.ndarray:
+        """A read-only view of the matrix, without copying."""
+        return self._array
+
+    def take(self, rows: np.ndarray, index: pd.Index) -> WellFrame:
+        """
+        Builds a WellFrame from rows of the matrix.
+        The features are copied exactly once, into a contiguous array.
+
+        Args:
+            rows: Row indices into the matrix
+            index: The WellFrame index (meta columns) for the rows, in the same order
+
+        Returns:
+            A new WellFrame
+
+        """
+        df = pd.DataFrame(self._array[rows], index=index, columns=self.columns)
+        return WellFrame.retype(df)
+
+    def unlink(self) -> None:
+        """
+        Closes and frees the memory now.
+        Must only be called by the owner, after every other process has finished with it.
+        """
+        if not self.owner:
+            raise OpStateError(f"{self} does not own shared memory {self.name}")
+        self._array = None
+        self._finalizer()
+
+    @classmethod
+    def _release(cls, shm: shared_memory.SharedMemory, owner: bool) -> None:
+        """
+
+
+        Args:
+            shm:
+            owner:
+
+        """
+        try:
+            shm.close()
+        except BufferError:
+            # a view of the array is still alive somewhere; unlinking is still safe
+            pass
+        if owner:
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def __getstate__(self):
+        return dict(name=self.name, shape=self.shape, dtype=self.dtype.str, columns=self.columns)
+
+    def __setstate__(self, state):
+        shm = shared_memory.SharedMemory(name=state["name"])
+        self.__init__(shm, state["shape"], state["dtype"], state["columns"], owner=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.owner:
+            self.unlink()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name}, shape={self.shape}, dtype={self.dtype})"
+
+    def __str__(self):
+        return repr(self)
+
+
+@abcd.auto_repr_str(
+    lambda s: s in {"_smalldf", "rows", "index", "matrix"},
+    lambda s: s in {"_smalldf", "rows", "index", "matrix"},
+    lambda s: s in {"_smalldf", "rows", "index", "matrix"},
+)
 class TrainableCc:
     """
     An equivalent to ``ControlComparison`` that also contains an attribute ``smalldf``,
     which contains selected wells to intended for the comparison.
     ``smalldf`` always has exactly 2 `name` values (``len(smalldf.unique_names()) == 2``).
 
+    Instead of a ``smalldf``, can be given row indices into a ``SharedFeatureMatrix`` and the WellFrame index for them.
+    ``smalldf`` is then built on first access, and pickling doesn't include it.
+
     """
 
-    def __init__(self, name: str, control: str, repeat: int, smalldf: WellFrame):
+    def __init__(
+        self,
+        name: str,
+        control: str,
+        repeat: int,
+        smalldf: Optional[WellFrame] = None,
+        rows: Optional[np.ndarray] = None,
+        index: Optional[pd.Index] = None,
+        matrix: Optional[SharedFeatureMatrix] = None,
+    ):
         self.name, self.control, self.repeat = name, control, repeat
-        self.smalldf = smalldf
+        has_shared = [x is not None for x in (rows, index, matrix)]
+        if not (smalldf is not None and not any(has_shared) or smalldf is None and all(has_shared)):
+            raise XValueError("Pass either smalldf or all of rows, index, and matrix")
+        self._smalldf = smalldf
+        self.rows, self.index, self.matrix = rows, index, matrix
+
+    @property
+    def smalldf(self) -> WellFrame:
+        """The wells to use for the comparison."""
+        if self._smalldf is None:
+            self._smalldf = self.matrix.take(self.rows, self.index)
+        return self._smalldf
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if self.matrix is not None:
+            state["_smalldf"] = None
+        return state
 
     def info(self) -> Mapping[str, Any]:
         """ """
@@ -514,6 +690,7 @@ class TrainableCcIterator(SizedIterator):
         should_proceed: Callable[
             [ControlComparison, WellFrame, WellFrame], bool
         ] = CcShouldProceeds.keep(),
+        matrix: Optional[SharedFeatureMatrix] = None,
     ):
         """
         Constructor.
@@ -533,7 +710,16 @@ class TrainableCcIterator(SizedIterator):
                         This function is permitted to be a bit flexible. It should avoid modifying inputs, but may.
             should_proceed: A function that decides whether to keep comparison, taking the ControlComparsion,
                             final subsampled input (by_name, by_controls), and returns True to keep it.
+            matrix: The features of `df` in shared memory, with rows in the same order.
+                    If set, the functions above are passed WellFrames whose only feature column holds row indices;
+                    they must select wells only by their meta columns.
+                    The ``TrainableCc``s then refer to rows in ``matrix`` instead of holding copies of the features.
         """
+        self.matrix = matrix
+        if matrix is not None:
+            if len(df) != matrix.shape[0]:
+                raise LengthMismatchError(f"{len(df)} wells but {matrix.shape[0]} rows in {matrix}")
+            df = WellFrame.retype(pd.DataFrame(np.arange(len(df)), index=df.index, columns=[0]))
         self.df = df
         self.__it = it
         self.__copyit = copy(it)
@@ -554,7 +740,18 @@ class TrainableCcIterator(SizedIterator):
         while self.__it.has_next():
             cc = next(self.__it)
             smalldf = self._select(cc)
-            if smalldf is not None:
+            if smalldf is not None and self.matrix is not None:
+                logger.debug(f"{cc} has {len(smalldf)} rows")
+                rows = smalldf.values[:, 0].astype(np.intp)
+                return TrainableCc(
+                    cc.name,
+                    cc.control,
+                    cc.repeat,
+                    rows=rows,
+                    index=smalldf.index,
+                    matrix=self.matrix,
+                )
+            elif smalldf is not None:
                 logger.debug(f"{cc} has {len(smalldf)} rows")
                 return TrainableCc(cc.name, cc.control, cc.repeat, smalldf)
             else:
@@ -625,6 +822,7 @@ class CcIterators:
         restrict_include_null: bool = False,
         subsample_to: Optional[int] = None,
         controls: Optional[Iterable[str]] = None,
+        matrix: Optional[SharedFeatureMatrix] = None,
     ) -> TrainableCcIterator:
         """
         Creates an iterator over comparisons between `name` column values (in `df`) and `control_type` values.
@@ -656,6 +854,7 @@ class CcIterators:
           subsample_to: Subsample BOTH the cases and the controls to some number of replicates, OR THE MINIMUM for either
         This means each classifier will get an even number of replicates for the cases and controls.
         It also means a classifier might use fewer replicates, if not enough exist.
+          matrix: The features of `df` in shared memory (see ``SharedFeatureMatrix``), to select by row index instead of copying
 
 
         Returns:
@@ -670,7 +869,7 @@ class CcIterators:
         else:
             csel = CcControlSelectors.same(restrict_to_same, restrict_include_null)
         sampler = CcSubsamplers.keep(subsample_to)
-        return TrainableCcIterator(df, it, control_selector=csel, subsampler=sampler)
+        return TrainableCcIterator(df, it, control_selector=csel, subsampler=sampler, matrix=matrix)
 
     @classmethod
     def vs_control_rand(
@@ -683,6 +882,7 @@ class CcIterators:
         high: Optional[int] = None,
         seed: int = 0,
         controls: Optional[Iterable[str]] = None,
+        matrix: Optional[SharedFeatureMatrix] = None,
     ) -> TrainableCcIterator:
         """
 
@@ -696,6 +896,7 @@ class CcIterators:
             high:
             seed:
             controls:
+            matrix:
 
         Returns:
 
@@ -711,11 +912,15 @@ class CcIterators:
         if low is None or high is None or low == high:
             logger.warning(f"vs_control_rand has has fixed value for low={low}, high={high}")
         sampler = CcSubsamplers.keep_rand(rand, balanced=True)
-        return TrainableCcIterator(df, it, control_selector=csel, subsampler=sampler)
+        return TrainableCcIterator(df, it, control_selector=csel, subsampler=sampler, matrix=matrix)
 
     @classmethod
     def vs_self(
-        cls, df: WellFrame, n_repeats: int = 1, subsample_to: Optional[int] = None
+        cls,
+        df: WellFrame,
+        n_repeats: int = 1,
+        subsample_to: Optional[int] = None,
+        matrix: Optional[SharedFeatureMatrix] = None,
     ) -> TrainableCcIterator:
         """
         Iterates over comparisons of name--name.
@@ -733,6 +938,7 @@ class CcIterators:
         Args:
             df: param n_repeats:
             subsample_to: The "preferred" number of wells per group
+            matrix: See ``vs_control``
 
         Returns:
             A TrainableCcIterator
@@ -741,7 +947,7 @@ class CcIterators:
         it = CcSelfIterator(df.unique_names(), n_repeats)
         sampler = CcSubsamplers.split_self(subsample_to)
         return TrainableCcIterator(
-            df, it, control_selector=CcControlSelectors.keep(), subsampler=sampler
+            df, it, control_selector=CcControlSelectors.keep(), subsampler=sampler, matrix=matrix
         )
 
     @classmethod
@@ -752,6 +958,7 @@ class CcIterators:
         low: Optional[int] = None,
         high: Optional[int] = None,
         seed: int = 0,
+        matrix: Optional[SharedFeatureMatrix] = None,
     ) -> TrainableCcIterator:
         """
         Similar to `vs_self`, but each comparison `k` random wells,
@@ -764,6 +971,7 @@ class CcIterators:
             low:
             high:
             seed:
+            matrix:
 
         Returns:
 
@@ -772,7 +980,7 @@ class CcIterators:
         rand = cls._rand(low, high, seed)
         sampler = CcSubsamplers.split_self(high, rand=rand)
         return TrainableCcIterator(
-            df, it, control_selector=CcControlSelectors.keep(), subsampler=sampler
+            df, it, control_selector=CcControlSelectors.keep(), subsampler=sampler, matrix=matrix
         )
 
     @classmethod
@@ -783,6 +991,7 @@ class CcIterators:
         restrict_to_same: Union[None, str, Set[str]] = None,
         restrict_include_null: bool = False,
         subsample_to: Optional[int] = None,
+        matrix: Optional[SharedFeatureMatrix] = None,
     ) -> TrainableCcIterator:
         """
         Comparisons between `df.unique_names()` and `df.unique_names` where the names are different.
@@ -796,6 +1005,7 @@ class CcIterators:
             restrict_to_same:
             restrict_include_null:
             subsample_to:
+            matrix:
 
         Returns:
 
@@ -806,7 +1016,7 @@ class CcIterators:
         else:
             csel = CcControlSelectors.same(restrict_to_same, restrict_include_null)
         sampler = CcSubsamplers.keep(subsample_to)
-        return TrainableCcIterator(df, it, control_selector=csel, subsampler=sampler)
+        return TrainableCcIterator(df, it, control_selector=csel, subsampler=sampler, matrix=matrix)
 
     @classmethod
     def _rand(cls, low: Optional[int], high: Optional[int], seed: int):
@@ -846,6 +1056,7 @@ class CcIterators:
 
 __all__ = [
     "ControlComparison",
+    "SharedFeatureMatrix",
     "CcIterator",
     "TrainableCc",
     "TrainableCcIterator",
@@ -67,29 +67,49 @@ class ConfusionMatrix(UntypedDf):
         """
         Returns diagonal elements.
         """
-        return np.array([self.iat[i, i] for i in range(len(self))])
+        return ConfusionMatrices.diagonals(self.values)
 
     def off_diagonals_quantiles(self, q: float = 0.5) -> np.array:
         """
-
+        Returns a quantile of the off-diagonal elements of each row.
 
         Args:
-            q:
+            q: The quantile, from 0 to 1
 
         Returns:
 
         """
-        lst = []
-        for i in range(len(self)):
-            lst.append(np.quantile([self.iat[i, j] for j in range(len(self))], q))
-        return np.array(lst)
+        return ConfusionMatrices.off_diagonals_quantiles(self.values, q)
 
     def off_diagonals_means(self) -> np.array:
-        """"""
-        lst = []
-        for i in range(len(self)):
-            lst.append(np.mean([self.iat[i, j] for j in range(len(self))]))
-        return np.array(lst)
+        """
+        Returns the mean of the off-diagonal elements of each row.
+        """
+        return ConfusionMatrices.off_diagonals_means(self.values)
+
+    def permutation_test(
+        self,
+        statistic: str = "diagonal",
+        n_permutations: int = 10000,
+        blocks: Optional[Mapping[str, str]] = None,
+        **kwargs,
+    ) -> UntypedDf:
+        """
+        Runs a permutation test, giving a p-value per label. See ``ConfusionPermutationTest``.
+
+        Args:
+            statistic: diagonal, accuracy, or blocks
+            n_permutations: The number of random permutations
+            blocks: For the ``blocks`` statistic, a map from every label to the name of its block
+            **kwargs: Passed to ``ConfusionPermutationTest``, such as ``n_jobs`` and ``seed``
+
+        Returns:
+            An UntypedDf with columns 'label', 'observed', 'null_mean', 'null_std', and 'p_value'
+
+        """
+        from chemfish.ml.confusion_permutations import ConfusionPermutationTest
+
+        return ConfusionPermutationTest(statistic, n_permutations, **kwargs).test(self, blocks)
 
     def flatten(self) -> np.array:
         """"""
@@ -97,19 +117,11 @@ class ConfusionMatrix(UntypedDf):
 
     def sum_diagonal(self) -> float:
         """"""
-        s = 0
-        for i in range(len(self)):
-            s += self.iat[i, i]
-        return s
+        return float(ConfusionMatrices.sum_diagonals(self.values))
 
     def sum_off_diagonal(self) -> float:
         """"""
-        s = 0
-        for i in range(len(self)):
-            for j in range(len(self)):
-                if i != j:
-                    s += self.iat[i, j]
-        return s
+        return float(ConfusionMatrices.sum_off_diagonals(self.values))
 
     def score_df(self) -> UntypedDf:
         """
@@ -290,6 +302,237 @@ class ConfusionMatrix(UntypedDf):
         )
 
 
+class ConfusionMatrices:
+    """
+    Operations on many confusion matrices at once.
+    The statistics (``diagonals``, ``sum_diagonals``, etc.) work on a stack of matrices as a k × n × n array,
+    as returned by ``stack``, or on a single n × n array, and return one result per matrix.
+
+    Example:
+        Summarizes many matrices::
+
+            labels, arr = ConfusionMatrices.stack(matrices)
+            accuracies = ConfusionMatrices.diagonals(arr)  # k × n
+
+    """
+
+    @classmethod
+    def stack(cls, matrices: Sequence[ConfusionMatrix]) -> Tup[Sequence[str], np.ndarray]:
+        """
+        Stacks confusion matrices with the same labels into one 3D array.
+        The rows and columns of every matrix are put in the order of the rows of the first.
+
+        Args:
+            matrices: An iterable of ConfusionMatrices (does not need to be a list)
+
+        Returns:
+            A tuple of (the labels, a float64 array of shape (number of matrices, number of labels, number of labels))
+
+        Raises:
+            EmptyCollectionError: If there are no matrices
+            RefusingRequestError: If the rows and columns of a matrix differ, or the matrices have different labels
+
+        """
+        matrices = list(matrices)
+        if len(matrices) < 1:
+            raise EmptyCollectionError("Cannot stack 0 matrices")
+        labels = matrices[0].rows
+        arr = np.empty((len(matrices), len(labels), len(labels)), dtype=np.float64)
+        for i, m in enumerate(matrices):
+            if set(m.rows) != set(m.cols):
+                raise RefusingRequestError(
+                    "Refusing to stack matrices because for at least one matrix the rows and columns are different"
+                )
+            if m.rows != labels or m.cols != labels:
+                if set(m.rows) != set(labels) or len(m.rows) != len(labels):
+                    raise RefusingRequestError(
+                        "At least one confusion matrix has different rows than another (or different columns than another)"
+                    )
+                m = m.reindex(index=labels, columns=labels)
+            arr[i] = m.values
+        return labels, arr
+
+    @classmethod
+    def average(cls, matrices: Sequence[ConfusionMatrix]) -> ConfusionMatrix:
+        """
+        Averages a list of confusion matrices.
+
+        Args:
+            matrices: An iterable of ConfusionMatrices (does not need to be a list)
+
+        Returns:
+            A new ConfusionMatrix
+
+        """
+        return cls.agg_matrices(matrices, np.mean)
+
+    @classmethod
+    def agg_matrices(
+        cls,
+        matrices: Sequence[ConfusionMatrix],
+        aggregation: Callable[..., np.ndarray],
+    ) -> ConfusionMatrix:
+        """
+        Aggregates a list of confusion matrices element-wise.
+
+        Args:
+            matrices: An iterable of ConfusionMatrices (does not need to be a list)
+            aggregation: A NumPy reduction that accepts ``axis``, such as np.mean or np.median
+
+        Returns:
+            A new ConfusionMatrix
+
+        """
+        matrices = list(matrices)
+        labels, arr = cls.stack(matrices)
+        first = matrices[0]
+        return ConfusionMatrix(
+            pd.DataFrame(
+                aggregation(arr, axis=0),
+                index=first.index,
+                columns=pd.Index(labels, name=first.columns.name),
+            )
+        )
+
+    @classmethod
+    def diagonals(cls, arr: np.ndarray) -> np.ndarray:
+        """
+        Returns the diagonal elements of each matrix.
+
+        Args:
+            arr: A k × n × n or n × n array
+
+        Returns:
+            A k × n or length-n array
+
+        """
+        return np.diagonal(arr, axis1=-2, axis2=-1).copy()
+
+    @classmethod
+    def sum_diagonals(cls, arr: np.ndarray) -> np.ndarray:
+        """
+        Returns the sum of the diagonal of each matrix.
+
+        Args:
+            arr: A k × n × n or n × n array
+
+        Returns:
+            A length-k array, or a scalar
+
+        """
+        return np.trace(arr, axis1=-2, axis2=-1)
+
+    @classmethod
+    def sum_off_diagonals(cls, arr: np.ndarray) -> np.ndarray:
+        """
+        Returns the sum of the off-diagonal elements of each matrix.
+
+        Args:
+            arr: A k × n × n or n × n array
+
+        Returns:
+            A length-k array, or a scalar
+
+        """
+        return cls._off_diagonals(arr).sum(axis=(-2, -1))
+
+    @classmethod
+    def off_diagonals_means(cls, arr: np.ndarray) -> np.ndarray:
+        """
+        Returns the mean of the off-diagonal elements of each row of each matrix.
+
+        Args:
+            arr: A k × n × n or n × n array
+
+        Returns:
+            A k × n or length-n array
+
+        """
+        return cls._off_diagonals(arr).mean(axis=-1)
+
+    @classmethod
+    def off_diagonals_quantiles(cls, arr: np.ndarray, q: float = 0.5) -> np.ndarray:
+        """
+        Returns a quantile of the off-diagonal elements of each row of each matrix.
+
+        Args:
+            arr: A k × n × n or n × n array
+            q: The quantile, from 0 to 1
+
+        Returns:
+            A k × n or length-n array
+
+        """
+        return np.quantile(cls._off_diagonals(arr), q, axis=-1)
+
+    @classmethod
+    def _off_diagonals(cls, arr: np.ndarray) -> np.ndarray:
+        """
+        Gets the off-diagonal elements of square matrices, as shape (..., n, n - 1).
+        """
+        arr = np.asarray(arr)
+        n = arr.shape[-1]
+        if arr.shape[-2] != n:
+            raise LengthMismatchError(f"{arr.shape[-2]} rows != {n} cols")
+        mask = ~np.eye(n, dtype=bool)
+        return arr[..., mask].reshape(*arr.shape[:-2], n, n - 1)
+
+    @classmethod
+    def zeros(cls, classes: Sequence[str]) -> ConfusionMatrix:
+        """
+
+
+        Args:
+            classes: Sequence[str]:
+
+        Returns:
+
+        """
+        return ConfusionMatrix(
+            pd.DataFrame(
+                [pd.Series({"class": r, **{c: 0.0 for c in classes}}) for r in classes]
+            ).set_index("class")
+        )
+
+    @classmethod
+    def perfect(cls, classes: Sequence[str]) -> ConfusionMatrix:
+        """
+
+
+        Args:
+            classes: Sequence[str]:
+
+        Returns:
+
+        """
+        return ConfusionMatrix(
+            pd.DataFrame(
+                [
+                    pd.Series({"class": r, **{c: 1.0 if r == c else 0.0 for c in classes}})
+                    for r in classes
+                ]
+            ).set_index("class")
+        )
+
+    @classmethod
+    def uniform(cls, classes: Sequence[str]) -> ConfusionMatrix:
+        """
+
+
+        Args:
+            classes: Sequence[str]:
+
+        Returns:
+
+        """
+        return ConfusionMatrix(
+            pd.DataFrame(
+                [
+                    pd.Series({"class": r, **{c: 1.0 / len(classes) for c in classes}})
+                    for r in classes
+                ]
+            ).set_index("class")
+        )
 
 
 __all__ = ["ConfusionMatrix", "ConfusionMatrices"]
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import joblib
+
+from chemfish.core.core_imports import *
+from chemfish.ml.confusion_matrices import ConfusionMatrix
+
+
+class ConfusionPermutationTest:
+    """
+    Permutation tests on a confusion matrix, with one p-value per label.
+    Each permutation is an array of label indices. Permutations are generated and scored in chunks,
+    each as a 2D array of indices, so no Python code runs per permutation.
+    Each chunk gets its own random generator spawned from ``seed``,
+    so the results depend on ``seed``, ``n_permutations``, and ``chunk_size`` but not on ``n_jobs``.
+
+    The statistics are:
+        - diagonal: The diagonal element of each label. The predicted labels (columns) are permuted,
+                    so the null value for label i is the element at (i, π(i)).
+        - accuracy: The mean of the diagonal, with the same permutations as ``diagonal``; this has a single row.
+        - blocks: For each label, the mean of the off-diagonal elements (in its row) for the other labels in its block,
+                  such as other concentrations of the same compound. The rows and columns are permuted together,
+                  which tests whether labels in the same block are confused with each other more than random labels are.
+
+    p-values use the usual correction of counting the observed value as a permutation: (1 + k) / (1 + n).
+
+    Example:
+        Uses::
+
+            test = ConfusionPermutationTest("blocks", n_permutations=10000, n_jobs=4)
+            pvalues = test.test(matrix, blocks={"DMSO": "control", "drugA:1µM": "drugA", "drugA:10µM": "drugA"})
+
+    """
+
+    statistics = {"diagonal", "accuracy", "blocks"}
+    alternatives = {"greater", "less", "two-sided"}
+
+    def __init__(
+        self,
+        statistic: str = "diagonal",
+        n_permutations: int = 10000,
+        alternative: str = "greater",
+        chunk_size: int = 1000,
+        n_jobs: Optional[int] = 1,
+        seed: int = 0,
+    ):
+        """
+
+        Args:
+            statistic: Any of ``ConfusionPermutationTest.statistics``
+            n_permutations: The number of random permutations
+            alternative: greater, less, or two-sided
+            chunk_size: The number of permutations to generate and score at once
+            n_jobs: Passed to ``joblib.Parallel``; chunks are scored in a process pool if this is not 1
+            seed: A seed for the random permutations
+        """
+        if statistic not in self.statistics:
+            raise XValueError(f"Unknown statistic {statistic}; choose from {self.statistics}")
+        if alternative not in self.alternatives:
+            raise XValueError(f"Unknown alternative {alternative}; choose from {self.alternatives}")
+        if n_permutations < 1:
+            raise OutOfRangeError(f"n_permutations {n_permutations} < 1")
+        if chunk_size < 1:
+            raise OutOfRangeError(f"chunk_size {chunk_size} < 1")
+        self.statistic = statistic
+        self.n_permutations = n_permutations
+        self.alternative = alternative
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+        self.seed = seed
+
+    def test(
+        self, matrix: ConfusionMatrix, blocks: Optional[Mapping[str, str]] = None
+    ) -> UntypedDf:
+        """
+        Runs the test.
+
+        Args:
+            matrix: A square confusion matrix
+            blocks: For the ``blocks`` statistic, a map from every label to the name of its block
+
+        Returns:
+            An UntypedDf with columns 'label', 'observed', 'null_mean', 'null_std', and 'p_value'.
+            There is one row per label, or a single row with label 'accuracy' for the ``accuracy`` statistic.
+            Labels without another label in their block have NaN values.
+
+        """
+        labels = matrix.rows
+        if labels != matrix.cols:
+            raise RefusingRequestError(f"Rows {labels} and columns {matrix.cols} differ")
+        arr = matrix.values.astype(np.float64)
+        pairs = None
+        if self.statistic == "blocks":
+            if blocks is None:
+                raise XValueError("blocks is required for the blocks statistic")
+            pairs = self._block_pairs(labels, blocks)
+        elif blocks is not None:
+            raise XValueError(f"blocks is only used for the blocks statistic, not {self.statistic}")
+        identity = np.arange(len(labels))[np.newaxis, :]
+        observed = _permuted_statistic(arr, identity, self.statistic, pairs)[0]
+        chunks = [
+            min(self.chunk_size, self.n_permutations - start)
+            for start in range(0, self.n_permutations, self.chunk_size)
+        ]
+        seeds = np.random.SeedSequence(self.seed).spawn(len(chunks))
+        t0 = time.monotonic()
+        jobs = (
+            joblib.delayed(_permutation_chunk)(arr, n, s, self.statistic, pairs, observed)
+            for n, s in zip(chunks, seeds)
+        )
+        with joblib.Parallel(n_jobs=self.n_jobs) as parallel:
+            results = parallel(jobs)
+        n_greater, n_less, sums, squares = (np.sum(r, axis=0) for r in zip(*results))
+        logger.debug(
+            f"Scored {self.n_permutations} permutations of {len(labels)} labels in {time.monotonic() - t0:.1f}s"
+        )
+        n = self.n_permutations
+        null_mean = sums / n
+        with np.errstate(invalid="ignore"):
+            null_std = np.sqrt(np.maximum(squares / n - null_mean ** 2, 0) * n / max(n - 1, 1))
+        p_greater = (1 + n_greater) / (1 + n)
+        p_less = (1 + n_less) / (1 + n)
+        if self.alternative == "greater":
+            p_value = p_greater
+        elif self.alternative == "less":
+            p_value = p_less
+        else:
+            p_value = np.minimum(1.0, 2 * np.minimum(p_greater, p_less))
+        p_value = np.where(np.isnan(observed), np.nan, p_value)
+        return UntypedDf(
+            pd.DataFrame(
+                {
+                    "label": ["accuracy"] if self.statistic == "accuracy" else labels,
+                    "observed": observed,
+                    "null_mean": null_mean,
+                    "null_std": null_std,
+                    "p_value": p_value,
+                }
+            )
+        )
+
+    @classmethod
+    def _block_pairs(
+        cls, labels: Sequence[str], blocks: Mapping[str, str]
+    ) -> Tup[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Finds the (row, column) index pairs of labels in the same block, sorted by row, excluding the diagonal.
+
+        Returns:
+            A tuple of (row indices, column indices, the first pair of each label or -1 if it has none)
+
+        """
+        missing = [label for label in labels if label not in blocks]
+        if len(missing) > 0:
+            raise LookupFailedError(f"Labels {missing} have no block")
+        by_block = defaultdict(list)
+        for i, label in enumerate(labels):
+            by_block[blocks[label]].append(i)
+        rows, cols = [], []
+        starts = np.full(len(labels), -1, dtype=np.int64)
+        for i, label in enumerate(labels):
+            mates = [j for j in by_block[blocks[label]] if j != i]
+            if len(mates) > 0:
+                starts[i] = len(rows)
+                rows.extend([i] * len(mates))
+                cols.extend(mates)
+        return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64), starts
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}({self.statistic}, n={self.n_permutations}, {self.alternative}, "
+            f"seed={self.seed})"
+        )
+
+    def __str__(self):
+        return repr(self)
+
+
+def _permutation_chunk(
+    arr: np.ndarray,
+    n: int,
+    seed: np.random.SeedSequence,
+    statistic: str,
+    pairs: Optional[Tup[np.ndarray, np.ndarray, np.ndarray]],
+    observed: np.ndarray,
+) -> Tup[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Generates and scores a chunk of permutations.
+    Runs in a worker process.
+
+    Returns:
+        A tuple of per-label (count >= observed, count <= observed, sum, sum of squares)
+
+    """
+    rng = np.random.default_rng(seed)
+    # argsort of uniform values gives uniformly random permutations
+    perms = rng.random((n, arr.shape[0])).argsort(axis=1)
+    null = _permuted_statistic(arr, perms, statistic, pairs)
+    with np.errstate(invalid="ignore"):
+        return (
+            (null >= observed).sum(axis=0),
+            (null <= observed).sum(axis=0),
+            null.sum(axis=0),
+            np.square(null).sum(axis=0),
+        )
+
+
+def _permuted_statistic(
+    arr: np.ndarray,
+    perms: np.ndarray,
+    statistic: str,
+    pairs: Optional[Tup[np.ndarray, np.ndarray, np.ndarray]],
+) -> np.ndarray:
+    """
+    Computes a statistic for each of a 2D array of permutations (one per row).
+
+    Returns:
+        A 2D array with one row per permutation, and one column per label (or 1 column for accuracy)
+
+    """
+    if statistic == "diagonal":
+        return arr[np.arange(arr.shape[0]), perms]
+    if statistic == "accuracy":
+        return arr[np.arange(arr.shape[0]), perms].mean(axis=1, keepdims=True)
+    rows, cols, starts = pairs
+    result = np.full(perms.shape, np.nan)
+    if len(rows) == 0:
+        return result
+    values = arr[perms[:, rows], perms[:, cols]]
+    has = starts >= 0
+    sums = np.add.reduceat(values, starts[has], axis=1)
+    counts = np.diff(np.r_[starts[has], len(rows)])
+    result[:, has] = sums / counts
+    return result
+
+
+__all__ = ["ConfusionPermutationTest"]
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import warnings
+
 from chemfish.core.core_imports import *
 from chemfish.ml.accuracy_frames import AccuracyFrame
 from chemfish.ml.confusion_matrices import ConfusionMatrix
@@ -50,6 +52,7 @@ class DecisionFrame(TypedDf):
 
     def confusion(self) -> ConfusionMatrix:
         """
+        Sums the decision values by correct label, normalized so that each correct label's column sums to 1.
 
         Returns:
 
@@ -64,28 +67,38 @@ class DecisionFrame(TypedDf):
             raise LengthMismatchError(
                 "N decision function columns of shape {self.shape} != N class labels {len(labels)}"
             )
-        correct_confused_with = {c: {p: 0.0 for p in labels} for c in labels}
-        for r, row in enumerate(self.index):
-            correct_name = correct_labels[r]
-            for c, column in enumerate(self.columns):
-                confused_name = labels[c]
-                correct_confused_with[correct_name][confused_name] += self.iat[r, c]
-        correct_confused_with = pd.DataFrame(correct_confused_with)
+        # sum the rows for each correct label, in row order
+        sums = np.zeros((len(labels), len(labels)), dtype=np.float64)
+        np.add.at(sums, self._label_codes(), self.values.astype(np.float64, copy=False))
+        # columns are the correct labels, and rows are the labels they were confused with
+        correct_confused_with = pd.DataFrame(
+            sums.T, index=pd.Index(list(labels)), columns=pd.Index(list(labels))
+        )
         correct_confused_with /= correct_confused_with.sum()
         return ConfusionMatrix(correct_confused_with)
 
     def accuracy(self) -> AccuracyFrame:
         """
+        Gets the prediction (the highest-scoring label) and the score for the correct label for every sample.
 
         Returns:
 
         """
         actual_labels = self.index.get_level_values("label").values
         sample_ids = self.index.get_level_values("sample_id").values
-        stripped = self.reset_index().drop("sample_id", axis=1).set_index("label")
-        predicted_labels = stripped.idxmax(axis=1).values
-        predicted_probs = stripped.max(axis=1).values
-        actual_probs = stripped.apply(lambda r: r.loc[r.name], axis=1).values
+        values = self.values
+        # idxmax and max skip NaNs, and give NaN for rows with only NaNs
+        missing = np.isnan(values).all(axis=1)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            predicted_probs = np.nanmax(values, axis=1)
+        predicted_labels = self.columns.values[
+            np.nanargmax(np.where(missing[:, None], 0, values), axis=1)
+        ]
+        if missing.any():
+            predicted_labels = predicted_labels.astype(object)
+            predicted_labels[missing] = np.nan
+        actual_probs = values[np.arange(len(values)), self._label_codes()]
         return AccuracyFrame(
             {
                 "label": actual_labels,
@@ -96,5 +109,17 @@ class DecisionFrame(TypedDf):
             }
         )
 
+    def _label_codes(self) -> np.ndarray:
+        """
+        Returns the column index of the correct label of each row.
+        """
+        correct_labels = self.index.get_level_values("label")
+        codes = self.columns.get_indexer(correct_labels)
+        if (codes < 0).any():
+            raise LookupFailedError(
+                f"Correct labels {set(correct_labels[codes < 0])} are not among the class labels"
+            )
+        return codes
+
 
 __all__ = ["DecisionFrame"]
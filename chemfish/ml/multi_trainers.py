@@ -1,8 +1,13 @@
 from __future__ import annotations
 
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
 from chemfish.core.core_imports import *
 from chemfish.ml import ClassifierPath
 from chemfish.ml.classifiers import *
+from chemfish.ml.classifiers import ClassifierTrainFailedError
 from chemfish.ml.decision_frames import *
 from chemfish.ml.dose_response_factory import SpindleFrame
 from chemfish.ml.comparisons import *
@@ -23,14 +28,62 @@ class MultiTrainerUtils:
         Returns:
 
         """
-        accs = []
-        for dec, cc in items:
-            acc = dec.accuracy().reset_index()
-            acc["source"] = cc.name  # as in arrows
-            acc["target"] = cc.control
-            acc["repeat"] = cc.repeat
-            accs.append(acc)
-        return SpindleFrame(pd.concat(accs, sort=False))
+        return SpindleFrame(pd.concat([cls.spindle_rows(dec, cc) for dec, cc in items], sort=False))
+
+    @classmethod
+    def spindle_rows(cls, decision: DecisionFrame, cc: TrainableCc) -> pd.DataFrame:
+        """
+        Gets the rows of a spindle for a single comparison.
+        These are much smaller than the DecisionFrame, so they can be kept while training.
+
+        Args:
+            decision:
+            cc:
+
+        Returns:
+
+        """
+        acc = decision.accuracy().reset_index()
+        acc["source"] = cc.name  # as in arrows
+        acc["target"] = cc.control
+        acc["repeat"] = cc.repeat
+        return acc
+
+    @classmethod
+    def train_one(
+        cls,
+        model_type: SklearnWfClassifierWithOob,
+        tt: TrainableCc,
+        subdir: ClassifierPath,
+        n_jobs: Optional[int] = None,
+    ) -> DecisionFrame:
+        """
+        Trains a single classifier and saves its model and decision.
+        The decision is written last and atomically, so ``subdir.exists_with_decision()``
+        is True only if the comparison finished.
+
+        Args:
+            model_type: A WellClassifier supporting an out-of-bag; its `build` function will be called without parameters
+            tt: The comparison to train
+            subdir: The directory to save to
+            n_jobs: If not None, sets the ``n_jobs`` parameter of the model, if it has one
+
+        Returns:
+            The training decision
+
+        """
+        model = model_type.build()
+        if n_jobs is not None and "n_jobs" in model.params:
+            model.model.set_params(n_jobs=n_jobs)
+        model.train(tt.smalldf)
+        model.save(subdir.model_pkl)
+        decision = model.training_decision
+        tmp = subdir.decision_csv.parent / (
+            f".{subdir.decision_csv.name}.{os.getpid()}-{threading.get_ident()}.tmp"
+        )
+        decision.to_csv(tmp)
+        os.replace(str(tmp), str(subdir.decision_csv))
+        return decision
 
     def __repr__(self):
         return self.__class__.__name__
@@ -110,7 +163,9 @@ class MultiTrainer:
         for tt, subdir, n_trained in self._iterate(df):
             yield tt
 
-    def just_train(self, df: WellFrame, store_for_spindle: bool = False) -> None:
+    def just_train(
+        self, df: WellFrame, store_for_spindle: bool = False, n_workers: int = 1
+    ) -> None:
         """
         Train the whole model.
 
@@ -118,27 +173,36 @@ class MultiTrainer:
             df: Must correspond to the iterator; this can't be verified
             store_for_spindle: Store results as they're trained. This will consume increasing memory with
                                successive models, but will save time at the end.
+            n_workers: The number of processes to train in; see ``train``
 
         """
-        for _ in self.train(df, store_for_spindle=store_for_spindle):
+        for _ in self.train(df, store_for_spindle=store_for_spindle, n_workers=n_workers):
             pass
         self.load_spindle()  # save it
 
     def train(
-        self, df: WellFrame, store_for_spindle: bool = False
+        self, df: WellFrame, store_for_spindle: bool = False, n_workers: int = 1
     ) -> Generator[Tup[DecisionFrame, TrainableCc], None, None]:
         """
         Train the models, yielding one at a time after they're trained.
+        Comparisons that were already trained (with a ``decision.csv``) are read instead of trained,
+        so an interrupted call can be resumed by calling this again.
 
         Args:
             df: Must correspond to the iterator; this can't be verified
             store_for_spindle: Store results as they're trained. This will consume increasing memory with successive
                                models, but will save a spindle at the end.
+            n_workers: If greater than 1, train this many models at once in a process pool.
+                       Each model then gets ``chemfish_env.n_cores // n_workers`` cores (at least 1) for its own ``n_jobs``.
+                       Results are yielded as they complete, which is NOT necessarily in order.
 
         Yields:
 
         """
-        decisions = []
+        if n_workers > 1:
+            yield from self._train_parallel(df, store_for_spindle, n_workers)
+            return
+        accs = []
         for tt, subdir, n_trained in self._iterate(df):
             if subdir.exists_with_decision():
                 logger.debug((f"{subdir} already trained"))
@@ -152,11 +216,87 @@ class MultiTrainer:
                 if n_trained == 1:
                     logger.notice("Ignoring future classifier output...\n")
             if store_for_spindle:
-                decisions.append((decision, tt))
+                accs.append(MultiTrainerUtils.spindle_rows(decision, tt))
             yield decision, tt
         if store_for_spindle:
-            MultiTrainerUtils.to_spindle(decisions).to_csv(self.spindle_path)
-            logger.info("Saved spindle.")
+            self._save_spindle(accs)
+
+    def _train_parallel(
+        self, df: WellFrame, store_for_spindle: bool, n_workers: int
+    ) -> Generator[Tup[DecisionFrame, TrainableCc], None, None]:
+        """
+        Trains in a process pool, keeping at most ``2 * n_workers`` comparisons queued at a time.
+        Failures are logged and don't stop the other comparisons; they are raised together at the end.
+
+        Args:
+            df: WellFrame:
+            store_for_spindle: bool:
+            n_workers: int:
+
+        Yields:
+
+        Raises:
+            ClassifierTrainFailedError: If any comparison failed
+
+        """
+        n_jobs = max(1, chemfish_env.n_cores // n_workers)
+        silence = not self.always_log
+        logger.notice(f"Training with {n_workers} workers and {n_jobs} core(s) per model.")
+        accs, failures, pending = [], [], {}
+        n_done = 0
+
+        def collect(done):
+            nonlocal n_done
+            for future in done:
+                tt = pending.pop(future)
+                try:
+                    decision = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to train {tt.directory}", exc_info=True)
+                    failures.append((tt, e))
+                    continue
+                n_done += 1
+                if n_done % 50 == 0:
+                    logger.info(f"Trained {n_done} models; {len(pending)} in progress")
+                if store_for_spindle:
+                    accs.append(MultiTrainerUtils.spindle_rows(decision, tt))
+                yield decision, tt
+
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            for tt, subdir, n_trained in self._iterate(df):
+                if subdir.exists_with_decision():
+                    logger.debug(f"{subdir} already trained")
+                    decision = DecisionFrame.read_csv(subdir.decision_csv)
+                    if store_for_spindle:
+                        accs.append(MultiTrainerUtils.spindle_rows(decision, tt))
+                    yield decision, tt
+                    continue
+                logger.debug(f"Queueing {subdir}")
+                future = pool.submit(_train_in_worker, self.model_type, tt, subdir, n_jobs, silence)
+                pending[future] = tt
+                if len(pending) >= 2 * n_workers:
+                    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    yield from collect(done)
+            while len(pending) > 0:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                yield from collect(done)
+        if len(failures) > 0:
+            raise ClassifierTrainFailedError(
+                f"Failed to train {len(failures)} comparisons, including {failures[0][0].directory}"
+            ) from failures[0][1]
+        if store_for_spindle:
+            self._save_spindle(accs)
+
+    def _save_spindle(self, accs: Sequence[pd.DataFrame]) -> None:
+        """
+
+
+        Args:
+            accs: Rows from ``MultiTrainerUtils.spindle_rows``
+
+        """
+        SpindleFrame(pd.concat(accs, sort=False)).to_csv(self.spindle_path)
+        logger.info("Saved spindle.")
 
     def _iterate(
         self, df: WellFrame
@@ -195,12 +335,7 @@ class MultiTrainer:
         Returns:
 
         """
-        model = self.model_type.build()
-        model.train(tt.smalldf)
-        model.save(subdir.model_pkl)
-        decision = model.training_decision
-        decision.to_csv(subdir.decision_csv)
-        return decision
+        return MultiTrainerUtils.train_one(self.model_type, tt, subdir)
 
     def read_spindle(self) -> SpindleFrame:
         """
@@ -301,6 +436,19 @@ class MultiTrainer:
         return self.__length
 
 
+def _train_in_worker(
+    model_type: SklearnWfClassifierWithOob,
+    tt: TrainableCc,
+    subdir: ClassifierPath,
+    n_jobs: int,
+    silence: bool,
+) -> DecisionFrame:
+    # top-level so that it can be pickled for a process pool
+    with Tools.silenced(no_stderr=silence, no_stdout=silence):
+        with logger.suppressed(silence):
+            return MultiTrainerUtils.train_one(model_type, tt, subdir, n_jobs=n_jobs)
+
+
 class MultiTrainers:
     """"""
 
@@ -315,6 +463,7 @@ class MultiTrainers:
         restrict_include_null: bool = False,
         subsample_to: Optional[int] = None,
         controls: Optional[Iterable[str]] = None,
+        matrix: Optional[SharedFeatureMatrix] = None,
     ) -> MultiTrainer:
         """
 
@@ -328,6 +477,7 @@ class MultiTrainers:
             restrict_include_null: bool:  (Default value = False)
             subsample_to: Optional[int]:  (Default value = None)
             controls:
+            matrix: Features of `df` in shared memory, for training in multiple processes without copying
 
         Returns:
 
@@ -342,6 +492,7 @@ class MultiTrainers:
                 restrict_include_null=restrict_include_null,
                 subsample_to=subsample_to,
                 controls=controls,
+                matrix=matrix,
             )
 
         return MultiTrainer(save_dir, model_type, it_gen)
@@ -359,6 +510,7 @@ class MultiTrainers:
         high: Optional[int] = None,
         seed: int = 0,
         controls: Optional[Iterable[str]] = None,
+        matrix: Optional[SharedFeatureMatrix] = None,
     ) -> MultiTrainer:
         """
 
@@ -374,6 +526,7 @@ class MultiTrainers:
             high:
             seed:
             controls:
+            matrix: Features of `df` in shared memory, for training in multiple processes without copying
 
         Returns:
 
@@ -390,6 +543,7 @@ class MultiTrainers:
                 high=high,
                 seed=seed,
                 controls=controls,
+                matrix=matrix,
             )
 
         return MultiTrainer(save_dir, model_type, it_gen)
@@ -402,6 +556,7 @@ class MultiTrainers:
         model_type: SklearnWfClassifierWithOob,
         n_repeats: int = 1,
         subsample_to: Optional[int] = None,
+        matrix: Optional[SharedFeatureMatrix] = None,
     ) -> MultiTrainer:
         """
 
@@ -412,6 +567,7 @@ class MultiTrainers:
             model_type: SklearnWfClassifierWithOob:
             n_repeats: int:  (Default value = 1)
             subsample_to: Optional[int]:  (Default value = None)
+            matrix: Features of `df` in shared memory, for training in multiple processes without copying
 
         Returns:
 
@@ -419,7 +575,9 @@ class MultiTrainers:
 
         def it_gen():
             """ """
-            return CcIterators.vs_self(df, n_repeats=n_repeats, subsample_to=subsample_to)
+            return CcIterators.vs_self(
+                df, n_repeats=n_repeats, subsample_to=subsample_to, matrix=matrix
+            )
 
         return MultiTrainer(save_dir, model_type, it_gen)
 
@@ -433,6 +591,7 @@ class MultiTrainers:
         low: Optional[int] = None,
         high: Optional[int] = None,
         seed: int = 0,
+        matrix: Optional[SharedFeatureMatrix] = None,
     ) -> MultiTrainer:
         """
 
@@ -445,6 +604,7 @@ class MultiTrainers:
             low:
             high:
             seed:
+            matrix: Features of `df` in shared memory, for training in multiple processes without copying
 
         Returns:
 
@@ -453,7 +613,7 @@ class MultiTrainers:
         def it_gen():
             """ """
             return CcIterators.vs_self_random(
-                df, n_repeats=n_repeats, low=low, high=high, seed=seed
+                df, n_repeats=n_repeats, low=low, high=high, seed=seed, matrix=matrix
             )
 
         return MultiTrainer(save_dir, model_type, it_gen)
@@ -468,6 +628,7 @@ class MultiTrainers:
         restrict_to_same: Union[None, str, Set[str]] = None,
         restrict_include_null: bool = False,
         subsample_to: Optional[int] = None,
+        matrix: Optional[SharedFeatureMatrix] = None,
     ) -> MultiTrainer:
         """
 
@@ -480,6 +641,7 @@ class MultiTrainers:
             restrict_to_same:
             restrict_include_null: bool:  (Default value = False)
             subsample_to: Optional[int]:  (Default value = None)
+            matrix: Features of `df` in shared memory, for training in multiple processes without copying
 
         Returns:
 
@@ -493,6 +655,7 @@ class MultiTrainers:
                 restrict_to_same=restrict_to_same,
                 restrict_include_null=restrict_include_null,
                 subsample_to=subsample_to,
+                matrix=matrix,
             )
 
         return MultiTrainer(save_dir, model_type, it_gen)
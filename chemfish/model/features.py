@@ -2,13 +2,15 @@ from dataclasses import dataclass
 from chemfish.calc.feature_interpolation import *
 from chemfish.core.core_imports import *
 
+_valar_features = LazyMapping(lambda: {f.name: f for f in Features.select()}, "features")
+
 
 @dataclass(frozen=True)
 class FeatureType:
     """
 
     Attributes:
-        valar_feature: The Features row instance in Valar
+        feature_name: The name of the row in valar.features; the row itself is ``valar_feature``
         time_dependent: Whether the feature corresponds to frames in the video (possibly differing by a constant)
         stride_in_bytes: The number of bytes (in the poorly named features.floats) per value, such as 8 for a double value
         recommended_scale: A multiplier of the values for display, such as 1000 for values on that order
@@ -18,7 +20,7 @@ class FeatureType:
         generations: Generations of video data this feature can apply to.
     """
 
-    valar_feature: Features
+    feature_name: str
     time_dependent: bool
     stride_in_bytes: int
     recommended_scale: int
@@ -26,13 +28,20 @@ class FeatureType:
     is_interpolated: bool
     generations: Set[DataGeneration]
 
+    @property
+    def valar_feature(self) -> Features:
+        """The row in valar.features, fetched (along with the others) on first use."""
+        if self.feature_name not in _valar_features:
+            raise ValarLookupError(f"No feature {self.feature_name}")
+        return _valar_features[self.feature_name]
+
     @property
     def internal_name(self):
-        return self.valar_feature.name + ("-i" if self.is_interpolated else "")
+        return self.feature_name + ("-i" if self.is_interpolated else "")
 
     @property
     def external_name(self):
-        return self.valar_feature.name + ("[⌇]" if self.is_interpolated else "")
+        return self.feature_name + ("[⌇]" if self.is_interpolated else "")
 
     def calc(
         self,
@@ -69,11 +78,26 @@ class FeatureType:
                 .first()
             )
             if wf is None:
-                raise ValarLookupError(f"No feature {self.valar_feature.name} for well {well}")
+                raise ValarLookupError(f"No feature {self.feature_name} for well {well}")
         return self.from_blob(
             wf.floats, frame_timestamps, stim_timestamps, well, stringent=stringent
         )
 
+    def decode_blobs(self, blobs: Sequence[bytes], wells: Sequence[int]) -> Sequence[np.array]:
+        """
+        Decodes many blobs at once, without interpolating.
+        The results are the same as those of ``from_blob`` for non-interpolated features.
+
+        Args:
+            blobs: The raw WellFeatures.floats values
+            wells: The well IDs, in the same order; used only for logging
+
+        Returns:
+            A list of arrays, in the same order as ``blobs``
+
+        """
+        raise NotImplementedError()
+
     @abcd.abstractmethod
     def to_blob(self, arr: np.array) -> None:
         """
@@ -110,7 +134,7 @@ class FeatureType:
         raise NotImplementedError()
 
     def __repr__(self):
-        return self.valar_feature.name + ("[⌇]" if self.is_interpolated else "")
+        return self.feature_name + ("[⌇]" if self.is_interpolated else "")
 
     def __str__(self):
         return repr(self)
@@ -125,6 +149,37 @@ class FeatureType:
 class _ConsecutiveFrameFeature(FeatureType, metaclass=abcd.ABCMeta):
     """"""
 
+    def decode_blobs(self, blobs: Sequence[bytes], wells: Sequence[int]) -> Sequence[np.array]:
+        """
+        Decodes many blobs at once, without interpolating.
+        If every blob has the same length, they are decoded with a single ``np.frombuffer``,
+        and the returned arrays are rows of one matrix.
+
+        Args:
+            blobs: The raw WellFeatures.floats values
+            wells: The well IDs, in the same order; used only for logging
+
+        Returns:
+            A list of float32 arrays, in the same order as ``blobs``
+
+        """
+        lengths = {len(blob) for blob in blobs}
+        if len(lengths) == 1 and 0 not in lengths:
+            matrix = np.frombuffer(b"".join(blobs), dtype=">f4").reshape(len(blobs), -1)
+            matrix = matrix.astype(np.float32)
+            matrix[:, 0] = 0.0  # see from_blob
+            return list(matrix)
+        arrays = []
+        for blob, well in zip(blobs, wells):
+            if len(blob) == 0:
+                logger.warning(f"Empty {self.feature_name} feature array for well {well}")
+                arrays.append(np.empty(0, dtype=np.float32))
+            else:
+                floats = np.frombuffer(blob, dtype=">f4").astype(np.float32)
+                floats[0] = 0.0  # see from_blob
+                arrays.append(floats)
+        return arrays
+
     def from_blob(
         self,
         blob: bytes,
@@ -148,7 +203,7 @@ class _ConsecutiveFrameFeature(FeatureType, metaclass=abcd.ABCMeta):
         """
         well = Wells.fetch(well)
         if len(blob) == 0:
-            logger.warning(f"Empty {self.valar_feature.name} feature array for well {well.id}")
+            logger.warning(f"Empty {self.feature_name} feature array for well {well.id}")
             return np.empty(0, dtype=np.float32)
         floats = Tools.blob_to_signed_floats(blob)
         floats.setflags(write=1)  # blob_to_floats gets read-only arrays
@@ -166,8 +221,9 @@ class _Mi(_ConsecutiveFrameFeature):
     """"""
 
     def __init__(self, interpolated: bool):
-        v = Features.select().where(Features.name == "MI").first()
-        super().__init__(v, True, 4, 1000, "(10³)", interpolated, DataGeneration.all_generations())
+        super().__init__(
+            "MI", True, 4, 1000, "(10³)", interpolated, DataGeneration.all_generations()
+        )
 
     def to_blob(self, arr: np.array) -> bytes:
         """
@@ -188,14 +244,19 @@ class _Diff(_ConsecutiveFrameFeature):
     def __init__(
         self, name: str, tau: int, recommended_scale: int, recommended_unit: str, interpolated: bool
     ):
-        v = Features.select().where(Features.name == f"{name}({tau})").first()
         generations = (
             DataGeneration.pointgrey_generations()
             if interpolated
             else DataGeneration.all_generations()
         )
         super().__init__(
-            v, True, 4, recommended_scale, recommended_unit, interpolated, generations=generations
+            f"{name}({tau})",
+            True,
+            4,
+            recommended_scale,
+            recommended_unit,
+            interpolated,
+            generations=generations,
         )
 
     def to_blob(self, arr: np.array) -> bytes:
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import weakref
 from dataclasses import dataclass
 
 from chemfish.core.core_imports import *
@@ -105,6 +106,8 @@ class Treatments:
     Any duplicate Treatment instances (determined by Treatment.__eq__ will be removed,
     and the instances will be sorted by Treatment.__lt__.
     This has a __str__ and __repr__ that simplify the Treatment contents.
+    Instances should be treated as immutable; the hash is computed once.
+    Use ``Treatments.interned`` to share a single instance between equal values, such as in WellFrames.
 
     """
 
@@ -169,7 +172,34 @@ class Treatments:
         return str(self)
 
     def __hash__(self):
-        return hash("".join(str(self.treatments)))
+        # instances unpickled from older versions won't have _hash
+        h = getattr(self, "_hash", None)
+        if h is None:
+            h = hash(tuple(self.treatments))
+            self._hash = h
+        return h
+
+    @classmethod
+    def interned(
+        cls, treatments: Union[Treatments, Treatment, Collection[Treatment]]
+    ) -> Treatments:
+        """
+        Returns a canonical instance equal to ``Treatments.of(treatments)``.
+        Equal values share one instance for as long as any reference to it exists,
+        so a WellFrame with many wells holds only one instance per distinct set of treatments.
+
+        Args:
+            treatments:
+
+        Returns:
+
+        """
+        treatments = cls.of(treatments)
+        existing = _INTERNED.get(treatments)
+        if existing is not None:
+            return existing
+        _INTERNED[treatments] = treatments
+        return treatments
 
     def __getitem__(self, treatment_index: int) -> Treatment:
         """
@@ -212,4 +242,8 @@ class Treatments:
             raise XTypeError(f"Invalid type {type(treatments)} for treatments {treatments}")
 
 
+# canonical Treatments instances for Treatments.interned
+_INTERNED = weakref.WeakValueDictionary()
+
+
 __all__ = ["Treatment", "Treatments"]
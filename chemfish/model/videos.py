@@ -12,7 +12,9 @@ from chemfish.calc.roi_tools import *
 from chemfish.construction.wf_builders import *
 from chemfish.viz.utils.kale_rc import *
 
-stim_colors = {s.name: "#" + s.default_color for s in Stimuli.select()}
+stim_colors = LazyMapping(
+    lambda: {s.name: "#" + s.default_color for s in Stimuli.select()}, "stim_colors"
+)
 
 
 def _draw_rectangle(frame, x0, y0, x1, y1, thickness: int, color):
@@ -2,6 +2,7 @@ from __future__ import annotations
 from dataclasses import dataclass
 
 import librosa
+import soundfile
 
 from chemfish.core.core_imports import *
 
@@ -112,8 +113,7 @@ class Waveform:
                 f"New sampling rate is higher than current of {self.sampling_rate}"
             )
         chunk_size = int(self.sampling_rate / new_sampling_hertz)
-        groups = [self.data[x : x + chunk_size] for x in range(0, len(self.data), chunk_size)]
-        means = np.array([sum(group) / len(group) for group in groups])
+        means = self.chunk_means(self.data, chunk_size)
         return Waveform(
             self.name,
             self.path,
@@ -124,6 +124,86 @@ class Waveform:
             self.description,
         )
 
+    @classmethod
+    def read_chunk_mean(
+        cls,
+        path: PathLike,
+        new_sampling_hertz: float,
+        start: int = 0,
+        stop: Optional[int] = None,
+        block_size: int = 2 ** 20,
+        name: Optional[str] = None,
+        description: Optional[str] = None,
+    ) -> Waveform:
+        """
+        Reads an audio file (such as a FLAC) and downsamples it like ``downsample(resample=False)``,
+        but without loading the whole recording into memory.
+        The file is read in blocks of about ``block_size`` samples, each a whole number of chunks.
+
+        Args:
+            path: The path to any file that ``soundfile`` can read
+            new_sampling_hertz: The rate to downsample to
+            start: The first sample to read
+            stop: The sample to stop reading at (exclusive), or None to read to the end
+            block_size: The approximate number of samples to read at once
+            name: The name of the Waveform; the filename by default
+            description: The description of the Waveform
+
+        Returns:
+            A new Waveform with ``path`` set
+
+        """
+        with soundfile.SoundFile(str(path)) as f:
+            sampling_rate = f.samplerate
+            if new_sampling_hertz > sampling_rate:
+                raise OutOfRangeError(
+                    f"New sampling rate is higher than current of {sampling_rate}"
+                )
+            chunk_size = int(sampling_rate / new_sampling_hertz)
+            # keep block boundaries on chunk boundaries so that no chunk is split
+            block_size = max(1, block_size // chunk_size) * chunk_size
+            stop = f.frames if stop is None else min(stop, f.frames)
+            f.seek(min(start, stop))
+            blocks = []
+            for i in range(min(start, stop), stop, block_size):
+                data = f.read(min(block_size, stop - i))
+                blocks.append(cls.chunk_means(data, chunk_size))
+        means = np.concatenate(blocks) if len(blocks) > 0 else np.empty(0)
+        return cls(
+            Path(path).name if name is None else name,
+            str(path),
+            means,
+            new_sampling_hertz,
+            None,
+            None,
+            description,
+        )
+
+    @classmethod
+    def chunk_means(cls, data: np.array, chunk_size: int) -> np.array:
+        """
+        Splits an array into consecutive chunks along the first axis and calculates the mean of each.
+        The last chunk may be shorter.
+
+        Args:
+            data: A 1D array, or a 2D array of samples × channels
+            chunk_size: The number of samples per chunk
+
+        Returns:
+            A float64 array with ``ceil(len(data) / chunk_size)`` rows
+
+        """
+        if chunk_size < 1:
+            raise OutOfRangeError(f"Chunk size {chunk_size} < 1")
+        data = np.asarray(data)
+        n_full = len(data) // chunk_size
+        full = data[: n_full * chunk_size].reshape(n_full, chunk_size, *data.shape[1:])
+        means = full.mean(axis=1, dtype=np.float64)
+        if n_full * chunk_size < len(data):
+            rest = data[n_full * chunk_size :].mean(axis=0, dtype=np.float64)
+            means = np.concatenate([means, rest[None]])
+        return means
+
     def _downsample(self, new_sampling_hertz: float) -> Waveform:
         """
         Downsamples to a new rate using librosa.resample.
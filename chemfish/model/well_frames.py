@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from pandas.core.groupby import GroupBy
 
+from chemfish.calc.feature_smoothing import FeatureSmoothing
+from chemfish.calc.grouped_reductions import GroupedReductions
 from chemfish.core.core_imports import *
 from chemfish.namers.compound_namers import *
 from chemfish.model.treatments import *
@@ -23,6 +25,51 @@ class AbsWellFrame(TypedDf):
             return super().__getitem__(item)
             # return self.vanilla().reset_index().__getitem__(item)
 
+    def _level_mask(self, name: str, values: Iterable[Any]) -> np.ndarray:
+        """
+        Finds the rows whose meta column ``name`` is in ``values``.
+        The index levels are already stored as unique values plus integer codes,
+        so this tests each unique value once and then maps the result through the codes,
+        without materializing the column.
+
+        Args:
+            name: The name of the meta column
+            values: Any iterable of values to match
+
+        Returns:
+            A boolean array with one element per row
+
+        """
+        values = list(values)
+        if not isinstance(self.index, pd.MultiIndex):
+            return np.asarray(self[name].isin(values))
+        i = self.index.names.index(name)
+        hits = self.index.levels[i].isin(values)
+        # missing values have code -1, which maps to the appended False
+        return np.append(hits, False)[self.index.codes[i]]
+
+    def _level_predicate(self, name: str, predicate: Callable[[Any], bool]) -> np.ndarray:
+        """
+        Finds the rows whose meta column ``name`` satisfies ``predicate``.
+        Like ``_level_mask``, the predicate is called once per unique value in the index level, not once per row.
+        For columns like ``treatments`` and ``c_ids``, the number of unique values is the number of
+        distinct combinations, which is typically far smaller than the number of wells.
+
+        Args:
+            name: The name of the meta column
+            predicate: A function of a single value; never called on missing values
+
+        Returns:
+            A boolean array with one element per row
+
+        """
+        if not isinstance(self.index, pd.MultiIndex):
+            return np.asarray(self[name].map(lambda v: v is not None and bool(predicate(v))))
+        i = self.index.names.index(name)
+        level = self.index.levels[i]
+        hits = np.fromiter((bool(predicate(v)) for v in level), dtype=bool, count=len(level))
+        return np.append(hits, False)[self.index.codes[i]]
+
     @classmethod
     def of(cls, df: pd.DataFrame) -> __qualname__:
         """
@@ -111,10 +158,8 @@ class AbsWellFrame(TypedDf):
         Returns:
             The number of columns
         """
-        for i in range(0, len(self.columns)):
-            if not self[self.columns[-i - 1]].isnull().values.any():
-                return i
-        return 0
+        complete = np.flatnonzero(~self._columns_with_nans())
+        return 0 if len(complete) == 0 else len(self.columns) - 1 - int(complete[-1])
 
     def count_nans_at_start(self) -> int:
         """
@@ -124,10 +169,8 @@ class AbsWellFrame(TypedDf):
             The number of columns
 
         """
-        for i in range(0, len(self.columns)):
-            if not self[self.columns[i]].isnull().values.any():
-                return i
-        return 0
+        complete = np.flatnonzero(~self._columns_with_nans())
+        return 0 if len(complete) == 0 else int(complete[0])
 
     def unify_last_nans_inplace(self, fill_value: float = np.NaN) -> int:
         """
@@ -142,12 +185,12 @@ class AbsWellFrame(TypedDf):
         Returns:
 
         """
-        n_unified = 0
-        for i in range(len(self.columns) - 1, 0, -1):
-            if not self[self.columns[i]].isnull().values.any():
-                return n_unified
-            self[self.columns[i]] = fill_value
-            n_unified += 1
+        # the first column is never replaced
+        with_nans = self._columns_with_nans()[1:]
+        complete = np.flatnonzero(~with_nans)
+        n_unified = len(with_nans) if len(complete) == 0 else len(with_nans) - 1 - int(complete[-1])
+        if n_unified > 0:
+            self.iloc[:, len(self.columns) - n_unified :] = fill_value
         return n_unified
 
     def unify_first_nans_inplace(self, fill_value: float = np.NaN) -> int:
@@ -162,14 +205,35 @@ class AbsWellFrame(TypedDf):
         Returns:
 
         """
-        n_unified = 0
-        for i in range(0, len(self.columns)):
-            if not self[self.columns[i]].isnull().values.any():
-                return n_unified
-            self[self.columns[i]] = fill_value
-            n_unified += 1
+        with_nans = self._columns_with_nans()
+        complete = np.flatnonzero(~with_nans)
+        n_unified = len(with_nans) if len(complete) == 0 else int(complete[0])
+        if n_unified > 0:
+            self.iloc[:, :n_unified] = fill_value
         return n_unified
 
+    def _columns_with_nans(self, chunk_size: int = 10000) -> np.ndarray:
+        """
+        Finds which feature columns contain any null value, in one pass over the features.
+        Works on ``chunk_size`` columns at a time to limit the size of the temporary boolean array.
+
+        Args:
+            chunk_size: The number of columns to check at once
+
+        Returns:
+            A boolean array with one element per column
+
+        """
+        values = self.values
+        if not np.issubdtype(values.dtype, np.floating):
+            return np.asarray(pd.isnull(values).any(axis=0), dtype=bool)
+        result = np.zeros(values.shape[1], dtype=bool)
+        for start in range(0, values.shape[1], chunk_size):
+            result[start : start + chunk_size] = np.isnan(
+                values[:, start : start + chunk_size]
+            ).any(axis=0)
+        return result
+
     def completion(self) -> __qualname__:
         """
         Interpolates any NaN or 0.0 with the value from the previous frame, returning a view. The metadata is preserved.
@@ -205,9 +269,9 @@ class AbsWellFrame(TypedDf):
 
         """
         if override_fps is None:
-            fps = Tools.only(
-                {ValarTools.frames_per_second(r) for r in self["run"].unique()}, name="framerates"
-            )
+            runs = self["run"].unique()
+            ValarTools.cache_runs(runs)
+            fps = Tools.only({ValarTools.frames_per_second(r) for r in runs}, name="framerates")
         else:
             fps = override_fps
         return self.__class__.retype(
@@ -265,27 +329,40 @@ class AbsWellFrame(TypedDf):
 
         """
         name = Tools.to_true_iterable(name)
-        return self.__class__.retype(self[self.names().isin(name)])
+        return self.__class__.retype(self[self._level_mask("name", name)])
 
     def smooth(
         self,
-        function=lambda s: s.mean(),
+        function: Optional[Callable[[Any], pd.DataFrame]] = None,
         window_size: int = 10,
         window_type: Optional[str] = "triang",
+        chunk_size: Optional[int] = 10000,
     ) -> __qualname__:
         """
         Applies a function along a sliding window of the features using pd.DataFrame.rolling.
+        If ``function`` is None, calculates the (weighted) mean directly on the feature matrix with ``FeatureSmoothing``,
+        which gives the same result as ``lambda s: s.mean()`` much faster.
 
         Args:
-            function:
+            function: A function of the pandas rolling window object, such as ``lambda s: s.median()``;
+                      None for the mean
             window_size: The number of features in each window
             window_type: An argument to pd.DataFrame.rolling ``win_type``
+            chunk_size: If ``function`` is None, the number of columns to smooth at once, to limit memory
 
         Returns:
             The same WellFrame with smoothed features
 
         """
-        results = function(self.rolling(window_size, axis=1, min_periods=1, win_type=window_type))
+        if function is None:
+            smoothed = FeatureSmoothing.rolling_mean(
+                self.values, window_size, window_type, chunk_size=chunk_size
+            )
+            results = pd.DataFrame(smoothed, columns=self.columns, copy=False)
+        else:
+            results = function(
+                self.rolling(window_size, axis=1, min_periods=1, win_type=window_type)
+            )
         return self.__with_new_features(results)
 
     def constrain(self, lower: float, upper: float) -> __qualname__:
@@ -327,7 +404,7 @@ class AbsWellFrame(TypedDf):
 
         """
         runs = set(Runs.fetch_ids_unchecked(runs))
-        return self.__class__.retype(self[self["run"].isin(runs)])
+        return self.__class__.retype(self[self._level_mask("run", runs)])
 
     def without_run(self, runs: Union[int, Set[int]]) -> __qualname__:
         """
@@ -340,7 +417,7 @@ class AbsWellFrame(TypedDf):
 
         """
         runs = set(Runs.fetch_ids_unchecked(runs))
-        return self.__class__.retype(self[~self["run"].isin(runs)])
+        return self.__class__.retype(self[~self._level_mask("run", runs)])
 
     def apply_by_name(self, function) -> __qualname__:
         """
@@ -373,7 +450,9 @@ class AbsWellFrame(TypedDf):
         Returns:
 
         """
-        return self[self["b_ids"].map(str) == "[]"]
+        return self.__class__.retype(
+            self[self._level_predicate("b_ids", lambda bids: len(bids) == 0)]
+        )
 
     def with_treatments_all_only(self, treatments: Treatments) -> __qualname__:
         """
@@ -386,7 +465,9 @@ class AbsWellFrame(TypedDf):
 
         """
         treatments = Treatments.of(treatments)
-        return self[self["treatments"] == treatments]
+        return self.__class__.retype(
+            self[self._level_predicate("treatments", lambda ts: ts == treatments)]
+        )
 
     def with_treatments_any_only(self, treatments: Treatments) -> __qualname__:
         """
@@ -400,10 +481,10 @@ class AbsWellFrame(TypedDf):
         """
         treatments = Treatments.of(treatments)
         z = self.__class__.retype(
-            self[self["treatments"].map(lambda ts: any([t in ts for t in treatments]))]
+            self[self._level_predicate("treatments", lambda ts: any([t in ts for t in treatments]))]
         )
         return self.__class__.retype(
-            z[z["treatments"].map(lambda ts: all([t in treatments for t in ts]))]
+            z[z._level_predicate("treatments", lambda ts: all([t in treatments for t in ts]))]
         )
 
     def with_treatments_any(self, treatments: Treatments) -> __qualname__:
@@ -418,7 +499,7 @@ class AbsWellFrame(TypedDf):
         """
         treatments = Treatments.of(treatments)
         return self.__class__.retype(
-            self[self["treatments"].map(lambda ts: any([t in ts for t in treatments]))]
+            self[self._level_predicate("treatments", lambda ts: any([t in ts for t in treatments]))]
         )
 
     def with_treatments_all(self, treatments: Treatments) -> __qualname__:
@@ -433,7 +514,7 @@ class AbsWellFrame(TypedDf):
         """
         treatments = Treatments.of(treatments)
         return self.__class__.retype(
-            self[self["treatments"].map(lambda ts: all([t in ts for t in treatments]))]
+            self[self._level_predicate("treatments", lambda ts: all([t in ts for t in treatments]))]
         )
 
     def with_compound_at_dose_any(
@@ -452,7 +533,11 @@ class AbsWellFrame(TypedDf):
         compound = Compounds.fetch(compound)
         dose = float(dose)
         d = self.with_compounds_all(compound)
-        d = d[d["treatments"].map(lambda ts: dose in [t.dose for t in ts if t.cid == compound.id])]
+        d = d[
+            d._level_predicate(
+                "treatments", lambda ts: dose in [t.dose for t in ts if t.cid == compound.id]
+            )
+        ]
         return self.__class__.retype(d)
 
     def with_compounds_all_only(
@@ -468,7 +553,9 @@ class AbsWellFrame(TypedDf):
 
         """
         compounds = set(InternalTools.fetch_all_ids(Compounds, compounds))
-        return self.__class__.retype(self[self["c_ids"].map(lambda cids: set(cids) == compounds)])
+        return self.__class__.retype(
+            self[self._level_predicate("c_ids", lambda cids: set(cids) == compounds)]
+        )
 
     def with_compounds_any_only(
         self, compounds: Union[int, str, Compounds, Set[Union[int, str, Compounds]]]
@@ -484,10 +571,10 @@ class AbsWellFrame(TypedDf):
         """
         compounds = set(InternalTools.fetch_all_ids(Compounds, compounds))
         z = self.__class__.retype(
-            self[self["c_ids"].map(lambda cids: any([c in cids for c in compounds]))]
+            self[self._level_predicate("c_ids", lambda cids: any([c in cids for c in compounds]))]
         )
         return self.__class__.retype(
-            z[z["c_ids"].map(lambda cids: all([c in compounds for c in cids]))]
+            z[z._level_predicate("c_ids", lambda cids: all([c in compounds for c in cids]))]
         )
 
     def with_batches_all_only(
@@ -503,7 +590,9 @@ class AbsWellFrame(TypedDf):
 
         """
         batches = set(InternalTools.fetch_all_ids(Batches, batches))
-        return self.__class__.retype(self[self["b_ids"].map(lambda bids: set(bids) == batches)])
+        return self.__class__.retype(
+            self[self._level_predicate("b_ids", lambda bids: set(bids) == batches)]
+        )
 
     def with_batches_any_only(
         self, batches: Union[int, str, Batches, Set[Union[int, str, Batches]]]
@@ -519,10 +608,10 @@ class AbsWellFrame(TypedDf):
         """
         batches = set(InternalTools.fetch_all_ids(Batches, batches))
         z = self.__class__.retype(
-            self[self["b_ids"].map(lambda bids: any([c in bids for c in batches]))]
+            self[self._level_predicate("b_ids", lambda bids: any([c in bids for c in batches]))]
         )
         return self.__class__.retype(
-            z[z["b_ids"].map(lambda bids: all([c in batches for c in bids]))]
+            z[z._level_predicate("b_ids", lambda bids: all([c in batches for c in bids]))]
         )
 
     def with_compounds_all(
@@ -539,7 +628,7 @@ class AbsWellFrame(TypedDf):
         """
         compounds = tuple(InternalTools.fetch_all_ids(Compounds, compounds))
         return self.__class__.retype(
-            self[self["c_ids"].map(lambda cids: all([c in cids for c in compounds]))]
+            self[self._level_predicate("c_ids", lambda cids: all([c in cids for c in compounds]))]
         )
 
     def with_batches_all(
@@ -556,7 +645,7 @@ class AbsWellFrame(TypedDf):
         """
         batches = tuple(InternalTools.fetch_all_ids(Batches, batches))
         return self.__class__.retype(
-            self[self["b_ids"].map(lambda bids: all([b in bids for b in batches]))]
+            self[self._level_predicate("b_ids", lambda bids: all([b in bids for b in batches]))]
         )
 
     def with_compounds_any(
@@ -573,7 +662,7 @@ class AbsWellFrame(TypedDf):
         """
         compounds = InternalTools.fetch_all_ids(Compounds, compounds)
         return self.__class__.retype(
-            self[self["c_ids"].map(lambda cids: any([c in cids for c in compounds]))]
+            self[self._level_predicate("c_ids", lambda cids: any([c in cids for c in compounds]))]
         )
 
     def with_batches_any(
@@ -590,7 +679,7 @@ class AbsWellFrame(TypedDf):
         """
         batches = InternalTools.fetch_all_ids(Batches, batches)
         return self.__class__.retype(
-            self[self["b_ids"].map(lambda bids: any([b in bids for b in batches]))]
+            self[self._level_predicate("b_ids", lambda bids: any([b in bids for b in batches]))]
         )
 
     def without_compounds_any(
@@ -607,7 +696,9 @@ class AbsWellFrame(TypedDf):
         """
         compounds = InternalTools.fetch_all_ids(Compounds, compounds)
         return self.__class__.retype(
-            self[self["c_ids"].map(lambda cids: all([c not in cids for c in compounds]))]
+            self[
+                self._level_predicate("c_ids", lambda cids: all([c not in cids for c in compounds]))
+            ]
         )
 
     def without_batches_any(
@@ -624,7 +715,7 @@ class AbsWellFrame(TypedDf):
         """
         batches = InternalTools.fetch_all_ids(Batches, batches)
         return self.__class__.retype(
-            self[self["b_ids"].map(lambda bids: all([b not in bids for b in batches]))]
+            self[self._level_predicate("b_ids", lambda bids: all([b not in bids for b in batches]))]
         )
 
     def without_compounds_all(
@@ -641,7 +732,9 @@ class AbsWellFrame(TypedDf):
         """
         compounds = tuple(InternalTools.fetch_all_ids(Compounds, compounds))
         return self.__class__.retype(
-            self[self["c_ids"].map(lambda cids: any([c not in cids for c in compounds]))]
+            self[
+                self._level_predicate("c_ids", lambda cids: any([c not in cids for c in compounds]))
+            ]
         )
 
     def without_batches_all(
@@ -658,7 +751,7 @@ class AbsWellFrame(TypedDf):
         """
         batches = tuple(InternalTools.fetch_all_ids(Batches, batches))
         return self.__class__.retype(
-            self[self["b_ids"].map(lambda bids: any([b not in bids for b in batches]))]
+            self[self._level_predicate("b_ids", lambda bids: any([b not in bids for b in batches]))]
         )
 
     def with_controls(
@@ -676,7 +769,7 @@ class AbsWellFrame(TypedDf):
 
         """
         matches = self.unique_controls_matching(names, **attributes)
-        return self.__class__.retype(self[self["control_type"].isin(matches)])
+        return self.__class__.retype(self[self._level_mask("control_type", matches)])
 
     def without_controls(
         self, names: Union[None, str, Iterable[str]] = None, **attributes
@@ -692,7 +785,7 @@ class AbsWellFrame(TypedDf):
 
         """
         matches = self.unique_controls_matching(names, **attributes)
-        return self.__class__.retype(self[~self["control_type"].isin(matches)])
+        return self.__class__.retype(self[~self._level_mask("control_type", matches)])
 
     def unique_controls_matching(
         self,
@@ -841,9 +934,7 @@ class AbsWellFrame(TypedDf):
             The aggregated WellFrame
 
         """
-        return self.agg_by(
-            ["name", "control_type", "control_type_id"], function, function_kwargs=function_kwargs
-        )
+        return self.agg_by(["name", "control_type", "control_type_id"], function, **function_kwargs)
 
     def agg_by_important(
         self,
@@ -885,7 +976,7 @@ class AbsWellFrame(TypedDf):
         return self.agg_by(
             {c for c in WellFrameColumns.required_names if c not in WellFrameColumns.position_cols},
             function,
-            function_kwargs=function_kwargs,
+            **function_kwargs,
         )
 
     def agg_by(
@@ -903,8 +994,11 @@ class AbsWellFrame(TypedDf):
         Args:
             index_names: List of index names to group by
             function: Either a function or a string in the list:
-                      ["mean", "std", "median", "var", "sum", "sem", "prod", "size", "min", "max", "first", "last"]
+                      ["mean", "std", "median", "var", "sum", "sem", "prod", "size", "min", "max", "first", "last", "quantile"]
                       **You should strongly prefer using a string if possible: the performance is massively better.**
+                      "mean", "sum", "std", "var", "sem", "min", "max", "median", and "quantile" (with a single ``q``)
+                      are computed directly on the feature matrix (see ``GroupedReductions``) without a pandas groupby.
+            function_kwargs: Passed to the function, such as ``q`` for "quantile"
 
         Returns:
             A WellFrame-like object with only the "name" column guaranteed to exist
@@ -914,6 +1008,9 @@ class AbsWellFrame(TypedDf):
         """
         # incredibly, Pandas groupby breaks if it's a set
         index_names = [index_names] if isinstance(index_names, str) else list(index_names)
+        fast = self._agg_by_codes(index_names, function, function_kwargs)
+        if fast is not None:
+            return fast
         std_fn = self._get_fn(function, function_kwargs)
         # dropna=False was added in Pandas 1.1
         # HOWEVER! Without resetting the index, rows with NaN will be dropped, EVEN WITH SETTING dropna=False!!
@@ -928,6 +1025,42 @@ class AbsWellFrame(TypedDf):
         else:
             return GroupedWellFrame(std_fn(df.groupby(index_names, sort=False, dropna=False)))
 
+    def _agg_by_codes(
+        self, index_names: Sequence[str], function, function_kwargs: Mapping[str, Any]
+    ) -> Optional[GroupedWellFrame]:
+        """
+        Aggregates by factorizing the index codes of ``index_names`` and reducing the feature matrix directly.
+
+        Args:
+            index_names: The index names to group by
+            function: The name of the function
+            function_kwargs: Keyword arguments for the function
+
+        Returns:
+            The result, or None if this function or WellFrame needs a pandas groupby
+
+        """
+        if not GroupedReductions.supports(function, function_kwargs):
+            return None
+        if not isinstance(self.index, pd.MultiIndex) or len(self.columns) == 0:
+            return None
+        if any(c not in self.index.names for c in index_names):
+            return None
+        values = self.values
+        if not np.issubdtype(values.dtype, np.floating):
+            return None
+        codes = [self.index.codes[self.index.names.index(c)] for c in index_names]
+        groups, firsts = GroupedReductions.factorize(codes)
+        reduced = GroupedReductions.reduce(values, groups, len(firsts), function, **function_kwargs)
+        keys = self.index[firsts]
+        if len(index_names) == 1:
+            index = pd.Index(keys.get_level_values(index_names[0]), name=index_names[0])
+        else:
+            index = pd.MultiIndex.from_arrays(
+                [keys.get_level_values(c) for c in index_names], names=index_names
+            )
+        return GroupedWellFrame(pd.DataFrame(reduced, index=index, columns=self.columns))
+
     def _get_fn(self, function, function_kwargs) -> Optional[Callable[[GroupBy], pd.DataFrame]]:
         if callable(function):
             function = function.__name__
@@ -1376,7 +1509,7 @@ class WellFrame(AbsWellFrame):
 
         """
         wells = InternalTools.fetch_all_ids_unchecked(Wells, Tools.to_true_iterable(wells))
-        return self.__class__.retype(self[self["well"].isin(wells)])
+        return self.__class__.retype(self[self._level_mask("well", wells)])
 
     def n_replicates(self) -> Mapping[str, int]:
         """ """
@@ -175,6 +175,36 @@ class WellFrameColumns:
 
     machine_cols = {"sauron_config", "sauron"}
 
+    # these depend only on the run, so they're computed once per run
+    run_cols = {
+        "run",
+        "tag",
+        "run_description",
+        "submission",
+        "physical_plate",
+        "experiment_id",
+        "experiment_name",
+        "experiment_description",
+        "battery_id",
+        "battery_name",
+        "template_plate_id",
+        "template_plate_name",
+        "sauron_config",
+        "sauron",
+        "person_run",
+        "person_plated",
+        "datetime_run",
+        "datetime_dosed",
+        "datetime_plated",
+        "datetime_inserted",
+    }
+
+    # these are computed from the well index and plate type
+    computed_position_cols = {"row", "column", "well_label"}
+
+    # these are computed from a single list of Treatment instances per well
+    treatment_cols = {"treatments", "b_ids", "c_ids"}
+
     battery_cols = {"battery_id", "battery_name"}
 
     experiment_cols = {
@@ -190,6 +220,122 @@ class WellFrameColumns:
 class WellFrameColumnTools:
     """"""
 
+    @classmethod
+    def build_meta(
+        cls,
+        well_to_treatments: Mapping[Wells, Sequence[WellTreatments]],
+        columns: Mapping[str, Callable[[Wells, Sequence[WellTreatments]], Any]],
+    ) -> pd.DataFrame:
+        """
+        Builds the meta columns for wells, in the order of ``well_to_treatments``.
+        Reserved columns that depend only on the run (``WellFrameColumns.run_cols``) are computed once per run.
+        The ``row``, ``column``, and ``well_label`` columns are computed from the well indices with array arithmetic.
+        The ``treatments``, ``b_ids``, and ``c_ids`` are computed from one list of ``Treatment``s per well.
+        Other columns, including those from ``WellFrameBuilder.with_column``, call their functions for every well.
+
+        Args:
+            well_to_treatments: A dict mapping each well to its WellTreatments (with non-null batches)
+            columns: A dict mapping column names to functions of the well and its WellTreatments
+
+        Returns:
+            A DataFrame with one object-typed column per entry in ``columns``, in the same order
+
+        """
+        wells = list(well_to_treatments.keys())
+        n_wells = len(wells)
+        # the first well of each run stands in for the run
+        run_ids = np.array([w.run_id for w in wells], dtype=np.int64)
+        unique_runs, first_of_run, run_positions = np.unique(
+            run_ids, return_index=True, return_inverse=True
+        )
+        run_reps = [wells[i] for i in first_of_run]
+        computed = {}
+        for name in columns.keys():
+            if name in WellFrameColumns.run_cols:
+                fn = columns[name]
+                per_run = np.empty(len(unique_runs), dtype=object)
+                per_run[:] = [fn(w, ()) for w in run_reps]
+                computed[name] = per_run[run_positions]
+        if any(c in columns for c in WellFrameColumns.computed_position_cols):
+            computed.update(cls._position_columns(wells, run_reps, run_positions))
+        if any(c in columns for c in WellFrameColumns.treatment_cols):
+            computed.update(cls._treatment_columns(well_to_treatments))
+        data = OrderedDict()
+        for name, fn in columns.items():
+            if name in computed:
+                values = computed[name]
+            else:
+                values = [fn(well, ts) for well, ts in well_to_treatments.items()]
+            data[name] = pd.Series(values, dtype=object)
+        return pd.DataFrame(data, index=np.arange(n_wells))
+
+    @classmethod
+    def _position_columns(
+        cls, wells: Sequence[Wells], run_reps: Sequence[Wells], run_positions: np.ndarray
+    ) -> Mapping[str, np.ndarray]:
+        """
+        Computes the row, column, and well label from the well index and each run's plate type.
+
+        Args:
+            wells: The wells, in order
+            run_reps: One well for each run
+            run_positions: The index in ``run_reps`` for each well
+
+        Returns:
+            A dict mapping column names to arrays
+
+        """
+        plate_types = [w.run.plate.plate_type for w in run_reps]
+        n_rows = np.array([p.n_rows for p in plate_types], dtype=np.int64)[run_positions]
+        n_cols = np.array([p.n_columns for p in plate_types], dtype=np.int64)[run_positions]
+        indices = np.array([w.well_index for w in wells], dtype=np.int64)
+        labels = np.empty(len(wells), dtype=object)
+        for r, c in {(p.n_rows, p.n_columns) for p in plate_types}:
+            wb = WB1(r, c)
+            lookup = np.empty(r * c + 1, dtype=object)
+            lookup[1:] = [wb.index_to_label(i) for i in range(1, r * c + 1)]
+            mask = (n_rows == r) & (n_cols == c)
+            labels[mask] = lookup[indices[mask]]
+        return {
+            "row": (indices - 1) // n_cols + 1,
+            "column": (indices - 1) % n_cols + 1,
+            "well_label": labels,
+        }
+
+    @classmethod
+    def _treatment_columns(
+        cls, well_to_treatments: Mapping[Wells, Sequence[WellTreatments]]
+    ) -> Mapping[str, Sequence[Any]]:
+        """
+        Computes the treatments, b_ids, and c_ids.
+        Wells with the same batches and doses share the same (interned) instances,
+        so each distinct combination builds its ``Treatment``s only once.
+
+        Args:
+            well_to_treatments: A dict mapping each well to its WellTreatments
+
+        Returns:
+            A dict mapping column names to lists
+
+        """
+        treatments, b_ids, c_ids = [], [], []
+        memo = {}
+        for ts in well_to_treatments.values():
+            ts = [t for t in ts if t.batch_id is not None]
+            key = tuple((t.batch_id, t.micromolar_dose) for t in ts)
+            if key not in memo:
+                tl = [Treatment.from_well_treatment(t) for t in ts]
+                memo[key] = (
+                    Treatments.interned(tl),
+                    tuple({t.bid for t in tl}),
+                    tuple({t.cid for t in tl}),
+                )
+            value = memo[key]
+            treatments.append(value[0])
+            b_ids.append(value[1])
+            c_ids.append(value[2])
+        return {"treatments": treatments, "b_ids": b_ids, "c_ids": c_ids}
+
     int32_cols = {
         "well",
         "well_index",
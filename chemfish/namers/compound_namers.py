@@ -253,16 +253,22 @@ class TieredCompoundNamer(CompoundNamer):
     """
 
     # high-precedence, manual, drugbank:5.0.10:secondary_id, chembl:api:fda_name, chembl:api:inn_name, chembl:api:usan_name, valinor, dmso_stocks, chembl:api:preferred_name
-    elegant_sources: Sequence[RefLike] = [
-        x
-        for x in Refs.fetch_all_or_none(InternalTools.load_resource("chem", "refs_few.lines"))
-        if x is not None
-    ]
-    elegant_sources_extended: Sequence[RefLike] = [
-        x
-        for x in Refs.fetch_all_or_none(InternalTools.load_resource("chem", "refs_more.lines"))
-        if x is not None
-    ]
+    elegant_sources: Sequence[RefLike] = Lazy(
+        lambda: [
+            x
+            for x in Refs.fetch_all_or_none(InternalTools.load_resource("chem", "refs_few.lines"))
+            if x is not None
+        ],
+        "TieredCompoundNamer.elegant_sources",
+    )
+    elegant_sources_extended: Sequence[RefLike] = Lazy(
+        lambda: [
+            x
+            for x in Refs.fetch_all_or_none(InternalTools.load_resource("chem", "refs_more.lines"))
+            if x is not None
+        ],
+        "TieredCompoundNamer.elegant_sources_extended",
+    )
 
     def __init__(
         self,
@@ -274,12 +280,20 @@ class TieredCompoundNamer(CompoundNamer):
         transform: Optional[Callable[[str], str]] = None,
     ):
         super().__init__(as_of)
-        self.sources = [r.id for r in self._choose_refs(sources)]
+        self._sources = sources
+        self._source_ids = None
         self.max_length = max_length
         self.use_cid_if_empty = use_cid_if_empty
         self.allow_numeric = allow_numeric
         self.transform = lambda s: s if transform is None else transform
 
+    @property
+    def sources(self) -> Sequence[int]:
+        """The IDs of the refs to use, in order of preference; fetched on first use."""
+        if self._source_ids is None:
+            self._source_ids = [r.id for r in self._choose_refs(self._sources)]
+        return self._source_ids
+
     @classmethod
     def _choose_refs(cls, sources: Optional[Sequence[RefLike]] = None) -> Sequence[Refs]:
         """
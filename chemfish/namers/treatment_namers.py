@@ -76,6 +76,20 @@ rname = re.compile(r"\${?([cd]?id\|)?name(?:[:.]([0-9]+))?(?:/([a-z_]+))?(?:\?([
 rumdose = re.compile(r"\${um(?:([:.])([0-9]+))?\}")
 rdose = re.compile(r"\${?dose(?:([:.])([0-9]+))?\}")
 rwrong = re.compile(r"\${[^\}]*\}")
+# in the order they take precedence
+_placeholders = [
+    ("treatment", rtreatment),
+    ("id", rid),
+    ("bid", rbid),
+    ("cid", rcid),
+    ("inchikey", rinchikey),
+    ("chembl", rchembl),
+    ("chemspider", rchemspider),
+    ("name", rname),
+    ("tag", rtag),
+    ("dose", rdose),
+    ("um", rumdose),
+]
 
 
 class StringTreatmentNamer(TreatmentNamer):
@@ -120,6 +134,9 @@ class StringTreatmentNamer(TreatmentNamer):
         - ${um:3}             The dose in micromolar with a suffix of µM, with 3 (or other value passed) significant figures
         - ${um.3}             The dose in micromolar with a suffix of µM, with 3 (or other value passed) decimal places
 
+    The expression is parsed into literal text and placeholders once, when the namer is created.
+    Results are remembered per distinct Treatment and name, so each is only formatted once.
+
     The capitalizers are:
         - 'lower' for all lowercase
         - 'upper' for all uppercase
@@ -130,6 +147,8 @@ class StringTreatmentNamer(TreatmentNamer):
         - 'auto_title' for auto but title case
     """
 
+    max_cached = 100000
+
     def __init__(self, expression: str):
         """
         Builds using a formatting expression. See the docs for StringTreatmentDisplayer.
@@ -138,6 +157,8 @@ class StringTreatmentNamer(TreatmentNamer):
             expression: A formatting expression
         """
         self.expression = expression
+        self._tokens = self._compile(expression)
+        self._cache: Dict[Tup[Treatment, Optional[str]], str] = {}
         # it's just annoyingly easy to make this mistake
         n_dollar, n_left, n_right = (
             expression.count("$"),
@@ -169,9 +190,46 @@ class StringTreatmentNamer(TreatmentNamer):
 
         """
         name = self._convert(t, name)
-        return self._format(
-            str(t), t.bid, t.cid, t.btag, t.dose, name, t.inchikey, t.chembl, t.chemspider
-        )
+        key = t, name
+        value = self._cache.get(key)
+        if value is None:
+            value = self._format(
+                str(t), t.bid, t.cid, t.btag, t.dose, name, t.inchikey, t.chembl, t.chemspider
+            )
+            if len(self._cache) >= self.max_cached:
+                self._cache.clear()
+            self._cache[key] = value
+        return value
+
+    @classmethod
+    def _compile(cls, expression: str) -> Sequence[Union[str, Tup[str, Tup[Optional[str], ...]]]]:
+        """
+        Splits an expression into literal text and placeholders.
+        Where placeholders overlap, the one earlier in ``_placeholders`` wins.
+
+        Args:
+            expression: A formatting expression
+
+        Returns:
+            A list of literal strings and (placeholder kind, regex groups) tuples, in order
+
+        """
+        matches = []
+        for kind, reg in _placeholders:
+            for match in reg.finditer(expression):
+                start, end = match.span()
+                if not any(start < e and s < end for s, e, _, _ in matches):
+                    matches.append((start, end, kind, match.groups()))
+        tokens = []
+        i = 0
+        for start, end, kind, groups in sorted(matches):
+            if start > i:
+                tokens.append(expression[i:start])
+            tokens.append((kind, groups))
+            i = end
+        if i < len(expression):
+            tokens.append(expression[i:])
+        return tokens
 
     def _format(
         self,
@@ -203,48 +261,44 @@ class StringTreatmentNamer(TreatmentNamer):
 
         """
 
-        def inchikeyit(gs):
-            return self._fall(gs[0], cid, bid) if inchikey is None else inchikey
-
-        def chemblit(gs):
-            return self._fall(gs[0], cid, bid) if chembl is None else chembl
-
-        def chemspiderit(gs):
-            return self._fall(gs[0], cid, bid) if chemspider is None else chemspider
-
-        def nameit(gs):
-            return self._parse(cid, bid, name, gs[0], gs[1], gs[2], gs[3])
-
-        def tagit(gs):
-            return self._parse(cid, bid, tag, gs[0], gs[1], gs[2], gs[3])
-
-        def idit(gs):
-            return "b" + str(bid) if cid is None else ("c" + str(cid))
-
-        def get_dose_kwargs(gs) -> Tup[Optional[int], Optional[bool]]:
+        def dose_kwargs(gs) -> Tup[Optional[int], Optional[bool]]:
             use_sigfigs = gs[0] == ":"
             round_figs = None if gs[1] is None else int(gs[1])
             return use_sigfigs, round_figs
 
-        def doseit(gs):
-            return self._dosify(dose, True, *get_dose_kwargs(gs))
-
-        def rumit(gs):
-            return self._dosify(dose, False, *get_dose_kwargs(gs))
-
-        e = self.expression
-        e = self._replace(e, rtreatment, lambda g: t_str)
-        e = self._replace(e, rid, idit)
-        e = self._replace(e, rbid, lambda gs: bid)
-        e = self._replace(e, rcid, lambda gs: cid)
-        e = self._replace(e, rinchikey, inchikeyit)
-        e = self._replace(e, rchembl, chemblit)
-        e = self._replace(e, rchemspider, chemspiderit)
-        e = self._replace(e, rname, nameit)
-        e = self._replace(e, rtag, tagit)
-        e = self._replace(e, rdose, doseit)
-        e = self._replace(e, rumdose, rumit)
-        return e
+        def substitute(kind, gs):
+            if kind == "treatment":
+                return t_str
+            elif kind == "id":
+                return "b" + str(bid) if cid is None else ("c" + str(cid))
+            elif kind == "bid":
+                return bid
+            elif kind == "cid":
+                return cid
+            elif kind == "inchikey":
+                return self._fall(gs[0], cid, bid) if inchikey is None else inchikey
+            elif kind == "chembl":
+                return self._fall(gs[0], cid, bid) if chembl is None else chembl
+            elif kind == "chemspider":
+                return self._fall(gs[0], cid, bid) if chemspider is None else chemspider
+            elif kind == "name":
+                return self._parse(cid, bid, name, gs[0], gs[1], gs[2], gs[3])
+            elif kind == "tag":
+                return self._parse(cid, bid, tag, gs[0], gs[1], gs[2], gs[3])
+            elif kind == "dose":
+                return self._dosify(dose, True, *dose_kwargs(gs))
+            elif kind == "um":
+                return self._dosify(dose, False, *dose_kwargs(gs))
+            raise AssertionError(kind)
+
+        parts = []
+        for token in self._tokens:
+            if isinstance(token, str):
+                parts.append(token)
+            else:
+                value = substitute(*token)
+                parts.append("" if value is None else str(value))
+        return "".join(parts)
 
     def _dosify(self, dose, adjust, use_sigfigs, round_figs) -> Optional[str]:
         """
@@ -286,23 +340,6 @@ class StringTreatmentNamer(TreatmentNamer):
         elif fallback in ["id", "bid"]:
             return "b" + str(bid)
 
-    def _replace(self, e0, reg, rep) -> Optional[str]:
-        """
-
-
-        Args:
-            e0:
-            reg:
-            rep:
-
-        Returns:
-
-        """
-        for match in reg.finditer(e0):
-            rep1 = rep(match.groups())
-            e0 = e0.replace(match[0], "" if rep1 is None else str(rep1))
-        return e0
-
     def _parse(
         self,
         cid,
@@ -89,11 +89,12 @@ class BuiltWellNamer(WellNamer):
         Returns:
 
         """
-        names = ["" for _ in df.iterrows()]
-        for bit in self._bits:
-            names = [name + bt for name, bt in zip(names, bit(df))]
+        bits = [bit(df) for bit in self._bits]
+        names = ["".join(parts) for parts in zip(*bits)] if len(bits) > 0 else [""] * len(df)
         if self._modification is not None:
-            names = [self._modification(name) for name in names]
+            # many wells share a name, so only modify each distinct one once
+            modified = {name: self._modification(name) for name in set(names)}
+            names = [modified[name] for name in names]
         if any(("\t" in name for name in names)):
             raise RefusingRequestError("Name should not contain tabs")
         return [name.rstrip() for name in names]
@@ -440,13 +441,25 @@ class WellNamerBuilder(BuiltWellNamer):
         missing_col = ([""] * len(df)) if if_missing_col is None else df[if_missing_col]
         if len(x) < min_unique:
             return ["" for _ in df[col]]
-        else:
-            return [
-                (or_null if WellNamerBuilder._is_null(v) else str(formatter(v)))
-                if (m is None or WellNamerBuilder._is_null(m))
-                else ""
-                for v, m in Tools.zip_strict(df[col], missing_col)
-            ]
+        # a frame has many wells but few distinct values (such as Treatments), so format each value once
+        formatted = {}
+
+        def format_value(v):
+            # include the type so that equal values like 1 and 1.0 are formatted separately
+            key = type(v), v
+            try:
+                return formatted[key]
+            except KeyError:
+                value = or_null if WellNamerBuilder._is_null(v) else str(formatter(v))
+                formatted[key] = value
+                return value
+            except TypeError:  # unhashable
+                return or_null if WellNamerBuilder._is_null(v) else str(formatter(v))
+
+        return [
+            format_value(v) if (m is None or WellNamerBuilder._is_null(m)) else ""
+            for v, m in Tools.zip_strict(df[col], missing_col)
+        ]
 
 
 class WellNamers:
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pocketutils.core.exceptions import (
+    EmptyCollectionError,
+    LengthMismatchError,
+    RefusingRequestError,
+)
+
+from chemfish.ml.confusion_matrices import ConfusionMatrices, ConfusionMatrix
+
+
+def _matrix(arr: np.ndarray, labels) -> ConfusionMatrix:
+    return ConfusionMatrix(
+        pd.DataFrame(
+            arr, index=pd.Index(labels, name="class"), columns=pd.Index(labels, name="predicted")
+        )
+    )
+
+
+def _brute_off_diagonals(arr: np.ndarray) -> np.ndarray:
+    n = arr.shape[0]
+    return np.array([[arr[i, j] for j in range(n) if j != i] for i in range(n)])
+
+
+class TestConfusionMatrices:
+    def test_off_diagonals(self):
+        rng = np.random.default_rng(0)
+        arr = rng.random((5, 5))
+        np.testing.assert_array_equal(
+            ConfusionMatrices._off_diagonals(arr), _brute_off_diagonals(arr)
+        )
+
+    def test_off_diagonals_not_square(self):
+        with pytest.raises(LengthMismatchError):
+            ConfusionMatrices._off_diagonals(np.zeros((3, 4)))
+
+    def test_stacked_matches_single(self):
+        rng = np.random.default_rng(1)
+        arr = rng.random((4, 6, 6))
+        off = ConfusionMatrices._off_diagonals(arr)
+        means = ConfusionMatrices.off_diagonals_means(arr)
+        quantiles = ConfusionMatrices.off_diagonals_quantiles(arr, 0.25)
+        assert off.shape == (4, 6, 5)
+        assert means.shape == quantiles.shape == (4, 6)
+        for k in range(arr.shape[0]):
+            np.testing.assert_array_equal(off[k], ConfusionMatrices._off_diagonals(arr[k]))
+            np.testing.assert_allclose(means[k], ConfusionMatrices.off_diagonals_means(arr[k]))
+            np.testing.assert_allclose(
+                quantiles[k], ConfusionMatrices.off_diagonals_quantiles(arr[k], 0.25)
+            )
+
+    def test_off_diagonals_means_and_quantiles(self):
+        rng = np.random.default_rng(2)
+        arr = rng.random((5, 5))
+        brute = _brute_off_diagonals(arr)
+        np.testing.assert_allclose(
+            ConfusionMatrices.off_diagonals_means(arr), [np.mean(row) for row in brute]
+        )
+        for q in [0.0, 0.5, 0.9, 1.0]:
+            np.testing.assert_allclose(
+                ConfusionMatrices.off_diagonals_quantiles(arr, q),
+                [np.quantile(row, q) for row in brute],
+            )
+
+    def test_stack_reorders(self):
+        rng = np.random.default_rng(3)
+        labels = ["a", "b", "c", "d"]
+        arr = rng.random((4, 4))
+        first = _matrix(arr, labels)
+        order = [2, 0, 3, 1]
+        permuted = _matrix(arr[np.ix_(order, order)], [labels[i] for i in order])
+        stacked_labels, stacked = ConfusionMatrices.stack([first, permuted])
+        assert stacked_labels == labels
+        assert stacked.shape == (2, 4, 4)
+        assert stacked.dtype == np.float64
+        np.testing.assert_array_equal(stacked[0], arr)
+        np.testing.assert_array_equal(stacked[1], arr)
+
+    def test_stack_different_labels(self):
+        a = _matrix(np.eye(2), ["a", "b"])
+        b = _matrix(np.eye(2), ["a", "c"])
+        with pytest.raises(RefusingRequestError):
+            ConfusionMatrices.stack([a, b])
+        with pytest.raises(EmptyCollectionError):
+            ConfusionMatrices.stack([])
+
+    def test_agg_matrices_keeps_first(self):
+        rng = np.random.default_rng(4)
+        labels = ["x", "y", "z"]
+        arr1, arr2 = rng.random((3, 3)), rng.random((3, 3))
+        first = _matrix(arr1, labels)
+        order = [1, 2, 0]
+        second = _matrix(arr2[np.ix_(order, order)], [labels[i] for i in order])
+        agg = ConfusionMatrices.agg_matrices([first, second], np.max)
+        assert isinstance(agg, ConfusionMatrix)
+        assert agg.rows == labels
+        assert agg.cols == labels
+        assert agg.index.name == "class"
+        assert agg.columns.name == "predicted"
+        np.testing.assert_allclose(agg.values, np.maximum(arr1, arr2))
+        np.testing.assert_array_equal(first.values, arr1)
+        assert first.rows == labels
+        avg = ConfusionMatrices.average(iter([first, second]))
+        np.testing.assert_allclose(avg.values, (arr1 + arr2) / 2)
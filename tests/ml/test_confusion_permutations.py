@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+from chemfish.ml.confusion_matrices import ConfusionMatrix
+from chemfish.ml.confusion_permutations import ConfusionPermutationTest
+
+_labels = ["a", "b", "c", "d", "e"]
+_blocks = {"a": "x", "b": "x", "c": "y", "d": "y", "e": "y"}
+
+
+def _matrix(seed: int = 0) -> ConfusionMatrix:
+    rng = np.random.default_rng(seed)
+    arr = rng.random((len(_labels), len(_labels))) + 2 * np.eye(len(_labels))
+    return ConfusionMatrix(pd.DataFrame(arr, index=_labels, columns=_labels))
+
+
+def _permutations(n_permutations: int, chunk_size: int, seed: int, n_labels: int):
+    chunks = [
+        min(chunk_size, n_permutations - start) for start in range(0, n_permutations, chunk_size)
+    ]
+    for n, s in zip(chunks, np.random.SeedSequence(seed).spawn(len(chunks))):
+        yield from np.random.default_rng(s).random((n, n_labels)).argsort(axis=1)
+
+
+def _brute_statistic(arr: np.ndarray, perm, statistic: str, blocks) -> np.ndarray:
+    n = len(arr)
+    if statistic == "diagonal":
+        return np.array([arr[i, perm[i]] for i in range(n)])
+    if statistic == "accuracy":
+        return np.array([np.mean([arr[i, perm[i]] for i in range(n)])])
+    result = []
+    for i in range(n):
+        mates = [j for j in range(n) if j != i and blocks[_labels[j]] == blocks[_labels[i]]]
+        values = [arr[perm[i], perm[j]] for j in mates]
+        result.append(np.mean(values) if len(values) > 0 else np.nan)
+    return np.array(result)
+
+
+def _brute_test(matrix, statistic, n_permutations, chunk_size, seed, blocks=None):
+    arr = matrix.values
+    observed = _brute_statistic(arr, np.arange(len(arr)), statistic, blocks)
+    null = np.array(
+        [
+            _brute_statistic(arr, perm, statistic, blocks)
+            for perm in _permutations(n_permutations, chunk_size, seed, len(arr))
+        ]
+    )
+    p_value = (1 + (null >= observed).sum(axis=0)) / (1 + n_permutations)
+    return observed, null.mean(axis=0), null.std(axis=0, ddof=1), p_value
+
+
+class TestConfusionPermutationTest:
+    def test_matches_brute_force(self):
+        matrix = _matrix()
+        for statistic in ["diagonal", "accuracy", "blocks"]:
+            blocks = _blocks if statistic == "blocks" else None
+            test = ConfusionPermutationTest(statistic, n_permutations=50, chunk_size=7, seed=3)
+            result = test.test(matrix, blocks=blocks)
+            observed, null_mean, null_std, p_value = _brute_test(
+                matrix, statistic, 50, 7, 3, blocks
+            )
+            expected_labels = ["accuracy"] if statistic == "accuracy" else _labels
+            assert result["label"].tolist() == expected_labels
+            np.testing.assert_allclose(result["observed"].values, observed)
+            np.testing.assert_allclose(result["null_mean"].values, null_mean)
+            np.testing.assert_allclose(result["null_std"].values, null_std)
+            np.testing.assert_allclose(result["p_value"].values, p_value)
+
+    def test_n_jobs(self):
+        matrix = _matrix(1)
+        for statistic in ["diagonal", "accuracy", "blocks"]:
+            blocks = _blocks if statistic == "blocks" else None
+            results = [
+                ConfusionPermutationTest(
+                    statistic, n_permutations=200, chunk_size=30, n_jobs=n_jobs, seed=5
+                ).test(matrix, blocks=blocks)
+                for n_jobs in [1, 2]
+            ]
+            pd.testing.assert_frame_equal(pd.DataFrame(results[0]), pd.DataFrame(results[1]))
+
+    def test_label_alone_in_block(self):
+        matrix = _matrix(2)
+        blocks = {"a": "x", "b": "x", "c": "y", "d": "y", "e": "z"}
+        test = ConfusionPermutationTest("blocks", n_permutations=20, chunk_size=6)
+        result = test.test(matrix, blocks=blocks).set_index("label")
+        assert result.loc["e"].isna().all()
+        assert not result.drop("e").isna().any().any()
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from chemfish.calc.feature_smoothing import FeatureSmoothing
+
+
+def _data(seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    arr = rng.normal(size=(7, 50))
+    arr[rng.random(arr.shape) < 0.15] = np.nan
+    # ragged traces: NaN padding at the end, as for wells with fewer frames
+    arr[1, 30:] = np.nan
+    arr[4, 45:] = np.nan
+    # a run of NaNs longer than the window
+    arr[2, 10:20] = np.nan
+    return arr
+
+
+def _pandas(arr: np.ndarray, window_size: int, window_type=None) -> np.ndarray:
+    rolling = pd.DataFrame(arr).rolling(window_size, axis=1, min_periods=1, win_type=window_type)
+    return rolling.mean().values
+
+
+class TestFeatureSmoothing:
+    @pytest.mark.parametrize("window_size", [1, 2, 5, 12, 60])
+    @pytest.mark.parametrize("window_type", [None, "triang", "hamming"])
+    def test_matches_pandas(self, window_size: int, window_type):
+        arr = _data()
+        expected = _pandas(arr, window_size, window_type)
+        actual = FeatureSmoothing.rolling_mean(arr, window_size, window_type)
+        np.testing.assert_allclose(actual, expected, rtol=1e-10, atol=1e-12)
+
+    @pytest.mark.parametrize("chunk_size", [1, 3, 7, 49, 100])
+    def test_chunks(self, chunk_size: int):
+        arr = _data(1)
+        expected = FeatureSmoothing.rolling_mean(arr, 6, "triang")
+        actual = FeatureSmoothing.rolling_mean(arr, 6, "triang", chunk_size=chunk_size)
+        np.testing.assert_allclose(actual, expected, rtol=1e-12)
+        np.testing.assert_allclose(actual, _pandas(arr, 6, "triang"), rtol=1e-10, atol=1e-12)
+
+    def test_float32(self):
+        arr = _data(2).astype(np.float32)
+        actual = FeatureSmoothing.rolling_mean(arr, 4)
+        assert actual.dtype == np.float64
+        np.testing.assert_allclose(actual, _pandas(arr, 4), rtol=1e-5)
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from chemfish.calc.grouped_reductions import GroupedReductions
+
+
+def _data(seed: int = 0):
+    rng = np.random.default_rng(seed)
+    # ragged groups in shuffled order, including a missing key and a group of one row
+    keys = np.array(["b"] * 5 + ["a"] * 2 + [None] * 3 + ["c"] + ["d"] * 9, dtype=object)
+    keys = keys[rng.permutation(len(keys))]
+    arr = rng.normal(size=(len(keys), 6))
+    arr[rng.random(arr.shape) < 0.2] = np.nan
+    # a column that is all NaN for one group
+    arr[keys == "a", 2] = np.nan
+    return keys, arr
+
+
+def _reduce(keys, arr, function: str, **kwargs) -> np.ndarray:
+    codes, _ = pd.factorize(keys)
+    groups, firsts = GroupedReductions.factorize([codes])
+    assert list(pd.unique(keys)) == list(keys[firsts])
+    return GroupedReductions.reduce(arr, groups, len(firsts), function, **kwargs)
+
+
+def _pandas(keys, arr, function: str, **kwargs) -> pd.DataFrame:
+    grouped = pd.DataFrame(arr).groupby(pd.Series(keys), sort=False, dropna=False)
+    return grouped.agg(function, **kwargs)
+
+
+class TestGroupedReductions:
+    @pytest.mark.parametrize(
+        "function", ["mean", "sum", "std", "var", "sem", "min", "max", "median"]
+    )
+    def test_matches_pandas(self, function: str):
+        keys, arr = _data()
+        expected = _pandas(keys, arr, function)
+        actual = _reduce(keys, arr, function)
+        assert actual.dtype == expected.values.dtype
+        np.testing.assert_allclose(actual, expected.values, rtol=1e-10, atol=1e-12)
+
+    @pytest.mark.parametrize("ddof", [0, 2])
+    def test_ddof(self, ddof: int):
+        keys, arr = _data(1)
+        for function in ["std", "var", "sem"]:
+            expected = _pandas(keys, arr, function, ddof=ddof)
+            np.testing.assert_allclose(
+                _reduce(keys, arr, function, ddof=ddof), expected.values, rtol=1e-10, atol=1e-12
+            )
+
+    @pytest.mark.parametrize("q", [0.0, 0.25, 0.8, 1.0])
+    def test_quantile(self, q: float):
+        keys, arr = _data(2)
+        expected = pd.DataFrame(arr).groupby(pd.Series(keys), sort=False, dropna=False).quantile(q)
+        np.testing.assert_allclose(_reduce(keys, arr, "quantile", q=q), expected.values)
+
+    def test_float32(self):
+        keys, arr = _data(3)
+        arr = arr.astype(np.float32)
+        for function in ["mean", "sum", "min", "max", "std"]:
+            expected = _pandas(keys, arr, function)
+            actual = _reduce(keys, arr, function)
+            assert actual.dtype == expected.values.dtype
+            np.testing.assert_allclose(actual, expected.values, rtol=1e-5, atol=1e-6)
+
+    def test_multiple_keys(self):
+        rng = np.random.default_rng(4)
+        a = rng.integers(0, 3, 40)
+        b = rng.integers(0, 2, 40)
+        arr = rng.random((40, 3))
+        groups, firsts = GroupedReductions.factorize([a, b])
+        expected = pd.DataFrame(arr).groupby([a, b], sort=False).mean()
+        actual = GroupedReductions.reduce(arr, groups, len(firsts), "mean")
+        assert [(a[i], b[i]) for i in firsts] == expected.index.tolist()
+        np.testing.assert_allclose(actual, expected.values)
+
+    def test_supports(self):
+        assert GroupedReductions.supports("mean", {})
+        assert GroupedReductions.supports("std", {"ddof": 0})
+        assert GroupedReductions.supports("quantile", {"q": 0.8})
+        assert not GroupedReductions.supports("quantile", {"q": [0.1, 0.9]})
+        assert not GroupedReductions.supports("mean", {"numeric_only": True})
+        assert not GroupedReductions.supports(np.mean, {})
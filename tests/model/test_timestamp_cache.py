@@ -0,0 +1,49 @@
+from collections import Counter
+from types import SimpleNamespace
+
+import numpy as np
+
+from chemfish.factories.caches import ASensorCache
+from chemfish.factories.well_frame_builders import TimestampCache
+from chemfish.model.sensor_names import SensorNames
+
+
+class _CountingSensorCache(ASensorCache):
+    def __init__(self):
+        self.loads = Counter()
+
+    def load(self, key):
+        name, run = key
+        self.loads[(run.id, name)] += 1
+        offset = 0 if name is SensorNames.CAMERA_MILLIS else 1000
+        return SimpleNamespace(data=np.arange(10) + offset + 100 * run.id)
+
+
+class TestTimestampCache:
+    def test_fetches_once_per_run_and_sensor(self):
+        sensor_cache = _CountingSensorCache()
+        cache = TimestampCache(sensor_cache=sensor_cache)
+        runs = [SimpleNamespace(id=1), SimpleNamespace(id=2)]
+        for _ in range(96):
+            for run in runs:
+                camera = cache.camera_millis(run)
+                stimulus = cache.stimulus_millis(run)
+                np.testing.assert_array_equal(camera, np.arange(10) + 100 * run.id)
+                np.testing.assert_array_equal(stimulus, np.arange(10) + 1000 + 100 * run.id)
+        assert cache.n_fetched == 4
+        assert len(cache) == 4
+        assert dict(sensor_cache.loads) == {
+            (run.id, name): 1
+            for run in runs
+            for name in [SensorNames.CAMERA_MILLIS, SensorNames.STIMULUS_MILLIS]
+        }
+
+    def test_clear(self):
+        sensor_cache = _CountingSensorCache()
+        cache = TimestampCache(sensor_cache=sensor_cache)
+        run = SimpleNamespace(id=1)
+        cache.camera_millis(run)
+        cache.clear()
+        cache.camera_millis(run)
+        assert cache.n_fetched == 2
+        assert sensor_cache.loads[(1, SensorNames.CAMERA_MILLIS)] == 2